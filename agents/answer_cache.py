@@ -0,0 +1,228 @@
+"""
+Near-duplicate answer cache: trả lại câu trả lời đã tổng hợp cho câu hỏi gần giống.
+"""
+import logging
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from agents.router import normalize_query as strip_asker, strip_asker_prefix
+from agents.search_cache import normalize_query as strip_dates
+
+logger = logging.getLogger(__name__)
+
+_URL_RE = re.compile(r"https?://")
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+_WORD_RE = re.compile(r"\w+")
+# Câu hỏi tiếp nối ngữ cảnh ("còn anh ấy thì sao?"): câu trả lời đúng cho chat này, sai cho chat khác
+_ANAPHORA_RE = re.compile(
+    r"\b(?:anh|chị|cô|ông|bà|em|bạn|cậu|người|cái|điều|việc|chuyện|vụ|chỗ|thằng|con|đứa) (?:ấy|đó|này|kia|ta)\b"
+    r"|\b(?:nó|họ|hắn|bọn họ|chúng nó)\b"
+    r"|\bcòn\b.*\bthì sao\b"
+    r"|\b(?:thế còn|vậy còn|vừa rồi|vừa nói|lúc nãy|ở trên|như trên|tiếp đi|nói tiếp)\b"
+)
+
+# Câu hỏi về dữ liệu thay đổi liên tục → TTL ngắn
+REALTIME_KEYWORDS = ("giá", "tỷ giá", "tỉ giá", "thời tiết", "tỷ số", "tỉ số", "chứng khoán", "bitcoin", "btc", "live")
+# Tin tức, sự kiện trong ngày → TTL trung bình
+NEWS_KEYWORDS = ("tin tức", "mới nhất", "hôm nay", "hôm qua", "bây giờ", "hiện tại", "sự kiện", "tuần này")
+
+
+def normalize_question(text: str) -> str:
+    """Bỏ prefix người hỏi, ngày tháng, dấu câu; về chữ thường"""
+    return strip_dates(strip_asker(text))
+
+
+def is_context_dependent(question: str) -> bool:
+    """Câu hỏi có đại từ/tham chiếu tới hội thoại trước, không tự đứng được"""
+    return bool(_ANAPHORA_RE.search(question))
+
+
+def key_terms(text: str) -> frozenset[str]:
+    """Con số và tên riêng (từ viết hoa, trừ từ đầu câu): phải khớp tuyệt đối mới được dùng lại câu trả lời.
+
+    Cosine trên trigram gần như không phân biệt "năm 2020" với "năm 2024" hay "Mỹ" với "Úc".
+    """
+    text = strip_asker_prefix(text)
+    terms = set(_NUMBER_RE.findall(text))
+    for word in _WORD_RE.findall(text)[1:]:
+        if word[0].isupper():
+            terms.add(word.lower())
+    return frozenset(terms)
+
+
+def trigrams(text: str) -> Counter:
+    """Char trigram theo từng từ (có đệm khoảng trắng hai đầu)"""
+    grams = Counter()
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class _Entry:
+    __slots__ = ("question", "terms", "vector", "norm", "answer", "expires_at", "chat_id")
+
+    def __init__(self, question: str, terms: frozenset[str], vector: Counter, answer: str,
+                 expires_at: float, chat_id: Optional[str]):
+        self.question = question
+        self.terms = terms
+        self.vector = vector
+        self.norm = math.sqrt(sum(v * v for v in vector.values()))
+        self.answer = answer
+        self.expires_at = expires_at
+        self.chat_id = chat_id
+
+
+class AnswerCache:
+    """Index cosine trên char trigram + inverted index để chỉ so với ứng viên có chung trigram.
+
+    TTL phụ thuộc độ "nóng" của câu hỏi (giá cả < tin tức < kiến thức chung).
+    Chỉ nên lưu câu trả lời tự đứng được (search + tổng hợp), không lưu chit-chat
+    phụ thuộc ngữ cảnh hội thoại. Câu có đại từ tham chiếu bị bỏ qua, và ứng viên
+    phải có cùng con số, tên riêng với câu hỏi mới được tính độ giống.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        max_entries: int = 1000,
+        ttl_realtime: float = 600.0,
+        ttl_news: float = 3600.0,
+        ttl_default: float = 86400.0,
+        opt_out_chat_ids: frozenset[str] = frozenset(),
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_realtime = ttl_realtime
+        self.ttl_news = ttl_news
+        self.ttl_default = ttl_default
+        self.opt_out_chat_ids = opt_out_chat_ids
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._index: dict[str, set[int]] = {}
+        self._by_question: dict[str, int] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+        self._lookup_ms = 0.0
+
+    def enabled_for(self, chat_id: Optional[str]) -> bool:
+        return chat_id is None or str(chat_id) not in self.opt_out_chat_ids
+
+    def ttl_for(self, question: str) -> float:
+        if any(keyword in question for keyword in REALTIME_KEYWORDS):
+            return self.ttl_realtime
+        if any(keyword in question for keyword in NEWS_KEYWORDS):
+            return self.ttl_news
+        return self.ttl_default
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._by_question.pop(entry.question, None)
+        for gram in entry.vector:
+            ids = self._index.get(gram)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._index[gram]
+
+    def lookup(self, text: str, chat_id: Optional[str] = None) -> Optional[str]:
+        """Trả về câu trả lời đã lưu nếu có câu hỏi đủ giống, None nếu miss"""
+        if not self.enabled_for(chat_id) or _URL_RE.search(text):
+            self.skipped += 1
+            return None
+
+        question = normalize_question(text)
+        if is_context_dependent(question):
+            self.skipped += 1
+            return None
+
+        start = time.perf_counter()
+        terms = key_terms(text)
+        vector = trigrams(question)
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        now = time.monotonic()
+
+        # Ứng viên: entry có chung ít nhất một trigram
+        candidates = set()
+        for gram in vector:
+            candidates.update(self._index.get(gram, ()))
+
+        best_id, best_score = None, 0.0
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.expires_at <= now:
+                self._remove(entry_id)
+                continue
+            if entry.terms != terms:
+                continue
+            dot = sum(count * entry.vector.get(gram, 0) for gram, count in vector.items())
+            score = dot / (norm * entry.norm) if norm and entry.norm else 0.0
+            if score > best_score:
+                best_id, best_score = entry_id, score
+
+        self._lookup_ms += (time.perf_counter() - start) * 1000
+        if best_id is None or best_score < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry = self._entries[best_id]
+        self._entries.move_to_end(best_id)
+        logger.info(f"♻️ Answer cache hit ({best_score:.2f}): '{question}' ≈ '{entry.question}'")
+        return entry.answer
+
+    def store(self, text: str, answer: str, chat_id: Optional[str] = None) -> None:
+        if not answer or not self.enabled_for(chat_id) or _URL_RE.search(text):
+            return
+
+        question = normalize_question(text)
+        if not question or is_context_dependent(question):
+            return
+        # Cùng câu hỏi thì thay bằng câu trả lời mới hơn
+        if question in self._by_question:
+            self._remove(self._by_question[question])
+
+        entry_id = self._next_id
+        self._next_id += 1
+        entry = _Entry(question, key_terms(text), trigrams(question), answer, time.monotonic() + self.ttl_for(question), chat_id)
+        self._entries[entry_id] = entry
+        self._by_question[question] = entry_id
+        for gram in entry.vector:
+            self._index.setdefault(gram, set()).add(entry_id)
+        self.stores += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "skipped": self.skipped,
+            "avg_lookup_ms": round(self._lookup_ms / lookups, 3) if lookups else 0.0,
+        }
+
+
+def build_answer_cache(settings) -> Optional[AnswerCache]:
+    """Tạo answer cache theo config, None nếu tắt"""
+    if not settings.answer_cache_enabled:
+        return None
+    return AnswerCache(
+        threshold=settings.answer_cache_threshold,
+        max_entries=settings.answer_cache_max_entries,
+        ttl_realtime=settings.answer_cache_ttl_realtime_seconds,
+        ttl_news=settings.answer_cache_ttl_news_seconds,
+        ttl_default=settings.answer_cache_ttl_seconds,
+        opt_out_chat_ids=frozenset(str(chat_id) for chat_id in settings.answer_cache_opt_out_chat_ids),
+    )
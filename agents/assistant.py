@@ -0,0 +1,87 @@
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
+from agents.chatbot import chatbot_system_prompt, search_and_synthesize
+from agents.models import main_llm, search_tools, STREAM_TAG
+from agents.memory import State, history_window
+from agents.summary import summary_messages
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================
+# HANDOFF TOOL
+# ==========================
+@tool
+def transfer_to_video_agent(instructions: str) -> str:
+    """Chuyển yêu cầu cho video agent (tải video/audio, tách đoạn, lấy thông tin video).
+
+    Args:
+        instructions: Hướng dẫn cụ thể cho video agent, kèm link video nếu có
+    """
+    # Không bao giờ được thực thi, assistant_node chặn tool call này để chuyển node
+    return instructions
+
+
+assistant_llm = main_llm.bind_tools(search_tools + [transfer_to_video_agent])
+
+
+# ==========================
+# SINGLE-PASS NODE
+# ==========================
+async def assistant_node(state: State, config: RunnableConfig):
+    """Một lượt gọi LLM vừa route vừa trả lời: tự trả lời, gọi search hoặc chuyển cho video agent"""
+
+    user_messages = [m for m in state["messages"] if isinstance(m, HumanMessage)]
+    if not user_messages:
+        return {"messages": [AIMessage(content="Mày hỏi cc j vậy?")], "next_agent": "chatbot"}
+
+    user_query = user_messages[-1].content
+    logger.info(f"🧭 [ASSISTANT] Query: '{user_query}'")
+
+    system_prompt = chatbot_system_prompt(
+        extra_tools=(
+            f"- {transfer_to_video_agent.name}: Chuyển cho video agent khi user muốn tải video/audio, "
+            f"tách đoạn video hoặc hỏi thông tin một link video\n"
+        ),
+        extra_rules=(
+            f"**GỌI TOOL {transfer_to_video_agent.name}** khi:\n"
+            f"- User gửi link YouTube, Facebook, TikTok, Instagram, Reddit, X, Vimeo, Dailymotion và muốn xử lý nó\n"
+            f"- User muốn tải, cắt, tách audio từ video vừa nhắc tới\n\n"
+        ),
+    )
+
+    response = await assistant_llm.ainvoke(
+        [system_prompt] + summary_messages(state) + history_window(state["messages"]),
+        config={"tags": [STREAM_TAG]},
+    )
+
+    # ==========================
+    # CASE 1: Trả lời trực tiếp
+    # ==========================
+    if not response.tool_calls:
+        logger.info(f"💬 [ASSISTANT] → Trả lời trực tiếp")
+        return {"messages": [response], "next_agent": "chatbot"}
+
+    # ==========================
+    # CASE 2: Handoff sang video agent
+    # ==========================
+    # Không lưu AIMessage chứa tool call handoff vào state, tránh tool call treo không có ToolMessage
+    handoff = next((c for c in response.tool_calls if c["name"] == transfer_to_video_agent.name), None)
+    if handoff:
+        instructions = handoff["args"].get("instructions", "")
+        logger.info(f"➡️  [ASSISTANT] → video_agent: {instructions}")
+        return {"next_agent": "video_agent", "agent_instructions": instructions}
+
+    # ==========================
+    # CASE 3: Search + tổng hợp
+    # ==========================
+    result = await search_and_synthesize(response, user_query, config["configurable"]["thread_id"])
+    return {**result, "next_agent": "chatbot"}
+
+
+def route_after_assistant(state: State) -> str:
+    """Chỉ đi tiếp khi assistant đã handoff, còn lại kết thúc lượt"""
+    return "video_agent" if state.get("next_agent") == "video_agent" else "end"
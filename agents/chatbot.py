@@ -1,42 +1,37 @@
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import ToolNode
-from agents.models import main_llm, search_llm, search_tools
-from agents.memory import State
+from agents.models import main_llm, search_llm, search_tools, answer_cache, STREAM_TAG
+from agents.memory import State, history_window
+from agents.summary import summary_messages
+from agents.speculation import speculation
 from utils.data_extraction import extract_and_format_sources
+from config.config import get_settings
 
 import logging
 from datetime import datetime
 
 current_date = datetime.now().strftime("%d/%m/%Y")
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 
 # Bind tools
 chatbot_llm_with_tools = main_llm.bind_tools(search_tools)
+search_tool_node = ToolNode(tools=search_tools)
 
-async def chatbot_node(state: State):
-    """Version với tool calling tự động nhưng prompt chi tiết"""
-    
-    user_messages = [m for m in state["messages"] if isinstance(m, HumanMessage)]
-    if not user_messages:
-        return {"messages": [AIMessage(content="Mày hỏi cc j vậy?")]}
 
-    user_query = user_messages[-1].content
-    recent_messages = state["messages"]
-    
-    logger.info(f"🧭 [CHATBOT] Query: '{user_query}'")
-    
-    # ==========================
-    # System prompt CHI TIẾT
-    # ==========================
-    system_prompt = SystemMessage(
+def chatbot_system_prompt(extra_tools: str = "", extra_rules: str = "") -> SystemMessage:
+    """System prompt của chatbot, các topology khác gắn thêm tool/luật riêng"""
+    return SystemMessage(
         content=(
             f"Hôm nay là {current_date}. Mày là SuperCat, con mèo cam thông minh và cục súc, chửi thề liên tục. "
             f"Nên nhớ, mày là con mèo cam ghét Cộng Sản, kì thị LGBT, nữ quyền,... nói chung là mấy cái loz khuynh tả. "
             f"Bối cảnh là mày đang ở trong một nhóm Telegram có khoảng chục thành viên, nhiệm vụ của mày là trả lời câu hỏi của người dùng trong nhóm.\n\n"
             
             f"**CÁC TOOLS KHẢ DỤNG**:\n"
-            f"- {search_tools[0].name}: Tìm kiếm thông tin trên web (trả về tối đa 5 kết quả)\n\n"
+            f"- {search_tools[0].name}: Tìm kiếm thông tin trên web (trả về tối đa 5 kết quả)\n"
+            f"{extra_tools}\n"
             
             f"**HƯỚNG DẪN QUYẾT ĐỊNH**:\n\n"
             
@@ -59,6 +54,7 @@ async def chatbot_node(state: State):
             f"  • 'Giá vàng hôm nay' → {search_tools[0].name}(\"giá vàng {current_date}\")\n"
             f"  • 'Sự kiện gì xảy ra' → {search_tools[0].name}(\"sự kiện nổi bật {current_date}\")\n\n"
             
+            f"{extra_rules}"
             f"**PHONG CÁCH TRẢ LỜI**:\n"
             f"- Cục súc, chi tiết, có châm biếm và chửi thề\n"
             f"- Thể hiện thái độ ghét Cộng Sản, kì thị LGBT, nữ quyền\n"
@@ -67,11 +63,38 @@ async def chatbot_node(state: State):
             f"Ưu tiên TỰ TRẢ LỜI trừ khi thực sự cần search!"
         )
     )
+
+
+def chatbot_prompt(state: State) -> list:
+    """Input cho lượt gọi LLM đầu tiên của chatbot"""
+    return [chatbot_system_prompt()] + summary_messages(state) + history_window(state["messages"])
+
+
+async def chatbot_node(state: State, config: RunnableConfig):
+    """Version với tool calling tự động nhưng prompt chi tiết"""
+    
+    user_messages = [m for m in state["messages"] if isinstance(m, HumanMessage)]
+    if not user_messages:
+        return {"messages": [AIMessage(content="Mày hỏi cc j vậy?")]}
+
+    user_query = user_messages[-1].content
+    
+    logger.info(f"🧭 [CHATBOT] Query: '{user_query}'")
     
     # ==========================
     # LLM TỰ QUYẾT ĐỊNH gọi tool hay không
     # ==========================
-    response = await chatbot_llm_with_tools.ainvoke([system_prompt] + recent_messages)
+    # Orchestrator có thể đã chạy trước lượt gọi này song song với route
+    response = None
+    speculative = speculation.take(config["configurable"]["thread_id"])
+    if speculative is not None:
+        try:
+            response = await speculative
+            logger.info(f"⚡ [CHATBOT] Dùng kết quả speculative")
+        except Exception as e:
+            logger.warning(f"⚠️ [CHATBOT] Speculative call lỗi, gọi lại: {e}")
+    if response is None:
+        response = await chatbot_llm_with_tools.ainvoke(chatbot_prompt(state), config={"tags": [STREAM_TAG]})
     
     # ==========================
     # CASE 1: Không cần search → Trả lời trực tiếp
@@ -81,14 +104,18 @@ async def chatbot_node(state: State):
         return {"messages": [response]}  # Giữ nguyên AIMessage
     
     # ==========================
-    # CASE 2: Cần search → Execute tools
+    # CASE 2: Cần search → Execute tools + tổng hợp
     # ==========================
+    return await search_and_synthesize(response, user_query, config["configurable"]["thread_id"])
+
+
+async def search_and_synthesize(response: AIMessage, user_query: str, chat_id: str | None = None) -> dict:
+    """Chạy các search tool call trong response rồi tổng hợp câu trả lời có dẫn nguồn"""
     logger.info(f"🔍 [CHATBOT] → Executing {len(response.tool_calls)} tool(s)")
     
     # Execute tools
-    tool_node = ToolNode(tools=search_tools)
     tool_state = {"messages": [response]}
-    tool_result = await tool_node.ainvoke(tool_state)
+    tool_result = await search_tool_node.ainvoke(tool_state)
     
     tool_messages = [m for m in tool_result["messages"] if isinstance(m, ToolMessage)]
     
@@ -99,7 +126,13 @@ async def chatbot_node(state: State):
     # ==========================
     # Tổng hợp kết quả với prompt CHI TIẾT
     # ==========================
-    sources, sources_text = extract_and_format_sources(tool_messages)
+    # Xếp hạng passage theo cả câu hỏi gốc lẫn query mà LLM đã search
+    search_queries = [call["args"].get("query", "") for call in response.tool_calls]
+    sources, sources_text = extract_and_format_sources(
+        tool_messages,
+        query=" ".join([user_query] + search_queries),
+        token_budget=settings.source_token_budget,
+    )
     
     if not sources:
         return {"messages": [AIMessage(content="Không tìm thấy nguồn phù hợp. Loz gì vậy trời.")]}
@@ -135,8 +168,12 @@ async def chatbot_node(state: State):
     final_response = await search_llm.ainvoke([
         synthesis_prompt,
         HumanMessage(content=f"Tổng hợp thông tin về: {user_query}")
-    ])
+    ], config={"tags": [STREAM_TAG]})
     
     logger.info(f"✅ [CHATBOT] Done")
     
+    # Câu trả lời có nguồn tự đứng được, lưu lại cho câu hỏi gần giống sau này
+    if answer_cache is not None and isinstance(final_response.content, str):
+        answer_cache.store(user_query, final_response.content, chat_id)
+    
     return {"messages": [final_response]}
\ No newline at end of file
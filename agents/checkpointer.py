@@ -0,0 +1,742 @@
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+from utils.async_exec import run_blocking
+from utils.exceptions import ConfigurationError
+
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """InMemorySaver có giới hạn bộ nhớ.
+
+    - Mỗi thread chỉ giữ ``keep_last`` checkpoint mới nhất (kèm blobs/writes của chúng)
+    - Vượt quá ``max_threads`` hoặc ``max_bytes`` thì bỏ thread ít dùng nhất (LRU)
+    """
+
+    def __init__(
+        self,
+        keep_last: int = 4,
+        max_threads: Optional[int] = 500,
+        max_bytes: Optional[int] = None,
+        *,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.keep_last = max(1, keep_last)
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+
+        # thread_id -> None, theo thứ tự dùng gần nhất ở cuối
+        self._lru: OrderedDict[Any, None] = OrderedDict()
+        # (thread_id, ns, checkpoint_id) -> channel_versions mà checkpoint tham chiếu
+        self._versions: dict[tuple, dict] = {}
+        # (thread_id, ns) -> {(channel, version)} đang có trong self.blobs
+        self._blob_keys: dict[tuple, set] = {}
+        # thread_id -> số byte đã serialize
+        self._thread_bytes: dict[Any, int] = {}
+
+        # Metrics
+        self.pruned_checkpoints = 0
+        self.evicted_threads = 0
+
+    # ==========================
+    # WRITE PATH
+    # ==========================
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        self._versions[(thread_id, checkpoint_ns, checkpoint["id"])] = dict(checkpoint["channel_versions"])
+        self._blob_keys.setdefault((thread_id, checkpoint_ns), set()).update(new_versions.items())
+
+        self._prune(thread_id, checkpoint_ns)
+        self._touch(thread_id)
+        self._enforce_budget(keep=thread_id)
+        return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        super().put_writes(config, writes, task_id, task_path)
+        thread_id = config["configurable"]["thread_id"]
+        self._touch(thread_id)
+        self._enforce_budget(keep=thread_id)
+
+    def _prune(self, thread_id, checkpoint_ns: str) -> None:
+        """Bỏ checkpoint cũ hơn ``keep_last`` và các blob không còn được tham chiếu"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_last:
+            return
+
+        # checkpoint id là uuid6 nên sort theo chuỗi cũng là sort theo thời gian
+        checkpoint_ids = sorted(checkpoints)
+        for checkpoint_id in checkpoint_ids[:-self.keep_last]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._versions.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self.pruned_checkpoints += 1
+
+        referenced = set()
+        for checkpoint_id in checkpoint_ids[-self.keep_last:]:
+            referenced.update(self._versions.get((thread_id, checkpoint_ns, checkpoint_id), {}).items())
+
+        blob_keys = self._blob_keys.get((thread_id, checkpoint_ns), set())
+        for channel, version in blob_keys - referenced:
+            self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+        blob_keys &= referenced
+
+    # ==========================
+    # READ PATH
+    # ==========================
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        result = super().get_tuple(config)
+        if result is not None:
+            self._touch(config["configurable"]["thread_id"])
+        return result
+
+    # ==========================
+    # EVICTION
+    # ==========================
+    def _touch(self, thread_id) -> None:
+        self._lru[thread_id] = None
+        self._lru.move_to_end(thread_id)
+        self._thread_bytes[thread_id] = self._measure(thread_id)
+
+    def _measure(self, thread_id) -> int:
+        """Số byte serialize của một thread (checkpoint + metadata + blobs + writes)"""
+        size = 0
+        for checkpoint_ns, checkpoints in self.storage.get(thread_id, {}).items():
+            for checkpoint_id, (checkpoint, metadata, _) in checkpoints.items():
+                size += len(checkpoint[1]) + len(metadata[1])
+                for _, _, value, _ in self.writes.get((thread_id, checkpoint_ns, checkpoint_id), {}).values():
+                    size += len(value[1])
+            for channel, version in self._blob_keys.get((thread_id, checkpoint_ns), ()):
+                blob = self.blobs.get((thread_id, checkpoint_ns, channel, version))
+                if blob:
+                    size += len(blob[1])
+        return size
+
+    def _enforce_budget(self, keep) -> None:
+        while len(self._lru) > 1:
+            over_threads = self.max_threads is not None and len(self._lru) > self.max_threads
+            over_bytes = self.max_bytes is not None and self.resident_bytes() > self.max_bytes
+            if not (over_threads or over_bytes):
+                return
+
+            oldest = next(iter(self._lru))
+            if oldest == keep:
+                return
+            logger.info(f"🧹 Evicting checkpoint thread {oldest}")
+            self._evict_thread(oldest)
+            self.evicted_threads += 1
+
+    def _evict_thread(self, thread_id) -> None:
+        """Bỏ thread khỏi bộ nhớ (subclass có storage bền vững sẽ giữ lại bản trên đĩa)"""
+        self._drop_from_memory(thread_id)
+
+    def delete_thread(self, thread_id) -> None:
+        """Xóa toàn bộ checkpoint của thread"""
+        self._drop_from_memory(thread_id)
+
+    def _drop_from_memory(self, thread_id) -> None:
+        """Xóa thread bằng index riêng thay vì quét toàn bộ writes/blobs"""
+        namespaces = self.storage.pop(thread_id, {})
+        for checkpoint_ns, checkpoints in namespaces.items():
+            for checkpoint_id in checkpoints:
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+                self._versions.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            for channel, version in self._blob_keys.pop((thread_id, checkpoint_ns), ()):
+                self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+
+        self._lru.pop(thread_id, None)
+        self._thread_bytes.pop(thread_id, None)
+
+    def close(self) -> None:
+        """Không có gì để flush với storage trong bộ nhớ"""
+
+    # ==========================
+    # METRICS
+    # ==========================
+    def resident_bytes(self) -> int:
+        """Tổng số byte checkpoint đang giữ trong bộ nhớ"""
+        return sum(self._thread_bytes.values())
+
+    def stats(self) -> dict:
+        return {
+            "threads": len(self._lru),
+            "resident_bytes": self.resident_bytes(),
+            "keep_last": self.keep_last,
+            "max_threads": self.max_threads,
+            "max_bytes": self.max_bytes,
+            "pruned_checkpoints": self.pruned_checkpoints,
+            "evicted_threads": self.evicted_threads,
+        }
+
+
+# ==========================
+# SQLITE CHECKPOINTER
+# ==========================
+DEFAULT_SQLITE_PATH = "data/supercat.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    channel_versions TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    task_path TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+) WITHOUT ROWID;
+"""
+
+# Payload msgpack lớn hơn ngưỡng này sẽ được nén zlib trước khi ghi
+_COMPRESS_MIN_BYTES = 512
+_CLOSE = object()
+
+
+def _pack(typed: tuple[str, bytes]) -> tuple[str, bytes]:
+    type_, data = typed
+    if len(data) >= _COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(data, 1)
+        if len(compressed) < len(data):
+            return f"{type_}+z", compressed
+    return type_, data
+
+
+def _unpack(type_: str, data: bytes) -> tuple[str, bytes]:
+    if type_.endswith("+z"):
+        return type_[:-2], zlib.decompress(data)
+    return type_, data
+
+
+def sqlite_path_from_url(database_url: Optional[str]) -> str:
+    """Lấy đường dẫn file SQLite từ ``DATABASE_URL`` (mặc định: data/supercat.db)"""
+    if not database_url:
+        return DEFAULT_SQLITE_PATH
+    if database_url.startswith("sqlite:///"):
+        return database_url[len("sqlite:///"):]
+    if "://" in database_url:
+        scheme = database_url.split("://", 1)[0]
+        raise ConfigurationError(f"DATABASE_URL scheme '{scheme}' không được hỗ trợ cho checkpointer, dùng sqlite:///path")
+    return database_url
+
+
+# (checkpoint_ns, checkpoint rows, blob rows, write rows) đọc từ SQLite cho một thread
+_LoadedThread = list[tuple[str, list, list, list]]
+
+
+class SqliteCheckpointSaver(BoundedMemorySaver):
+    """Checkpointer bền vững trên SQLite (WAL), có bộ nhớ đệm phía trước.
+
+    - Mọi đọc/ghi của graph đi qua ``BoundedMemorySaver`` nên mỗi step gần như không tốn thêm gì
+    - Thread nền gom các bản ghi mới thành batch và ghi trong một transaction
+    - Thread bị evict khỏi bộ nhớ (hoặc sau khi restart) được nạp lại từ SQLite ở lần đọc đầu tiên
+    - Định kỳ bỏ checkpoint cũ hơn ``keep_last`` trên đĩa và checkpoint WAL
+    """
+
+    def __init__(
+        self,
+        path: str,
+        keep_last: int = 4,
+        max_threads: Optional[int] = 500,
+        max_bytes: Optional[int] = None,
+        *,
+        flush_interval: float = 0.05,
+        batch_size: int = 512,
+        compact_interval: float = 300.0,
+        serde=None,
+    ):
+        super().__init__(keep_last, max_threads, max_bytes, serde=serde)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_interval = compact_interval
+
+        # Connection đọc (event loop hoặc executor, có lock), writer thread có connection riêng
+        self._reader = self._connect()
+        self._reader.executescript(_SCHEMA)
+        self._reader_lock = threading.Lock()
+        self._loading: dict[Any, asyncio.Task] = {}
+
+        self._queue: queue.Queue = queue.Queue()
+        self._pending: Counter = Counter()
+        self._pending_lock = threading.Lock()
+        self._hydrated: set = set()
+        self._dirty: set[str] = set()
+
+        # Metrics
+        self.flushed_batches = 0
+        self.flushed_rows = 0
+        self.last_batch_ms = 0.0
+        self.hydrated_threads = 0
+        self.compactions = 0
+        self.pruned_rows = 0
+
+        self._writer = threading.Thread(target=self._writer_loop, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+        logger.info(f"💾 SQLite checkpointer: {self.path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    # ==========================
+    # WRITE PATH (event loop)
+    # ==========================
+    # Thread bị evict giữa lượt chạy phải được nạp lại trước khi ghi tiếp: checkpoint
+    # mới chỉ mang blob của channel vừa đổi, blob của các channel khác nằm trên đĩa
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        await self._aensure_loaded(config["configurable"]["thread_id"])
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await self._aensure_loaded(config["configurable"]["thread_id"])
+        self.put_writes(config, writes, task_id, task_path)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        self._ensure_loaded(config["configurable"]["thread_id"])
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+
+        # Lấy lại bản đã serialize trong bộ nhớ, không serialize lần hai
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        saved_checkpoint, saved_metadata, parent_id = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+        blobs = [
+            (channel, version, blob)
+            for channel, version in new_versions.items()
+            if (blob := self.blobs.get((thread_id, checkpoint_ns, channel, version)))
+        ]
+        self._enqueue(thread_id, ("checkpoint", (
+            checkpoint_ns,
+            checkpoint["id"],
+            parent_id,
+            saved_checkpoint,
+            saved_metadata,
+            self._versions[(thread_id, checkpoint_ns, checkpoint["id"])],
+            blobs,
+        )))
+        return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self._ensure_loaded(config["configurable"]["thread_id"])
+        super().put_writes(config, writes, task_id, task_path)
+
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        stored = self.writes.get((thread_id, checkpoint_ns, checkpoint_id), {})
+        rows = [
+            (idx, channel, value, path)
+            for (write_task_id, idx), (_, channel, value, path) in stored.items()
+            if write_task_id == task_id
+        ]
+        self._enqueue(thread_id, ("writes", (checkpoint_ns, checkpoint_id, task_id, rows)))
+
+    def delete_thread(self, thread_id) -> None:
+        super().delete_thread(thread_id)
+        self._hydrated.discard(thread_id)
+        self._enqueue(thread_id, ("delete", None))
+
+    def _enqueue(self, thread_id, op: tuple) -> None:
+        key = str(thread_id)
+        with self._pending_lock:
+            self._pending[key] += 1
+        self._queue.put((key, op))
+
+    # ==========================
+    # READ PATH
+    # ==========================
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self._ensure_loaded(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs):
+        if config:
+            self._ensure_loaded(config["configurable"]["thread_id"])
+        return super().list(config, **kwargs)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        # Graph chạy async: đọc SQLite trong executor, không block event loop
+        await self._aensure_loaded(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs) -> AsyncIterator[CheckpointTuple]:
+        if config:
+            await self._aensure_loaded(config["configurable"]["thread_id"])
+        for item in super().list(config, **kwargs):
+            yield item
+
+    def _needs_load(self, thread_id) -> bool:
+        return thread_id not in self._lru and thread_id not in self._hydrated
+
+    def _ensure_loaded(self, thread_id) -> None:
+        if not self._needs_load(thread_id):
+            return
+        self._hydrated.add(thread_id)
+        self._hydrate(thread_id, self._read_thread(thread_id))
+
+    async def _aensure_loaded(self, thread_id) -> None:
+        if not self._needs_load(thread_id):
+            return
+        # Nhiều lượt đọc cùng thread dùng chung một lần nạp
+        task = self._loading.get(thread_id)
+        if task is None:
+            task = self._loading[thread_id] = asyncio.create_task(self._aload(thread_id))
+            task.add_done_callback(lambda _: self._loading.pop(thread_id, None))
+        await asyncio.shield(task)
+
+    async def _aload(self, thread_id) -> None:
+        loaded = await run_blocking(self._read_thread, thread_id)
+        # Ghi vào bộ nhớ trên event loop, cùng chỗ với put/get
+        if self._needs_load(thread_id):
+            self._hydrated.add(thread_id)
+            self._hydrate(thread_id, loaded)
+
+    def _evict_thread(self, thread_id) -> None:
+        super()._evict_thread(thread_id)
+        self._hydrated.discard(thread_id)
+
+    def _read_thread(self, thread_id) -> _LoadedThread:
+        """Đọc ``keep_last`` checkpoint mới nhất của thread kèm blobs/writes từ SQLite (blocking).
+
+        Trả về rỗng nếu thread không có checkpoint trên đĩa.
+        """
+        key = str(thread_id)
+        self._wait_for_pending(key)
+
+        with self._reader_lock:
+            rows = self._reader.execute(
+                "SELECT checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata, channel_versions "
+                "FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_ns, checkpoint_id DESC",
+                (key,),
+            ).fetchall()
+
+            kept: dict[str, list] = {}
+            for row in rows:
+                per_ns = kept.setdefault(row[0], [])
+                if len(per_ns) < self.keep_last:
+                    per_ns.append(row)
+
+            loaded = []
+            for checkpoint_ns, checkpoint_rows in kept.items():
+                blob_rows = self._reader.execute(
+                    "SELECT channel, version, type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (key, checkpoint_ns),
+                ).fetchall()
+                write_rows = self._reader.execute(
+                    "SELECT checkpoint_id, task_id, idx, channel, type, value, task_path FROM writes "
+                    "WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (key, checkpoint_ns),
+                ).fetchall()
+                loaded.append((checkpoint_ns, checkpoint_rows, blob_rows, write_rows))
+        return loaded
+
+    def _hydrate(self, thread_id, loaded: _LoadedThread) -> None:
+        """Đưa các checkpoint đã đọc từ SQLite vào bộ nhớ"""
+        if not loaded:
+            return
+
+        for checkpoint_ns, checkpoint_rows, blob_rows, write_rows in loaded:
+            referenced: dict[tuple[str, str], Any] = {}
+            for _, checkpoint_id, parent_id, type_, data, metadata_type, metadata, versions_json in checkpoint_rows:
+                versions = json.loads(versions_json)
+                self.storage[thread_id][checkpoint_ns][checkpoint_id] = (
+                    _unpack(type_, data),
+                    _unpack(metadata_type, metadata),
+                    parent_id,
+                )
+                self._versions[(thread_id, checkpoint_ns, checkpoint_id)] = versions
+                for channel, version in versions.items():
+                    referenced[(channel, str(version))] = version
+
+            blob_keys = self._blob_keys.setdefault((thread_id, checkpoint_ns), set())
+            for channel, version, type_, value in blob_rows:
+                if (channel, version) in referenced:
+                    original_version = referenced[(channel, version)]
+                    self.blobs[(thread_id, checkpoint_ns, channel, original_version)] = _unpack(type_, value)
+                    blob_keys.add((channel, original_version))
+
+            checkpoint_ids = {row[1] for row in checkpoint_rows}
+            for checkpoint_id, task_id, idx, channel, type_, value, task_path in write_rows:
+                if checkpoint_id in checkpoint_ids:
+                    self.writes[(thread_id, checkpoint_ns, checkpoint_id)][(task_id, idx)] = (
+                        task_id, channel, _unpack(type_, value), task_path,
+                    )
+
+        self.hydrated_threads += 1
+        self._touch(thread_id)
+        self._enforce_budget(keep=thread_id)
+        logger.info(f"💾 Loaded checkpoint thread {thread_id} from SQLite")
+
+    def _wait_for_pending(self, key: str, timeout: float = 5.0) -> None:
+        """Chờ writer flush các bản ghi đang đợi của thread trước khi đọc từ đĩa"""
+        with self._pending_lock:
+            pending = self._pending.get(key, 0)
+        if pending:
+            event = threading.Event()
+            self._queue.put(event)
+            event.wait(timeout)
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Chờ mọi bản ghi đang đợi được ghi xuống đĩa"""
+        event = threading.Event()
+        self._queue.put(event)
+        event.wait(timeout)
+
+    def close(self) -> None:
+        """Flush và dừng writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(_CLOSE)
+            self._writer.join(timeout=10)
+        with self._reader_lock:
+            self._reader.close()
+
+    # ==========================
+    # WRITER THREAD
+    # ==========================
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        next_compaction = time.monotonic() + self.compact_interval
+        stop = False
+
+        while not stop:
+            batch, waiters = [], []
+            try:
+                item = self._queue.get(timeout=max(0.0, next_compaction - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            # Ngủ hết cửa sổ flush_interval rồi gom một lần mọi thứ trong queue:
+            # writer chỉ thức dậy một lần mỗi batch nên ít tranh GIL với event loop
+            if item is not None and item is not _CLOSE and not isinstance(item, threading.Event):
+                time.sleep(self.flush_interval)
+
+            while item is not None:
+                if item is _CLOSE:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write_batch(conn, batch)
+                except Exception as e:
+                    logger.error(f"❌ Checkpoint batch write failed: {e}", exc_info=True)
+                finally:
+                    with self._pending_lock:
+                        for key, _ in batch:
+                            self._pending[key] -= 1
+                            if self._pending[key] <= 0:
+                                del self._pending[key]
+            for event in waiters:
+                event.set()
+
+            if time.monotonic() >= next_compaction:
+                try:
+                    self._compact(conn)
+                except Exception as e:
+                    logger.error(f"❌ Checkpoint compaction failed: {e}", exc_info=True)
+                next_compaction = time.monotonic() + self.compact_interval
+
+        conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: list) -> None:
+        start = time.perf_counter()
+        checkpoints, blobs, writes = [], [], []
+
+        def flush_rows():
+            conn.executemany("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", checkpoints)
+            conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+            conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", writes)
+            self.flushed_rows += len(checkpoints) + len(blobs) + len(writes)
+            checkpoints.clear()
+            blobs.clear()
+            writes.clear()
+
+        with conn:
+            for key, (kind, payload) in batch:
+                if kind == "checkpoint":
+                    checkpoint_ns, checkpoint_id, parent_id, checkpoint, metadata, versions, new_blobs = payload
+                    checkpoints.append((
+                        key, checkpoint_ns, checkpoint_id, parent_id,
+                        *_pack(checkpoint), *_pack(metadata), json.dumps(versions),
+                    ))
+                    blobs.extend(
+                        (key, checkpoint_ns, channel, str(version), *_pack(blob))
+                        for channel, version, blob in new_blobs
+                    )
+                elif kind == "writes":
+                    checkpoint_ns, checkpoint_id, task_id, rows = payload
+                    writes.extend(
+                        (key, checkpoint_ns, checkpoint_id, task_id, idx, channel, *_pack(value), path)
+                        for idx, channel, value, path in rows
+                    )
+                elif kind == "delete":
+                    # Giữ đúng thứ tự: ghi các bản trước đó rồi mới xóa
+                    flush_rows()
+                    for table in ("checkpoints", "blobs", "writes"):
+                        conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (key,))
+                self._dirty.add(key)
+            flush_rows()
+
+        self.flushed_batches += 1
+        self.last_batch_ms = (time.perf_counter() - start) * 1000
+
+    def _compact(self, conn: sqlite3.Connection) -> None:
+        """Bỏ checkpoint cũ trên đĩa cho các thread vừa được ghi, rồi checkpoint WAL"""
+        dirty, self._dirty = self._dirty, set()
+        pruned = 0
+
+        with conn:
+            for key in dirty:
+                rows = conn.execute(
+                    "SELECT checkpoint_ns, checkpoint_id, channel_versions FROM checkpoints "
+                    "WHERE thread_id = ? ORDER BY checkpoint_ns, checkpoint_id DESC",
+                    (key,),
+                ).fetchall()
+
+                per_ns: dict[str, list] = {}
+                for checkpoint_ns, checkpoint_id, versions_json in rows:
+                    per_ns.setdefault(checkpoint_ns, []).append((checkpoint_id, versions_json))
+
+                for checkpoint_ns, entries in per_ns.items():
+                    stale = [(key, checkpoint_ns, checkpoint_id) for checkpoint_id, _ in entries[self.keep_last:]]
+                    if not stale:
+                        continue
+                    conn.executemany("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", stale)
+                    conn.executemany("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", stale)
+                    pruned += len(stale)
+
+                    referenced = set()
+                    for _, versions_json in entries[:self.keep_last]:
+                        referenced.update((channel, str(version)) for channel, version in json.loads(versions_json).items())
+                    orphans = [
+                        (key, checkpoint_ns, channel, version)
+                        for channel, version in conn.execute(
+                            "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                            (key, checkpoint_ns),
+                        )
+                        if (channel, version) not in referenced
+                    ]
+                    conn.executemany("DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?", orphans)
+                    pruned += len(orphans)
+
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA incremental_vacuum")
+        self.compactions += 1
+        self.pruned_rows += pruned
+        if pruned:
+            logger.info(f"🧹 Checkpoint compaction: pruned {pruned} row(s) from {len(dirty)} thread(s)")
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "backend": "sqlite",
+            "path": str(self.path),
+            "queued": self._queue.qsize(),
+            "flushed_batches": self.flushed_batches,
+            "flushed_rows": self.flushed_rows,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+            "hydrated_threads": self.hydrated_threads,
+            "compactions": self.compactions,
+            "pruned_rows": self.pruned_rows,
+        }
+
+
+def build_checkpointer(settings) -> BoundedMemorySaver:
+    """Tạo checkpointer theo ``CHECKPOINT_BACKEND``"""
+    kwargs = dict(
+        keep_last=settings.checkpoint_keep_last,
+        max_threads=settings.checkpoint_max_threads,
+        max_bytes=int(settings.checkpoint_max_mb * 1024 * 1024),
+    )
+    if settings.checkpoint_backend == "sqlite":
+        return SqliteCheckpointSaver(sqlite_path_from_url(settings.database_url), **kwargs)
+    return BoundedMemorySaver(**kwargs)
@@ -1,14 +1,128 @@
-from langchain_core.messages import BaseMessage
+from langchain_core.messages import BaseMessage, AIMessage, RemoveMessage, ToolMessage
 from typing import Annotated
 from typing_extensions import TypedDict
+from collections import OrderedDict
+from uuid import uuid4
+from config.config import get_settings
+from utils.tokens import estimate_message_tokens
+
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# message id -> số token ước lượng, mỗi message chỉ đếm một lần
+_TOKEN_CACHE_SIZE = 10_000
+_token_cache: OrderedDict[str, int] = OrderedDict()
+
+
+def message_tokens(message: BaseMessage) -> int:
+    """Số token ước lượng của message, có cache theo message id"""
+    if message.id in _token_cache:
+        _token_cache.move_to_end(message.id)
+        return _token_cache[message.id]
+
+    tokens = estimate_message_tokens(message)
+    if message.id:
+        _token_cache[message.id] = tokens
+        if len(_token_cache) > _TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return tokens
+
+
+def group_turns(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+    """Gom AIMessage có tool_calls với các ToolMessage trả lời nó thành một nhóm không tách rời"""
+    groups: list[list[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, ToolMessage) and groups and (
+            isinstance(groups[-1][0], AIMessage) and groups[-1][0].tool_calls
+        ):
+            groups[-1].append(message)
+        else:
+            groups.append([message])
+    return groups
+
+
+# Khi có tóm tắt, reducer chỉ cắt khi lịch sử vượt ngân sách bao nhiêu lần này
+# (tóm tắt lỗi liên tục): bình thường chỉ bước tóm tắt mới được bỏ message
+UNSUMMARIZED_HARD_CAP = 4
+
+
+def _recent_groups(groups: list[list[BaseMessage]], token_budget: int, max_messages: int) -> list[list[BaseMessage]]:
+    """Các nhóm gần nhất (thứ tự từ mới tới cũ) vừa ngân sách, luôn giữ ít nhất nhóm cuối cùng"""
+    kept: list[list[BaseMessage]] = []
+    kept_tokens = 0
+    kept_count = 0
+    for group in reversed(groups):
+        group_tokens = sum(message_tokens(m) for m in group)
+        over_budget = kept_tokens + group_tokens > token_budget
+        over_count = kept_count + len(group) > max_messages
+        if kept and (over_budget or over_count):
+            break
+        kept.append(group)
+        kept_tokens += group_tokens
+        kept_count += len(group)
+
+    # ToolMessage mồ côi ở đầu lịch sử sẽ làm Gemini báo lỗi
+    while len(kept) > 1 and isinstance(kept[-1][0], ToolMessage):
+        kept.pop()
+    return kept
+
+
+def history_window(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """Phần lịch sử đưa vào prompt: các message gần nhất trong ngân sách token và số message.
+
+    Chỉ cắt bản nhìn cho prompt, state vẫn giữ các message chưa được tóm tắt.
+    """
+    groups = group_turns(messages)
+    kept = _recent_groups(groups, settings.history_token_budget, settings.history_max_messages)
+    if len(kept) == len(groups):
+        return messages
+    return [m for group in reversed(kept) for m in group]
+
 
 def limit_messages(existing: list[BaseMessage], new: list[BaseMessage]) -> list[BaseMessage]:
-    """Giữ tối đa N messages gần nhất"""
-    MAX_MESSAGES = 15
-    combined = existing + new
-    return combined[-MAX_MESSAGES:]
+    """Giữ các messages gần nhất trong ngân sách token và số message tối đa.
+
+    Bật tóm tắt thì message cũ chỉ được bỏ khi đã gộp vào tóm tắt (RemoveMessage),
+    reducer chỉ cắt khi vượt ``UNSUMMARIZED_HARD_CAP`` lần ngân sách.
+    """
+    if not new:
+        return existing
+
+    # RemoveMessage dùng để bỏ các message đã được gộp vào tóm tắt
+    remove_ids = {m.id for m in new if isinstance(m, RemoveMessage)}
+    if remove_ids:
+        existing = [m for m in existing if m.id not in remove_ids]
+        new = [m for m in new if not isinstance(m, RemoveMessage)]
+
+    for message in new:
+        if message.id is None:
+            message.id = str(uuid4())
+
+    groups = group_turns(existing + new)
+    cap = UNSUMMARIZED_HARD_CAP if settings.summary_enabled else 1
+    kept = _recent_groups(groups, settings.history_token_budget * cap, settings.history_max_messages * cap)
+
+    if len(kept) == len(groups):
+        return [m for group in groups for m in group]
+
+    dropped = groups[:len(groups) - len(kept)]
+    dropped_tokens = sum(message_tokens(m) for group in dropped for m in group)
+    kept_tokens = sum(message_tokens(m) for group in kept for m in group)
+    message = (
+        f"✂️ Trimmed {sum(len(g) for g in dropped)} message(s), "
+        f"saved ~{dropped_tokens} tokens (kept ~{kept_tokens})"
+    )
+    if settings.summary_enabled:
+        logger.warning(f"{message} chưa được tóm tắt")
+    else:
+        logger.info(message)
+    return [m for group in reversed(kept) for m in group]
+
     
 class State(TypedDict):
     messages: Annotated[list[BaseMessage], limit_messages]
     next_agent: str
-    agent_instructions: str
\ No newline at end of file
+    agent_instructions: str
+    summary: str
@@ -1,9 +1,13 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_tavily import TavilySearch
+from agents.search_cache import CachedTavilySearch, build_search_cache
+from agents.answer_cache import build_answer_cache
 from config.config import get_settings
 
 settings = get_settings()
 
+# Tag cho các lượt gọi LLM mà token được stream thẳng tới user
+STREAM_TAG = "stream_to_user"
+
 main_llm = ChatGoogleGenerativeAI(
     model="gemini-2.5-flash",
     api_key=settings.gemini_api_key.get_secret_value(),
@@ -16,6 +20,10 @@ search_llm = ChatGoogleGenerativeAI(
     temperature=0.2,
 )
 
-search_tool = TavilySearch(max_results=5)
+# Query trùng trong TTL (kể cả khác ngày do prompt chèn) dùng lại kết quả, search đang chạy thì chờ chung
+search_tool = CachedTavilySearch(max_results=5, cache=build_search_cache(settings))
 search_tools = [search_tool]
-search_llm_with_tools = search_llm.bind_tools(search_tools)
\ No newline at end of file
+search_llm_with_tools = search_llm.bind_tools(search_tools)
+
+# Câu trả lời đã tổng hợp từ search, dùng lại cho câu hỏi gần giống ở mọi chat
+answer_cache = build_answer_cache(settings)
\ No newline at end of file
@@ -1,18 +1,28 @@
 from pydantic import BaseModel, Field
-from typing import Literal, TypedDict, Annotated
+from typing import Callable, Literal, Optional, TypedDict, Annotated
 from operator import add
 
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, SystemMessage, RemoveMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import InMemorySaver
-from agents.chatbot import chatbot_node
+from agents.checkpointer import build_checkpointer
+from agents.chatbot import chatbot_node, chatbot_prompt, chatbot_llm_with_tools
+from agents.assistant import assistant_node, route_after_assistant
 from agents.video_agent import video_agent_node
-from agents.memory import State
-from agents.models import main_llm
+from agents.memory import State, history_window
+from agents.summary import summary_messages, select_messages_to_fold, fold_into_summary
+from agents.router import TieredRouter, RouteDecision
+from agents.speculation import speculation
+from agents.models import main_llm, answer_cache, STREAM_TAG
+from config.config import get_settings
+from utils.tokens import content_text, estimate_message_tokens
 
+import asyncio
 import logging
+from weakref import WeakValueDictionary
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 # ==========================
 # AGENT MAPPING
@@ -31,24 +41,21 @@ class RouteSchema(BaseModel):
         description="Hướng dẫn cụ thể cho agent tiếp theo"
     )
 
-memory = InMemorySaver()
+# Giữ vài checkpoint gần nhất mỗi chat, bỏ chat ít dùng khi vượt ngân sách
+# (backend sqlite giữ lại bản trên đĩa để sống sót qua redeploy)
+memory = build_checkpointer(settings)
 main_llm_with_routing = main_llm.with_structured_output(RouteSchema)
+# Rules và classifier local quyết phần lớn tin nhắn, LLM chỉ dùng khi không chắc
+router = TieredRouter(
+    classifier_threshold=settings.router_classifier_threshold,
+    local_enabled=settings.router_local_enabled,
+)
 
 # ==========================
 # ORCHESTRATOR NODE
 # ==========================
-async def orchestrator_node(state: State):
-    """Nhạc trưởng điều phối"""
-    
-    messages = state["messages"]
-    
-    # Kiểm tra xem có agent nào vừa trả lời không
-    last_message = messages[-1] if messages else None
-    has_agent_response = (
-        isinstance(last_message, AIMessage) and 
-        len(messages) > 1  # Có cả user message
-    )
-    
+async def llm_route(state: State) -> RouteDecision:
+    """Route bằng LLM structured output, tầng cuối của router"""
     system_prompt = SystemMessage(
         content=(
             f"Bạn là supervisor điều phối team agents.\n\n"
@@ -61,15 +68,46 @@ async def orchestrator_node(state: State):
             f"- instructions: hướng dẫn cụ thể cho agent"
         )
     )
+
+    response = await main_llm_with_routing.ainvoke([system_prompt] + summary_messages(state) + history_window(state["messages"]))
+    return RouteDecision(response.next, response.instructions, "llm", 1.0)
+
+
+async def speculative_llm_route(state: State, thread_id: str) -> RouteDecision:
+    """Route bằng LLM, đồng thời chạy trước lượt gọi đầu của chatbot (phần lớn traffic về chatbot)"""
+    prompt = chatbot_prompt(state)
+    speculation.start(
+        thread_id,
+        lambda: chatbot_llm_with_tools.ainvoke(prompt),
+        prompt_tokens=sum(estimate_message_tokens(m) for m in prompt),
+    )
+    try:
+        decision = await llm_route(state)
+    except BaseException:
+        speculation.discard(thread_id)
+        raise
+    if decision.next != "chatbot":
+        speculation.discard(thread_id)
+    return decision
+
+
+async def orchestrator_node(state: State, config: RunnableConfig):
+    """Nhạc trưởng điều phối"""
     
-    response = await main_llm_with_routing.ainvoke([system_prompt] + messages)
+    # Rules/classifier local quyết gần như tức thì nên chỉ speculate khi phải hỏi LLM
+    if settings.speculative_chatbot:
+        thread_id = config["configurable"]["thread_id"]
+        fallback = lambda: speculative_llm_route(state, thread_id)
+    else:
+        fallback = lambda: llm_route(state)
+    decision = await router.route(state["messages"], fallback)
     
-    logger.info(f"🎯 Orchestrator decision: {response.next}")
-    logger.info(f"📝 Instructions: {response.instructions}")
+    logger.info(f"🎯 Orchestrator decision: {decision.next} (tier={decision.tier}, confidence={decision.confidence:.2f})")
+    logger.info(f"📝 Instructions: {decision.instructions}")
     
     return {
-        "next_agent": response.next,
-        "agent_instructions": response.instructions
+        "next_agent": decision.next,
+        "agent_instructions": decision.instructions
     }
 
 
@@ -86,53 +124,113 @@ def route_to_agent(state: State) -> str:
 # ==========================
 # GRAPH SETUP
 # ==========================
-graph_builder = StateGraph(State)
-
-# Add orchestrator
-graph_builder.add_node("orchestrator", orchestrator_node)
-
-# Add agents và edge quay về orchestrator
-for agent_name, node_func in agent_nodes.items():
-    graph_builder.add_node(agent_name, node_func)
-    # graph_builder.add_edge(agent_name, "orchestrator")
-
-# Entry point
-graph_builder.set_entry_point("orchestrator")
-
-# Conditional routing từ orchestrator
-graph_builder.add_conditional_edges(
-    "orchestrator",
-    route_to_agent,
-    {
-        "chatbot": "chatbot",
-        "video_agent": "video_agent",
-    }
-)
+def build_graph(topology: str = "orchestrated"):
+    """Build graph theo topology.
+
+    - orchestrated: orchestrator route (rules/classifier/LLM) → chatbot | video_agent
+    - single_pass: assistant vừa route vừa trả lời trong cùng một lượt LLM,
+      chỉ sang video_agent khi gọi tool handoff
+    """
+    graph_builder = StateGraph(State)
+
+    if topology == "single_pass":
+        graph_builder.add_node("assistant", assistant_node)
+        graph_builder.add_node("video_agent", video_agent_node)
+        graph_builder.set_entry_point("assistant")
+        graph_builder.add_conditional_edges(
+            "assistant",
+            route_after_assistant,
+            {
+                "video_agent": "video_agent",
+                "end": END,
+            }
+        )
+        return graph_builder.compile(checkpointer=memory)
+
+    # Add orchestrator
+    graph_builder.add_node("orchestrator", orchestrator_node)
+
+    # Add agents và edge quay về orchestrator
+    for agent_name, node_func in agent_nodes.items():
+        graph_builder.add_node(agent_name, node_func)
+        # graph_builder.add_edge(agent_name, "orchestrator")
+
+    # Entry point
+    graph_builder.set_entry_point("orchestrator")
+
+    # Conditional routing từ orchestrator
+    graph_builder.add_conditional_edges(
+        "orchestrator",
+        route_to_agent,
+        {
+            "chatbot": "chatbot",
+            "video_agent": "video_agent",
+        }
+    )
 
-# Compile với memory
-graph = graph_builder.compile(checkpointer=memory)
+    # Compile với memory
+    return graph_builder.compile(checkpointer=memory)
+
+
+graph = build_graph(settings.graph_topology)
+logger.info(f"🕸️ Graph topology: {settings.graph_topology}")
+# Node ghi câu trả lời cuối cùng, dùng khi chèn câu trả lời từ answer cache vào state
+answer_node = "assistant" if settings.graph_topology == "single_pass" else "chatbot"
 
 
 # ==========================
 # ORCHESTRATION AGENT
 # ==========================
+# Khóa theo thread để cập nhật tóm tắt nền không đè lên lượt chat đang chạy
+_thread_locks: WeakValueDictionary[str, asyncio.Lock] = WeakValueDictionary()
+# Thread đang được tóm tắt, tránh gọi LLM tóm tắt trùng
+_summarizing: set[str] = set()
+
+
+def _thread_lock(thread_id: str) -> asyncio.Lock:
+    lock = _thread_locks.get(thread_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _thread_locks[thread_id] = lock
+    return lock
+
+
 class OrchestratorAgent:
     """Main orchestrator agent để interact với graph"""
 
     def __init__(self, thread_id: str):
         self.graph = graph
-        self.config = {"configurable": {"thread_id": thread_id}}
+        # LangGraph ép thread_id về str ở get_state/update_state, nên dùng str ngay từ đầu
+        self.config = {"configurable": {"thread_id": str(thread_id)}}
+        self.lock = _thread_lock(str(thread_id))
 
-    async def generate_answer(self, message: str) -> str:
-        """Generate answer từ user message"""
+    async def generate_answer(self, message: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Generate answer từ user message.
+
+        Nếu có ``on_token``, gọi nó với phần text đã sinh mỗi khi có token mới.
+        """
         try:
-            # Initial state
-            initial_state = {
-                "messages": [HumanMessage(content=message)]
-            }
-            
-            # Invoke graph
-            result = await self.graph.ainvoke(initial_state, self.config)
+            # Câu hỏi gần giống đã có câu trả lời: không gọi Gemini/Tavily
+            cached = await self.cached_answer(message)
+            if cached is not None:
+                return cached
+
+            if on_token is None:
+                # Initial state
+                initial_state = {
+                    "messages": [HumanMessage(content=message)]
+                }
+                
+                # Invoke graph
+                async with self.lock:
+                    result = await self.graph.ainvoke(initial_state, self.config)
+            else:
+                result = {}
+                async for kind, payload in self.stream_answer(message):
+                    if kind == "token":
+                        on_token(payload)
+                    else:
+                        result = payload
             
             # Extract final response
             messages = result.get("messages", [])
@@ -150,17 +248,86 @@ class OrchestratorAgent:
             logger.error(f"❌ Lỗi orchestrator: {e}", exc_info=True)
             return f"❌ Đã xảy ra lỗi: {str(e)}"
     
+    async def cached_answer(self, message: str) -> Optional[str]:
+        """Tra answer cache, nếu hit thì ghi cặp hỏi/đáp vào lịch sử chat như một lượt bình thường"""
+        if answer_cache is None:
+            return None
+        answer = answer_cache.lookup(message, self.config["configurable"]["thread_id"])
+        if answer is None:
+            return None
+
+        async with self.lock:
+            await self.graph.aupdate_state(self.config, {
+                "messages": [HumanMessage(content=message), AIMessage(content=answer)],
+                "next_agent": "chatbot",
+            }, as_node=answer_node)
+        return answer
+
     async def stream_answer(self, message: str):
-        """Stream answer với progress updates"""
-        try:
-            initial_state = {
-                "messages": [HumanMessage(content=message)]
-            }
-            
-            async for event in self.graph.astream(initial_state, self.config):
-                logger.info(f"📦 Event: {event}")
-                yield event
+        """Stream token của các lượt LLM gắn STREAM_TAG.
+
+        Yield ``("token", text_đã_sinh)`` trong lúc chạy và ``("result", state)`` ở cuối.
+        Tool call và lượt gọi speculative không được stream.
+        """
+        initial_state = {
+            "messages": [HumanMessage(content=message)]
+        }
+        result = {}
+        stream_id, text = None, ""
+        
+        async with self.lock:
+            async for mode, payload in self.graph.astream(
+                initial_state, self.config, stream_mode=["messages", "values"]
+            ):
+                if mode == "values":
+                    result = payload
+                    continue
                 
+                chunk, metadata = payload
+                if not isinstance(chunk, AIMessageChunk) or STREAM_TAG not in metadata.get("tags", ()):
+                    continue
+                delta = content_text(chunk.content)
+                if not delta:
+                    continue
+                # Lượt LLM mới (vd: synthesis sau search) thay thế text đang hiển thị
+                if chunk.id != stream_id:
+                    stream_id, text = chunk.id, ""
+                text += delta
+                yield "token", text
+        
+        yield "result", result
+    
+    async def refresh_summary(self) -> None:
+        """Gộp các lượt cũ vào tóm tắt, chạy nền sau khi đã trả lời user"""
+        thread_id = self.config["configurable"]["thread_id"]
+        if not settings.summary_enabled or thread_id in _summarizing:
+            return
+
+        _summarizing.add(thread_id)
+        try:
+            state = await self.graph.aget_state(self.config)
+            to_fold = select_messages_to_fold(state.values.get("messages", []))
+            if not to_fold:
+                return
+
+            # Gọi LLM ngoài lock, lượt chat mới vẫn chạy được trong lúc chờ
+            summary = await fold_into_summary(state.values.get("summary", ""), to_fold)
+            if not summary:
+                return
+
+            async with self.lock:
+                current = await self.graph.aget_state(self.config)
+                if current.values.get("summary", "") != state.values.get("summary", ""):
+                    # Đã có lần tóm tắt khác chen vào, bỏ kết quả này
+                    return
+                current_ids = {m.id for m in current.values.get("messages", [])}
+                await self.graph.aupdate_state(self.config, {
+                    "messages": [RemoveMessage(id=m.id) for m in to_fold if m.id in current_ids],
+                    "summary": summary,
+                })
+
+            logger.info(f"📝 Folded {len(to_fold)} message(s) into summary ({len(summary)} chars)")
         except Exception as e:
-            logger.error(f"❌ Lỗi stream: {e}", exc_info=True)
-            yield {"error": str(e)}
\ No newline at end of file
+            logger.error(f"❌ Lỗi cập nhật tóm tắt: {e}", exc_info=True)
+        finally:
+            _summarizing.discard(thread_id)
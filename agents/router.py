@@ -0,0 +1,230 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Awaitable, Callable, Literal
+from collections import Counter
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from utils.tokens import content_text
+from utils.yt_downloader import MultiPlatformExtractor
+
+import logging
+import math
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+AgentName = Literal["chatbot", "video_agent"]
+
+_URL_RE = re.compile(r"https?://\S+")
+# Prefix do BotHandlers.text_message thêm vào trước câu hỏi
+_ASKER_PREFIX_RE = re.compile(r"^Đây là câu hỏi của [^:]*:\s*")
+_WORD_RE = re.compile(r"\w+")
+
+VIDEO_KEYWORDS = (
+    "tải video", "tải clip", "tải nhạc", "tải audio", "tải mp3", "tải mp4", "download",
+    "cắt video", "cắt đoạn", "cắt clip", "tách đoạn", "tách audio", "lấy audio", "lấy nhạc",
+    "mp3", "mp4", "thông tin video",
+)
+
+# ==========================
+# SEED DATA CHO CLASSIFIER
+# ==========================
+_SEED_EXAMPLES: dict[str, list[str]] = {
+    "video_agent": [
+        "tải video này về cho tao",
+        "download cái clip youtube kia",
+        "tải audio bài hát đó",
+        "lấy file mp3 của video vừa rồi",
+        "cắt đoạn từ phút 1:30 đến 2:45",
+        "tách đoạn video từ 90 giây đến 165 giây",
+        "video đó dài bao nhiêu phút",
+        "cho xin thông tin video kia",
+        "tải lại bản mp4 chất lượng cao",
+        "lấy nhạc nền của clip tiktok",
+        "cắt giúp tao đoạn đầu video",
+        "video này của kênh nào, bao nhiêu view",
+        "tải clip facebook kia về",
+        "lấy audio từ phút thứ 3",
+        "tách riêng tiếng của video",
+    ],
+    "chatbot": [
+        "giá vàng hôm nay bao nhiêu",
+        "tin tức mới nhất về bầu cử mỹ",
+        "mày nghĩ sao về chuyện này",
+        "chào mèo cam",
+        "cảm ơn nhé",
+        "thời tiết hà nội hôm nay thế nào",
+        "giải thích lạm phát là gì",
+        "ai là tổng thống mỹ hiện tại",
+        "kể chuyện cười đi",
+        "tỷ giá đô la hôm nay",
+        "tại sao bitcoin giảm giá",
+        "tìm kiếm thông tin về ưng hoàng phúc",
+        "mày là ai",
+        "có sự kiện gì nổi bật hôm nay",
+        "viết giúp tao bài thơ về con mèo",
+        # Nhắc tới video nhưng không nhờ làm gì với video
+        "video này hay đấy",
+        "clip đó buồn cười vãi",
+        "xem video chưa",
+        "video kia nhạt quá",
+        "mày thích xem clip gì",
+    ],
+}
+
+
+def strip_asker_prefix(text: str) -> str:
+    """Bỏ phần "Đây là câu hỏi của ...:", giữ nguyên hoa/thường (URL, tên riêng)"""
+    return _ASKER_PREFIX_RE.sub("", text).strip()
+
+
+def normalize_query(text: str) -> str:
+    return strip_asker_prefix(text).lower()
+
+
+def _features(text: str) -> list[str]:
+    words = _WORD_RE.findall(text)
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesRouter:
+    """Multinomial Naive Bayes trên unigram + bigram, train từ seed examples khi import"""
+
+    def __init__(self, examples: dict[str, list[str]], alpha: float = 1.0, min_features: int = 2):
+        self.alpha = alpha
+        # Câu có quá ít từ đã biết thì posterior không đáng tin, để LLM quyết
+        self.min_features = min_features
+        self.labels = list(examples)
+        total_docs = sum(len(docs) for docs in examples.values())
+        self.log_priors = {label: math.log(len(docs) / total_docs) for label, docs in examples.items()}
+        self.counts = {label: Counter(f for doc in docs for f in _features(doc)) for label, docs in examples.items()}
+        self.totals = {label: sum(counts.values()) for label, counts in self.counts.items()}
+        self.vocab_size = len(set().union(*self.counts.values()))
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """Trả về (label, xác suất posterior)"""
+        features = [f for f in _features(text) if any(f in counts for counts in self.counts.values())]
+        if len(features) < self.min_features:
+            return max(self.log_priors, key=self.log_priors.get), 0.0
+
+        scores = {}
+        for label in self.labels:
+            denominator = self.totals[label] + self.alpha * self.vocab_size
+            scores[label] = self.log_priors[label] + sum(
+                math.log((self.counts[label][f] + self.alpha) / denominator) for f in features
+            )
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / norm
+
+
+@lru_cache()
+def _extractor() -> MultiPlatformExtractor:
+    return MultiPlatformExtractor()
+
+
+def _video_urls(text: str) -> list[str]:
+    """URL video của nền tảng được hỗ trợ trong text"""
+    return [url for url in _URL_RE.findall(text) if _extractor().detect_platform(url)]
+
+
+def _recent_video_url(messages: list[BaseMessage]) -> bool:
+    """Vài tin nhắn gần nhất có nhắc tới link video được hỗ trợ"""
+    return any(_video_urls(content_text(message.content)) for message in reversed(messages[-6:]))
+
+
+# ==========================
+# TIERED ROUTER
+# ==========================
+@dataclass
+class RouteDecision:
+    next: AgentName
+    instructions: str
+    tier: str
+    confidence: float
+
+
+class _TierStats:
+    __slots__ = ("hits", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.hits = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float) -> None:
+        self.hits += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+
+class TieredRouter:
+    """Router 3 tầng: rules → classifier local → LLM (chỉ khi không đủ tự tin)"""
+
+    def __init__(self, classifier_threshold: float = 0.85, local_enabled: bool = True):
+        self.classifier_threshold = classifier_threshold
+        self.local_enabled = local_enabled
+        self.classifier = NaiveBayesRouter(_SEED_EXAMPLES)
+        self._stats = {tier: _TierStats() for tier in ("rules", "classifier", "llm")}
+
+    def route_by_rules(self, text: str, messages: list[BaseMessage]) -> RouteDecision | None:
+        """Tầng 1: URL video được hỗ trợ, hoặc từ khóa tải/cắt khi đang nói về một link video.
+
+        URL lấy từ ``text`` gốc (ID video phân biệt hoa/thường), chỉ so từ khóa trên bản lowercase.
+        """
+        urls = _video_urls(text)
+        if urls:
+            return RouteDecision("video_agent", f"Xử lý video {urls[0]} theo yêu cầu: {text}", "rules", 1.0)
+
+        query = text.lower()
+        if any(keyword in query for keyword in VIDEO_KEYWORDS) and _recent_video_url(messages):
+            return RouteDecision("video_agent", f"Xử lý video vừa nhắc tới theo yêu cầu: {text}", "rules", 0.95)
+        return None
+
+    def route_by_classifier(self, text: str, messages: list[BaseMessage]) -> RouteDecision | None:
+        """Tầng 2: Naive Bayes local, chỉ quyết khi đủ tự tin.
+
+        video_agent không làm được gì khi không có link, nên label đó chỉ được nhận
+        khi hội thoại gần đây có URL video được hỗ trợ; không thì để LLM quyết.
+        """
+        label, confidence = self.classifier.predict(text.lower())
+        if confidence < self.classifier_threshold:
+            return None
+        if label == "video_agent" and not (_video_urls(text) or _recent_video_url(messages)):
+            return None
+        return RouteDecision(label, f"Trả lời yêu cầu của user: {text}", "classifier", confidence)
+
+    async def route(
+        self,
+        messages: list[BaseMessage],
+        llm_route: Callable[[], Awaitable[RouteDecision]],
+    ) -> RouteDecision:
+        user_messages = [m for m in messages if isinstance(m, HumanMessage)]
+        text = strip_asker_prefix(content_text(user_messages[-1].content)) if user_messages else ""
+
+        if self.local_enabled and text:
+            start = time.perf_counter()
+            decision = self.route_by_rules(text, messages)
+            if decision is None:
+                decision = self.route_by_classifier(text, messages)
+            if decision is not None:
+                self._stats[decision.tier].record((time.perf_counter() - start) * 1000)
+                return decision
+
+        start = time.perf_counter()
+        decision = await llm_route()
+        self._stats["llm"].record((time.perf_counter() - start) * 1000)
+        return decision
+
+    def stats(self) -> dict:
+        total = sum(s.hits for s in self._stats.values()) or 1
+        return {
+            tier: {
+                "hits": s.hits,
+                "hit_rate": round(s.hits / total, 3),
+                "avg_ms": round(s.total_ms / s.hits, 3) if s.hits else 0.0,
+                "max_ms": round(s.max_ms, 3),
+            }
+            for tier, s in self._stats.items()
+        }
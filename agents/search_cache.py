@@ -0,0 +1,237 @@
+"""
+TTL/LRU cache and in-flight coalescing for Tavily searches.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+from typing import Any, Optional, Protocol
+
+from langchain_tavily import TavilySearch
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# Ngày prompt chèn vào query là ngày lúc process khởi động (agents.chatbot.current_date)
+_PROMPT_DATE = date.today()
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4)
+def _injected_date_re(day: date) -> re.Pattern:
+    """Các cách viết của đúng một ngày: 17/10/2026, 17-10-2026, 2026-10-17, ngày 17 tháng 10 năm 2026"""
+    d, m, y = day.day, day.month, day.year
+    forms = {
+        f"{d:02d}/{m:02d}/{y}", f"{d}/{m}/{y}", f"{d:02d}-{m:02d}-{y}", f"{d}-{m}-{y}",
+        f"{y}-{m:02d}-{d:02d}", f"{d:02d}/{m:02d}", f"{d}/{m}",
+        f"ngày {d} tháng {m} năm {y}", f"ngày {d:02d} tháng {m:02d} năm {y}",
+        f"ngày {d} tháng {m}", f"ngày {d:02d} tháng {m:02d}",
+    }
+    # Dạng dài trước để "17/10/2026" không bị cắt còn "/2026"
+    alternatives = "|".join(re.escape(form) for form in sorted(forms, key=len, reverse=True))
+    return re.compile(rf"(?<![\w/-])(?:{alternatives})(?![\w/-])")
+
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hóa query để các câu hỏi giống nhau dùng chung cache.
+
+    Chỉ bỏ ngày hôm nay mà prompt tự chèn vào (TTL đã giới hạn độ cũ); mọi ngày
+    tháng, tỷ số, con số user gõ đều được giữ. Bỏ dấu câu, hoa/thường và khoảng trắng thừa.
+    """
+    text = query.lower()
+    for day in {_PROMPT_DATE, date.today()}:
+        text = _injected_date_re(day).sub(" ", text)
+    text = _PUNCT_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def cache_key(query: str, **params: Any) -> str:
+    options = {k: v for k, v in params.items() if v not in (None, False, [], "")}
+    return normalize_query(query) + "|" + json.dumps(options, sort_keys=True, default=str)
+
+
+# ==========================
+# BACKENDS
+# ==========================
+class SearchCacheBackend(Protocol):
+    async def get(self, key: str) -> Optional[dict]:
+        ...
+
+    async def set(self, key: str, value: dict) -> None:
+        ...
+
+
+class LocalSearchCache:
+    """Cache trong process: TTL + LRU theo số entry"""
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisSearchCache:
+    """Cache dùng chung giữa các process, value lưu dạng JSON với ``EX`` = TTL"""
+
+    def __init__(self, client, ttl: float = 600.0, prefix: str = "supercat:search:"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, value: dict) -> None:
+        await self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False, default=str), ex=self.ttl)
+
+
+class SearchCache:
+    """Cache 2 tầng: local trước, rồi backend dùng chung (nếu có).
+
+    Lỗi của backend dùng chung được bỏ qua, coi như miss.
+    """
+
+    def __init__(self, local: Optional[LocalSearchCache] = None, shared: Optional[SearchCacheBackend] = None):
+        self.local = local or LocalSearchCache()
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.shared_errors = 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = await self.local.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(key)
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning(f"⚠️ Shared search cache error: {e}")
+            if value is not None:
+                self.shared_hits += 1
+                await self.local.set(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict) -> None:
+        await self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, value)
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning(f"⚠️ Shared search cache error: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses + self.coalesced
+        served = self.hits + self.shared_hits + self.coalesced
+        return {
+            "backend": "redis" if self.shared is not None else "local",
+            "entries": len(self.local),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(served / lookups, 3) if lookups else 0.0,
+            "shared_errors": self.shared_errors,
+        }
+
+
+# ==========================
+# TOOL
+# ==========================
+class CachedTavilySearch(TavilySearch):
+    """``TavilySearch`` có cache và gộp các lượt search trùng đang chạy.
+
+    Giữ nguyên tên/schema của tool nên prompt và ToolNode không phải đổi gì.
+    Chỉ cache kết quả thành công; lỗi và "không có kết quả" luôn đi thẳng lên Tavily.
+    """
+
+    _cache: SearchCache = PrivateAttr(default_factory=SearchCache)
+    _inflight: dict = PrivateAttr(default_factory=dict)
+
+    def __init__(self, cache: Optional[SearchCache] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        if cache is not None:
+            self._cache = cache
+
+    async def _arun(self, query: str, run_manager=None, **kwargs: Any) -> dict:
+        key = cache_key(query, **kwargs)
+
+        # Đang có lượt search giống hệt chạy dở (chưa có trong cache) thì chờ chung
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._cache.coalesced += 1
+            logger.info(f"🔗 Coalesced search: '{query}'")
+            return await asyncio.shield(inflight)
+
+        cached = await self._cache.get(key)
+        if cached is not None:
+            logger.info(f"🗃️ Search cache hit: '{query}'")
+            return cached
+
+        # Lượt khác có thể đã bắt đầu trong lúc chờ backend dùng chung
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._cache.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        inflight = asyncio.ensure_future(super()._arun(query, run_manager=run_manager, **kwargs))
+        self._inflight[key] = inflight
+        try:
+            result = await asyncio.shield(inflight)
+        finally:
+            self._inflight.pop(key, None)
+
+        if isinstance(result, dict) and "error" not in result:
+            await self._cache.set(key, result)
+        return result
+
+    def cache_stats(self) -> dict:
+        return {**self._cache.stats(), "inflight": len(self._inflight)}
+
+
+def build_search_cache(settings) -> SearchCache:
+    """Tạo search cache theo config, dùng Redis nếu có ``redis_url``"""
+    from utils.redis_client import get_redis
+
+    local = LocalSearchCache(
+        ttl=settings.search_cache_ttl_seconds,
+        max_entries=settings.search_cache_max_entries,
+    )
+    client = get_redis()
+    shared = RedisSearchCache(client, ttl=settings.search_cache_ttl_seconds) if client else None
+    return SearchCache(local, shared)
@@ -0,0 +1,92 @@
+"""
+Chạy trước lượt gọi đầu tiên của chatbot trong lúc LLM đang route.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from langchain_core.messages import AIMessage
+
+logger = logging.getLogger(__name__)
+
+
+class _Speculation:
+    __slots__ = ("task", "prompt_tokens", "started_at", "finished_at")
+
+    def __init__(self, task: asyncio.Task, prompt_tokens: int):
+        self.task = task
+        self.prompt_tokens = prompt_tokens
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        task.add_done_callback(self._finished)
+
+    def _finished(self, _task: asyncio.Task) -> None:
+        self.finished_at = time.perf_counter()
+
+
+class SpeculativeRegistry:
+    """Giữ task speculative theo thread_id cho tới khi route xong.
+
+    - Route ra chatbot → ``take`` lấy task để chatbot dùng lại (hit)
+    - Route ra agent khác hoặc route lỗi → ``discard`` hủy task (miss), cộng
+      số token đã phí vào thống kê
+    """
+
+    def __init__(self):
+        self._pending: dict[str, _Speculation] = {}
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted_prompt_tokens = 0
+        self.wasted_output_tokens = 0
+        self.saved_ms = 0.0
+
+    def start(self, thread_id: str, call: Callable[[], Awaitable[AIMessage]], prompt_tokens: int) -> None:
+        # Lượt trước bị bỏ dở (graph lỗi giữa chừng) thì hủy luôn
+        self.discard(thread_id)
+        self._pending[thread_id] = _Speculation(asyncio.create_task(call()), prompt_tokens)
+        self.started += 1
+
+    def take(self, thread_id: str) -> asyncio.Task | None:
+        """Commit kết quả speculative cho chatbot, None nếu không có"""
+        speculation = self._pending.pop(thread_id, None)
+        if speculation is None:
+            return None
+        self.hits += 1
+        # Phần LLM đã chạy song song với route là phần tiết kiệm được
+        overlap_end = speculation.finished_at or time.perf_counter()
+        self.saved_ms += (overlap_end - speculation.started_at) * 1000
+        return speculation.task
+
+    def discard(self, thread_id: str) -> None:
+        """Route không ra chatbot: hủy task và tính token bị phí"""
+        speculation = self._pending.pop(thread_id, None)
+        if speculation is None:
+            return
+        self.misses += 1
+        # Prompt đã gửi đi thì coi như đã tốn, output chỉ tính khi đã có kết quả
+        self.wasted_prompt_tokens += speculation.prompt_tokens
+        task = speculation.task
+        if task.done() and not task.cancelled() and task.exception() is None:
+            usage = getattr(task.result(), "usage_metadata", None) or {}
+            self.wasted_output_tokens += usage.get("output_tokens", 0)
+        else:
+            task.cancel()
+        logger.info(f"🗑️ Discarded speculative chatbot call for thread {thread_id}")
+
+    def stats(self) -> dict:
+        decided = self.hits + self.misses
+        return {
+            "pending": len(self._pending),
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / decided, 3) if decided else 0.0,
+            "wasted_prompt_tokens": self.wasted_prompt_tokens,
+            "wasted_output_tokens": self.wasted_output_tokens,
+            "avg_saved_ms": round(self.saved_ms / self.hits, 1) if self.hits else 0.0,
+        }
+
+
+speculation = SpeculativeRegistry()
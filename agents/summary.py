@@ -0,0 +1,68 @@
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from agents.memory import State, group_turns, message_tokens
+from agents.models import search_llm
+from config.config import get_settings
+from utils.tokens import content_text
+
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def summary_messages(state: State) -> list[SystemMessage]:
+    """System message chứa tóm tắt hội thoại trước đó (nếu có) để ghép vào prompt"""
+    summary = state.get("summary")
+    if not summary:
+        return []
+    return [SystemMessage(content=f"**Tóm tắt cuộc trò chuyện trước đó**:\n{summary}")]
+
+
+def select_messages_to_fold(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """Chọn các message cũ nhất cần gộp vào tóm tắt, giữ lại ``summary_keep_recent`` message gần nhất.
+
+    Chạy khi đủ ``summary_trigger_messages`` message hoặc lịch sử vượt ngân sách token
+    (prompt đã bắt đầu bỏ bớt message cũ), để không lượt nào bị mất mà chưa được tóm tắt.
+    """
+    over_budget = sum(message_tokens(m) for m in messages) > settings.history_token_budget
+    if len(messages) < settings.summary_trigger_messages and not over_budget:
+        return []
+
+    to_fold: list[BaseMessage] = []
+    remaining = len(messages)
+    for group in group_turns(messages):
+        if remaining - len(group) < settings.summary_keep_recent:
+            break
+        to_fold.extend(group)
+        remaining -= len(group)
+    return to_fold
+
+
+async def fold_into_summary(previous_summary: str, messages: list[BaseMessage]) -> str:
+    """Gộp các message cũ vào bản tóm tắt đang có"""
+    transcript = []
+    for message in messages:
+        if isinstance(message, ToolMessage):
+            # Kết quả search thô quá dài, câu trả lời tổng hợp phía sau đã đủ ý
+            continue
+        text = content_text(message.content)
+        if not text:
+            continue
+        role = "User" if isinstance(message, HumanMessage) else "SuperCat"
+        transcript.append(f"{role}: {text}")
+
+    prompt = SystemMessage(
+        content=(
+            f"Mày là người ghi chép cho nhóm Telegram. Cập nhật bản tóm tắt cuộc trò chuyện bằng tiếng Việt.\n\n"
+            f"**YÊU CẦU**:\n"
+            f"- Giữ tên người hỏi, chủ đề, sự kiện, con số, link quan trọng\n"
+            f"- Bỏ chào hỏi, chửi thề, chi tiết thừa\n"
+            f"- Tối đa 200 từ, viết dạng gạch đầu dòng\n\n"
+            f"**Tóm tắt hiện tại**:\n{previous_summary or '(chưa có)'}"
+        )
+    )
+    response = await search_llm.ainvoke([
+        prompt,
+        HumanMessage(content="Đoạn hội thoại mới cần gộp vào tóm tắt:\n\n" + "\n".join(transcript)),
+    ])
+    return content_text(response.content).strip()
@@ -2,16 +2,81 @@ from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, Tool
 from agents.memory import State
 from agents.models import main_llm
 from tools.video_tools import video_tools
+from langchain_core.runnables import RunnableConfig
+from config.config import get_settings
 
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 # ✅ Bind tools vào LLM
 video_llm = main_llm.bind_tools(video_tools)
+video_tools_by_name = {tool.name: tool for tool in video_tools}
 
 
-async def video_agent_node(state: State):
+class ToolTimings:
+    """Thời gian chạy, số lần timeout/lỗi của từng tool"""
+
+    def __init__(self):
+        self._stats: dict[str, dict] = {}
+
+    def record(self, name: str, elapsed_ms: float, outcome: str) -> None:
+        stats = self._stats.setdefault(name, {"calls": 0, "ok": 0, "timeout": 0, "error": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats[outcome] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "calls": s["calls"],
+                "ok": s["ok"],
+                "timeout": s["timeout"],
+                "error": s["error"],
+                "avg_ms": round(s["total_ms"] / s["calls"], 1),
+                "max_ms": round(s["max_ms"], 1),
+            }
+            for name, s in self._stats.items()
+        }
+
+
+tool_timings = ToolTimings()
+
+
+async def run_tool_call(tool_call: dict, config: RunnableConfig) -> ToolMessage:
+    """Chạy một tool call với timeout, lỗi/timeout được trả về như kết quả để các tool khác không bị ảnh hưởng"""
+    tool_name = tool_call["name"]
+    tool_args = tool_call["args"]
+    tool_func = video_tools_by_name.get(tool_name)
+    
+    logger.info(f"⚙️ Executing tool: {tool_name} with args: {tool_args}")
+    
+    start = time.perf_counter()
+    if not tool_func:
+        result, outcome = f"❌ Tool '{tool_name}' không tồn tại", "error"
+    else:
+        timeout = settings.video_tool_timeouts.get(tool_name, settings.video_tool_default_timeout)
+        try:
+            result = await asyncio.wait_for(tool_func.ainvoke(tool_args, config), timeout=timeout)
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            result, outcome = f"⏱️ Tool '{tool_name}' chạy quá {timeout:g}s nên đã bị hủy", "timeout"
+        except Exception as e:
+            result, outcome = f"❌ Lỗi khi thực thi tool: {str(e)}", "error"
+            logger.error(f"❌ Tool execution error: {e}")
+    
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    tool_timings.record(tool_name, elapsed_ms, outcome)
+    logger.info(f"✅ Tool {tool_name} ({outcome}, {elapsed_ms:.0f}ms): {str(result)[:100]}...")
+    
+    return ToolMessage(content=str(result), tool_call_id=tool_call["id"], name=tool_name)
+
+
+async def video_agent_node(state: State, config: RunnableConfig):
     """Agent xử lý video - tải, tách đoạn, lấy thông tin"""
     
     user_messages = [m for m in state["messages"] if isinstance(m, HumanMessage)]
@@ -33,12 +98,16 @@ async def video_agent_node(state: State):
             f"Nhiệm vụ: {instructions}\n\n"
             f"Các công cụ có sẵn:\n"
             f"1. download_video: Tải video/audio từ YouTube, Facebook, TikTok, Instagram, Reddit, X, Vimeo, Dailymotion\n"
-            f"2. get_video_info: Lấy thông tin về video\n\n"
+            f"2. get_video_info: Lấy thông tin về video\n"
+            f"3. get_job_status: Xem trạng thái job tải (theo job id hoặc mọi job của chat)\n"
+            f"4. cancel_job: Hủy job tải theo job id\n\n"
             f"Hướng dẫn sử dụng:\n"
             f"- Nếu user muốn tải video → dùng download_video với audio_only=False\n"
             f"- Nếu user muốn tải audio → dùng download_video với audio_only=True\n"
             f"- Nếu user muốn tách đoạn → thêm start_time và end_time\n"
-            f"- Nếu user hỏi thông tin video → dùng get_video_info\n\n"
+            f"- Nếu user hỏi thông tin video → dùng get_video_info\n"
+            f"- download_video chạy nền và trả về job id ngay: báo user job id, file sẽ tự gửi vào chat khi xong\n"
+            f"- Nếu user hỏi tiến độ → dùng get_job_status, muốn dừng → dùng cancel_job\n\n"
             f"Format thời gian: MM:SS (vd: 1:30), HH:MM:SS (vd: 1:30:45), hoặc số giây (vd: 90)\n\n"
             f"Hãy phân tích yêu cầu và gọi tool phù hợp!"
         )
@@ -53,44 +122,13 @@ async def video_agent_node(state: State):
         logger.info("💬 No tool calls, returning direct response")
         return {"messages": [response]}
     
-    # Có tool calls → xử lý từng tool
+    # Có tool calls → chạy song song, mỗi tool có timeout riêng
     logger.info(f"🔧 Tool calls: {len(response.tool_calls)}")
     
-    messages_to_add = [response]  # Thêm AI message với tool calls
-    
-    # Execute tools
-    for tool_call in response.tool_calls:
-        tool_name = tool_call["name"]
-        tool_args = tool_call["args"]
-        tool_id = tool_call["id"]
-        
-        logger.info(f"⚙️ Executing tool: {tool_name} with args: {tool_args}")
-        
-        # Tìm tool function
-        tool_func = None
-        for tool in video_tools:
-            if tool.name == tool_name:
-                tool_func = tool
-                break
-        
-        if not tool_func:
-            result = f"❌ Tool '{tool_name}' không tồn tại"
-        else:
-            try:
-                # Gọi tool
-                result = await tool_func.ainvoke(tool_args)
-                logger.info(f"✅ Tool result: {result[:100]}...")
-            except Exception as e:
-                result = f"❌ Lỗi khi thực thi tool: {str(e)}"
-                logger.error(f"❌ Tool execution error: {e}")
-        
-        # Thêm tool message
-        messages_to_add.append(
-            ToolMessage(
-                content=str(result),
-                tool_call_id=tool_id
-            )
-        )
+    tool_messages = await asyncio.gather(*(
+        run_tool_call(tool_call, config) for tool_call in response.tool_calls
+    ))
+    messages_to_add = [response] + list(tool_messages)  # AI message với tool calls + kết quả
     
     # Gọi LLM lần nữa để tổng hợp kết quả
     final_response = await video_llm.ainvoke([system_prompt] + recent_messages + messages_to_add)
@@ -0,0 +1,121 @@
+"""
+Audio download pipeline: temp file + WAV conversion vs streaming chunks into ffmpeg.
+
+Chạy từ thư mục gốc của repo (cần ffmpeg trong PATH):
+    python -m benchmarks.bench_audio_pipeline
+
+Fixture là audio AAC FIXTURE_SECONDS giây (fragmented MP4 như stream audio
+của YouTube). Chunk được đọc từ file và trả về qua iterator giống
+``Stream.iter_chunks``. Đo tổng byte ghi xuống đĩa (kích thước các file được
+tạo ra) và dung lượng đĩa tối đa trong thư mục làm việc.
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from utils.async_exec import blocking_executor, run_blocking, run_process
+from utils.ffmpeg_engine import STREAM_CHUNK_BYTES, get_ffmpeg_engine
+from utils.yt_downloader import MultiPlatformExtractor
+
+FIXTURE_SECONDS = 1200
+
+
+def chunks(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(STREAM_CHUNK_BYTES):
+            yield chunk
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+async def watch_peak(path: Path, peak: list[int]) -> None:
+    while True:
+        peak[0] = max(peak[0], dir_size(path))
+        await asyncio.sleep(0.02)
+
+
+async def old_pipeline(fixture: str, work: Path, written: list[int]) -> None:
+    """Cách cũ: stream.download ra file tạm, ffmpeg → WAV 24 kHz, rồi copy sang output"""
+    temp = work / "tmp"
+    temp.mkdir()
+    source = temp / "source.m4a"
+
+    def download():
+        with open(source, "wb") as f:
+            for chunk in chunks(fixture):
+                f.write(chunk)
+
+    await run_blocking(download)
+    written[0] += source.stat().st_size
+    wav = temp / "audio.wav"
+    await run_process(["ffmpeg", "-v", "error", "-i", str(source), "-acodec", "pcm_s16le", "-ar", "24000", "-ac", "1", "-y", str(wav)])
+    written[0] += wav.stat().st_size
+    source.unlink()
+    output = work / "out" / "audio.wav"
+    await run_blocking(shutil.copy2, wav, output)
+    written[0] += output.stat().st_size
+
+
+async def new_pipeline(fixture: str, work: Path, written: list[int]) -> None:
+    """Pipe chunk vào ffmpeg, chỉ ghi một file MP3, rồi rename sang output"""
+    temp = work / "tmp"
+    temp.mkdir()
+    encoded = await get_ffmpeg_engine().encode_audio_stream(chunks(fixture), temp / "audio.mp3", "mp3")
+    written[0] += encoded.stat().st_size
+    extractor = MultiPlatformExtractor()
+    extractor.output_dir = work / "out"
+    extractor.temp_dir = str(temp)
+    await run_blocking(extractor.move_to_output, str(encoded))
+    if encoded.exists():
+        # File tạm còn nguyên nghĩa là output được copy (ghi thêm một lần), rename thì không
+        written[0] += extractor.last_output.stat().st_size
+
+
+async def measure(label: str, pipeline, fixture: str) -> None:
+    work = Path(tempfile.mkdtemp())
+    (work / "out").mkdir()
+    written, peak = [0], [0]
+    watcher = asyncio.create_task(watch_peak(work, peak))
+    start = time.perf_counter()
+    try:
+        await pipeline(fixture, work, written)
+    finally:
+        elapsed = time.perf_counter() - start
+        watcher.cancel()
+        await asyncio.gather(watcher, return_exceptions=True)
+    peak[0] = max(peak[0], dir_size(work))
+    output = next((work / "out").iterdir())
+    print(
+        f"{label:<30}{written[0] / (1024 * 1024):>10.1f} MiB{peak[0] / (1024 * 1024):>10.1f} MiB"
+        f"{output.stat().st_size / (1024 * 1024):>10.1f} MiB{elapsed:>8.2f}s"
+    )
+    shutil.rmtree(work, ignore_errors=True)
+
+
+async def main():
+    if not shutil.which("ffmpeg"):
+        print("ffmpeg không có trong PATH")
+        return
+    blocking_executor()
+    fixture_dir = tempfile.mkdtemp()
+    try:
+        fixture = os.path.join(fixture_dir, "audio.m4a")
+        await run_process([
+            "ffmpeg", "-v", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={FIXTURE_SECONDS}",
+            "-c:a", "aac", "-b:a", "128k", "-f", "mp4", "-movflags", "+frag_keyframe+empty_moov", "-y", fixture,
+        ])
+        print(f"fixture: {FIXTURE_SECONDS}s AAC, {os.path.getsize(fixture) / (1024 * 1024):.1f} MiB\n")
+        print(f"{'':<30}{'written':>14}{'peak disk':>14}{'output':>14}{'time':>9}")
+        await measure("before (file + WAV + copy)", old_pipeline, fixture)
+        await measure("after (pipe → MP3)", new_pipeline, fixture)
+    finally:
+        shutil.rmtree(fixture_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Per-step overhead of the SQLite checkpointer vs the in-memory one.
+
+Chạy từ thư mục gốc của repo:
+    python -m benchmarks.bench_checkpointer
+
+Đo hai thứ:
+- Thời gian nằm trong các hàm checkpointer (aget_tuple/aput/aput_writes) trên
+  critical path của mỗi step
+- Độ trễ end-to-end của một lượt graph, chạy xen kẽ hai backend để giảm nhiễu
+"""
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import StateGraph
+
+from agents.checkpointer import BoundedMemorySaver, SqliteCheckpointSaver
+from agents.memory import State
+
+THREADS = 20
+TURNS = 50
+# Giả lập thời gian chờ LLM trong node, writer nền chạy trong khoảng này
+LLM_LATENCY = 0.01
+
+
+async def answer_node(state: State):
+    await asyncio.sleep(LLM_LATENCY)
+    return {"messages": [AIMessage(content="Con mèo cam trả lời dài dòng. " * 30)]}
+
+
+def build_graph(checkpointer):
+    builder = StateGraph(State)
+    builder.add_node("chatbot", answer_node)
+    builder.set_entry_point("chatbot")
+    return builder.compile(checkpointer=checkpointer)
+
+
+def instrument(checkpointer) -> list[float]:
+    """Bọc các hàm async của checkpointer để cộng dồn thời gian mỗi lượt"""
+    spent = [0.0]
+    for name in ("aget_tuple", "aput", "aput_writes"):
+        original = getattr(checkpointer, name)
+
+        async def timed(*args, _original=original, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await _original(*args, **kwargs)
+            finally:
+                spent[0] += time.perf_counter() - start
+
+        setattr(checkpointer, name, timed)
+    return spent
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        savers = {
+            "memory": BoundedMemorySaver(keep_last=4),
+            "sqlite": SqliteCheckpointSaver(str(Path(tmp) / "bench.db"), keep_last=4),
+        }
+        graphs = {name: build_graph(saver) for name, saver in savers.items()}
+        spent = {name: instrument(saver) for name, saver in savers.items()}
+        e2e = {name: [] for name in savers}
+        in_saver = {name: [] for name in savers}
+        steps_per_turn = None
+
+        for turn in range(TURNS):
+            for thread in range(THREADS):
+                config = {"configurable": {"thread_id": f"chat-{thread}"}}
+                for name, graph in graphs.items():
+                    spent[name][0] = 0.0
+                    start = time.perf_counter()
+                    result = await graph.ainvoke({"messages": [HumanMessage(content=f"Câu hỏi số {turn}")]}, config)
+                    e2e[name].append((time.perf_counter() - start) * 1000)
+                    in_saver[name].append(spent[name][0] * 1000)
+                if steps_per_turn is None:
+                    state = await graphs["memory"].aget_state(config)
+                    steps_per_turn = state.metadata["step"] + 1
+
+        savers["sqlite"].flush()
+        sqlite_stats = savers["sqlite"].stats()
+        savers["sqlite"].close()
+
+    print(f"{THREADS} threads x {TURNS} turns, {steps_per_turn} graph steps per turn, LLM latency {LLM_LATENCY * 1000:.0f}ms\n")
+    for name in savers:
+        print(
+            f"{name:<8} e2e p50={statistics.median(e2e[name]):7.3f}ms p99={percentile(e2e[name], 0.99):7.3f}ms | "
+            f"checkpointer p50={statistics.median(in_saver[name]):6.3f}ms p99={percentile(in_saver[name], 0.99):6.3f}ms"
+        )
+
+    p50_delta = statistics.median(in_saver["sqlite"]) - statistics.median(in_saver["memory"])
+    p99_delta = percentile(in_saver["sqlite"], 0.99) - percentile(in_saver["memory"], 0.99)
+    print(
+        f"\nsqlite overhead per graph step: p50={p50_delta / steps_per_turn:.3f}ms "
+        f"p99={p99_delta / steps_per_turn:.3f}ms"
+    )
+    print(f"writer: {sqlite_stats['flushed_batches']} batch(es), {sqlite_stats['flushed_rows']} row(s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
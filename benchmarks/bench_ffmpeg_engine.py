@@ -0,0 +1,108 @@
+"""
+Late-in-file cuts: old extract_segment command vs FFmpegEngine (input seek + keyframe index + multi-output).
+
+Chạy từ thư mục gốc của repo (cần ffmpeg trong PATH):
+    python -m benchmarks.bench_ffmpeg_engine
+
+Fixture là video tổng hợp FIXTURE_SECONDS giây (H.264 + AAC, keyframe mỗi 2s)
+do ffmpeg sinh ra. "before" là đúng lệnh cũ: ``ffmpeg -version`` rồi
+``ffmpeg -i in -ss S -t D ...``, mỗi output một lần chạy.
+"""
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from utils.async_exec import blocking_executor, run_process
+from utils.ffmpeg_engine import FFmpegEngine, OutputSpec
+
+FIXTURE_SECONDS = 1800
+CUTS = [(1500, 1530), (1700, 1730)]
+RUNS = 3
+
+
+async def make_fixture(directory: str) -> str:
+    path = os.path.join(directory, "fixture.mp4")
+    await run_process([
+        "ffmpeg", "-f", "lavfi", "-i", f"testsrc=size=320x240:rate=25:duration={FIXTURE_SECONDS}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={FIXTURE_SECONDS}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "50", "-c:a", "aac",
+        "-movflags", "+faststart", "-y", path,
+    ])
+    return path
+
+
+async def old_output(fixture: str, out: str, start: float, end: float, args: list[str]) -> None:
+    """Lệnh của extract_segment cũ: kiểm tra ffmpeg rồi seek phía output (đọc từ đầu file)"""
+    await run_process(["ffmpeg", "-version"])
+    await run_process(["ffmpeg", "-i", fixture, "-ss", str(start), "-t", str(end - start), *args, "-y", out])
+
+
+async def timed(job) -> float:
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        await job()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+async def main():
+    if not shutil.which("ffmpeg"):
+        print("ffmpeg không có trong PATH")
+        return
+    blocking_executor()
+    work = tempfile.mkdtemp()
+    try:
+        fixture = await make_fixture(work)
+        out = Path(work)
+        print(f"fixture: {FIXTURE_SECONDS}s, {os.path.getsize(fixture) / (1024 * 1024):.1f} MiB, median of {RUNS} runs\n")
+
+        engine = FFmpegEngine()
+        await engine.probe()
+        index_start = time.perf_counter()
+        await engine.keyframes(fixture)
+        print(f"keyframe index (first build, cached afterwards): {(time.perf_counter() - index_start) * 1000:.0f}ms\n")
+
+        start, end = CUTS[0]
+        rows = [
+            (
+                "video cut (stream copy)",
+                lambda: old_output(fixture, str(out / "old.mp4"), start, end, ["-c", "copy"]),
+                lambda: engine.cut(fixture, start, end, out / "new.mp4"),
+            ),
+            (
+                "audio cut (mp3)",
+                lambda: old_output(fixture, str(out / "old.mp3"), start, end, ["-vn", "-c:a", "libmp3lame", "-q:a", "2"]),
+                lambda: engine.cut(fixture, start, end, out / "new.mp3", audio=True),
+            ),
+        ]
+
+        async def old_multi():
+            for i, (s, e) in enumerate(CUTS):
+                await old_output(fixture, str(out / f"old_{i}.mp4"), s, e, ["-c", "copy"])
+            await old_output(fixture, str(out / "old_a.mp3"), start, end, ["-vn", "-c:a", "libmp3lame", "-q:a", "2"])
+            await old_output(fixture, str(out / "old_t.jpg"), start, start + 1, ["-frames:v", "1", "-q:v", "2"])
+
+        async def new_multi():
+            specs = [OutputSpec(out / f"new_{i}.mp4", "copy", s, e) for i, (s, e) in enumerate(CUTS)]
+            specs += [OutputSpec(out / "new_a.mp3", "audio", start, end), OutputSpec(out / "new_t.jpg", "thumbnail", start)]
+            produced = await engine.run(fixture, specs)
+            assert len(produced) == len(specs), produced
+
+        rows.append((f"{len(CUTS)} cuts + audio + thumbnail", old_multi, new_multi))
+
+        print(f"{'':<32}{'before':>10}{'after':>10}{'speedup':>10}")
+        for label, old_job, new_job in rows:
+            before = await timed(old_job)
+            after = await timed(new_job)
+            print(f"{label:<32}{before * 1000:>8.0f}ms{after * 1000:>8.0f}ms{before / after:>9.1f}x")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
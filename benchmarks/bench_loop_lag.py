@@ -0,0 +1,65 @@
+"""
+Event-loop lag while a media job runs: blocking calls vs the async execution layer.
+
+Chạy từ thư mục gốc của repo:
+    python -m benchmarks.bench_loop_lag
+
+Mỗi "job" giả lập một lượt download: một subprocess chạy JOB_SECONDS (thay cho
+yt-dlp/ffmpeg) rồi một lời gọi blocking JOB_SECONDS (thay cho pytubefix).
+Trong lúc đó LoopLagMonitor đo độ trễ của event loop, giống /metrics.
+"""
+import asyncio
+import subprocess
+import sys
+import time
+
+from utils.async_exec import LoopLagMonitor, blocking_executor, run_blocking, run_process
+
+JOB_SECONDS = 1.0
+SUBPROCESS = [sys.executable, "-c", f"import time; time.sleep({JOB_SECONDS})"]
+
+
+async def blocking_job():
+    """Cách cũ: hàm async nhưng gọi subprocess.run và thư viện sync trực tiếp"""
+    subprocess.run(SUBPROCESS, capture_output=True, check=True)
+    time.sleep(JOB_SECONDS)
+
+
+async def async_job():
+    await run_process(SUBPROCESS)
+    await run_blocking(time.sleep, JOB_SECONDS)
+
+
+async def measure(label: str, job) -> None:
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    await job()
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.1)
+    await monitor.stop()
+    stats = monitor.stats()
+    print(f"{label:<28} job={elapsed:5.2f}s  lag p50={stats['p50_ms']:7.2f}ms  p99={stats['p99_ms']:8.2f}ms  max={stats['max_ms']:8.2f}ms")
+
+
+async def cancel_kills_child() -> None:
+    """Hủy job giữa chừng phải kill luôn process con"""
+    task = asyncio.create_task(run_process([sys.executable, "-c", "import time; time.sleep(30)"]))
+    await asyncio.sleep(0.3)
+    start = time.perf_counter()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    print(f"\ncancel → child killed in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+async def main():
+    # Tạo executor trước (lần đầu phải import config), trong app việc này đã xong từ lúc khởi động
+    blocking_executor()
+    await measure("before (blocking calls)", blocking_job)
+    await measure("after (async exec layer)", async_job)
+    await cancel_kills_child()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
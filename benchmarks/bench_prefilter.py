@@ -0,0 +1,60 @@
+"""
+Microbenchmark for the webhook reject path.
+
+Chạy từ thư mục gốc của repo:
+    python -m benchmarks.bench_prefilter
+"""
+import json
+import time
+
+from utils.prefilter import WebhookPrefilter
+
+ALLOWED_CHAT_IDS = [6779771948, -1001234567890]
+
+
+def make_payload(chat_id: int, update_id: int = 1) -> bytes:
+    """Một text message điển hình trong group"""
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": 4242,
+            "from": {"id": 111, "is_bot": False, "first_name": "Mèo", "last_name": "Cam", "language_code": "vi"},
+            "chat": {"id": chat_id, "title": "Nhóm chém gió", "type": "supergroup"},
+            "date": 1760000000,
+            "text": "Giá vàng hôm nay thế nào? " * 20,
+        },
+    }, ensure_ascii=False).encode()
+
+
+def baseline_reject(body: bytes, allowed: list[int]) -> bool:
+    """Cách cũ: json.loads toàn bộ rồi so sánh với list"""
+    data = json.loads(body)
+    return data["message"]["chat"]["id"] not in allowed
+
+
+def run(label: str, fn, body: bytes, seconds: float = 1.0) -> float:
+    n = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            fn(body)
+        n += 1000
+    rate = n / (time.perf_counter() - start)
+    print(f"{label:<40} {rate:>12,.0f} req/s")
+    return rate
+
+
+def main():
+    body = make_payload(chat_id=-1009999999999)
+    prefilter = WebhookPrefilter(ALLOWED_CHAT_IDS)
+    assert prefilter.check(body) is None
+
+    print(f"Payload: {len(body)} bytes, reject path\n")
+    old = run("baseline (json.loads + list)", lambda b: baseline_reject(b, ALLOWED_CHAT_IDS), body)
+    new = run("WebhookPrefilter.check", prefilter.check, body)
+    print(f"\nSpeedup: {new / old:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Segment requests: full download + cut vs range fetch (ffmpeg input seek over HTTP range).
+
+Chạy từ thư mục gốc của repo (cần ffmpeg trong PATH):
+    python -m benchmarks.bench_range_fetch
+
+Fixture là video tổng hợp FIXTURE_SECONDS giây do ffmpeg sinh ra, phục vụ qua
+một HTTP server local có hỗ trợ Range và đếm số byte đã gửi, thay cho URL
+stream của YouTube. Lỗi range fetch (URL hỏng) phải để aprocess quay về tải toàn bộ.
+"""
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from utils.async_exec import blocking_executor, run_process
+from utils.yt_downloader import MultiPlatformExtractor
+
+FIXTURE_SECONDS = 600
+SEGMENT = (300, 330)
+MARGIN = 5.0
+# Giới hạn băng thông ~12 MiB/s: trên loopback server đẩy hết file vào socket buffer
+# trước khi ffmpeg kịp đóng kết nối, số byte đếm được sẽ không phản ánh mạng thật
+CHUNK_DELAY = 0.005
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """File server tĩnh có Range (http.server mặc định không hỗ trợ), đếm byte gửi đi"""
+
+    bytes_sent = 0
+
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        path = Path(self.translate_path(self.path))
+        if not match or not path.is_file():
+            return super().send_head()
+        size = path.stat().st_size
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+        f = path.open("rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "_remaining", None)
+        while remaining is None or remaining > 0:
+            chunk = source.read(64 * 1024 if remaining is None else min(64 * 1024, remaining))
+            if not chunk:
+                break
+            try:
+                outputfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # ffmpeg đóng kết nối khi đã đọc đủ
+                break
+            RangeHandler.bytes_sent += len(chunk)
+            time.sleep(CHUNK_DELAY)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+
+async def make_fixture(directory: str) -> str:
+    path = os.path.join(directory, "fixture.mp4")
+    await run_process([
+        "ffmpeg", "-f", "lavfi", "-i", f"testsrc=size=320x240:rate=25:duration={FIXTURE_SECONDS}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={FIXTURE_SECONDS}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "50", "-c:a", "aac",
+        "-movflags", "+faststart", "-y", path,
+    ])
+    return path
+
+
+async def full_download(url: str, work_dir: str) -> str:
+    """Cách cũ: tải cả file rồi mới cắt"""
+    extractor = MultiPlatformExtractor()
+    extractor.output_dir = Path(work_dir)
+    extractor.temp_dir = tempfile.mkdtemp(dir=work_dir)
+    local = os.path.join(extractor.temp_dir, "fixture.mp4")
+    await run_process(["ffmpeg", "-i", url, "-c", "copy", "-y", local])
+    await extractor.extract_segment(local, SEGMENT[0], SEGMENT[1], "full_segment")
+    return str(extractor.last_output)
+
+
+async def range_fetch(url: str, work_dir: str) -> str:
+    extractor = MultiPlatformExtractor(range_margin=MARGIN)
+    extractor.output_dir = Path(work_dir)
+    extractor.temp_dir = tempfile.mkdtemp(dir=work_dir)
+    fetch_start = max(0.0, SEGMENT[0] - MARGIN)
+    part, offset = await extractor.fetch_range_from_stream_url(url, "fixture", fetch_start, SEGMENT[1] + MARGIN)
+    await extractor.extract_segment(part, SEGMENT[0] - offset, SEGMENT[1] - offset, "range_segment")
+    return str(extractor.last_output)
+
+
+async def fallback(work_dir: str) -> None:
+    """URL stream lỗi → fetch_range trả None để aprocess tải toàn bộ"""
+    extractor = MultiPlatformExtractor(range_margin=MARGIN)
+    extractor.temp_dir = tempfile.mkdtemp(dir=work_dir)
+    try:
+        await extractor.fetch_range_from_stream_url("http://127.0.0.1:9/missing.mp4", "x", 0, 10)
+        print("fallback: range fetch unexpectedly succeeded")
+    except Exception as e:
+        print(f"fallback: range fetch raised {type(e).__name__} → full download path is used")
+
+
+async def measure(label: str, job) -> None:
+    RangeHandler.bytes_sent = 0
+    start = time.perf_counter()
+    output = await job()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<26} {RangeHandler.bytes_sent / 1024:10.0f} KiB  {elapsed:6.2f}s  output {os.path.getsize(output) / 1024:7.0f} KiB")
+
+
+async def main():
+    if not shutil.which("ffmpeg"):
+        print("ffmpeg không có trong PATH")
+        return
+    blocking_executor()
+    work_dir = tempfile.mkdtemp()
+    try:
+        fixture = await make_fixture(work_dir)
+        print(f"fixture: {FIXTURE_SECONDS}s, {os.path.getsize(fixture) / 1024:.0f} KiB, segment {SEGMENT[0]}-{SEGMENT[1]}s\n")
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RangeHandler, directory=work_dir))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/fixture.mp4"
+
+        await measure("full download + cut", partial(full_download, url, work_dir))
+        await measure(f"range fetch (±{MARGIN:g}s)", partial(range_fetch, url, work_dir))
+        await fallback(work_dir)
+        server.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Synthesis-prompt tokens: old fixed 500-char truncation vs token-budgeted source packing.
+
+Chạy từ thư mục gốc của repo:
+    python -m benchmarks.bench_source_packing
+
+Payload là dữ liệu giả lập theo đúng cấu trúc response của Tavily (5 kết quả
+mỗi lượt, có bài đăng lại trên domain khác và URL trùng chỉ khác utm_*), sinh
+cố định bằng seed để kết quả lặp lại được.
+"""
+import json
+import random
+
+from langchain_core.messages import ToolMessage
+
+from utils.data_extraction import extract_and_format_sources
+from utils.tokens import estimate_tokens
+
+SEED = 7
+RUNS = 200
+TOKEN_BUDGET = 600
+
+TOPICS = [
+    ("giá vàng sjc hôm nay", ["giá", "vàng", "sjc", "triệu", "lượng", "mua", "bán"]),
+    ("tin tức bầu cử mỹ", ["bầu", "cử", "mỹ", "ứng", "viên", "phiếu", "bang"]),
+    ("tỷ giá usd vnd", ["tỷ", "giá", "usd", "vnd", "ngân", "hàng", "đồng"]),
+    ("bitcoin giảm giá", ["bitcoin", "giá", "giảm", "thị", "trường", "crypto", "nhà", "đầu", "tư"]),
+]
+FILLER = (
+    "quảng cáo đăng ký nhận bản tin theo dõi fanpage bình luận chia sẻ bài viết liên quan "
+    "xem thêm độc giả tòa soạn bản quyền thuộc về chuyên mục đọc nhiều nhất video hot"
+).split()
+
+
+def sentence(rng: random.Random, words: list[str], relevant: bool) -> str:
+    pool = words + FILLER if relevant else FILLER
+    return " ".join(rng.choice(pool) for _ in range(rng.randint(12, 25))).capitalize() + "."
+
+
+def article(rng: random.Random, words: list[str]) -> str:
+    # Bài dài, phần liên quan nằm rải rác chứ không chỉ ở 500 ký tự đầu
+    return " ".join(sentence(rng, words, relevant=rng.random() < 0.35) for _ in range(rng.randint(6, 30)))
+
+
+def make_payload(rng: random.Random, query: str, words: list[str]) -> str:
+    results = []
+    for i in range(5):
+        results.append({
+            "url": f"https://www.news{i}.vn/{query.replace(' ', '-')}-{rng.randint(1, 999)}",
+            "title": f"{query.title()} - nguồn {i}",
+            "content": article(rng, words),
+            "score": round(1 - i * 0.1, 2),
+        })
+    # Bài đăng lại nguyên văn trên domain khác
+    if rng.random() < 0.6:
+        results[4] = {**results[1], "url": f"https://mirror.vn/{rng.randint(1, 999)}", "title": "Bài đăng lại"}
+    # Cùng bài, chỉ khác tham số tracking
+    if rng.random() < 0.4:
+        results[3] = {**results[0], "url": results[0]["url"] + "?utm_source=fb"}
+    return json.dumps({"query": query, "results": results}, ensure_ascii=False)
+
+
+def baseline_format(tool_messages: list[ToolMessage]) -> str:
+    """Cách cũ: giữ mọi kết quả, cắt cứng 500 ký tự"""
+    formatted = []
+    index = 1
+    for tool_msg in tool_messages:
+        for item in json.loads(tool_msg.content)["results"]:
+            formatted.append(
+                f"[{index}] {item['title']}\nURL: {item['url']}\nNội dung: {item['content'][:500]}...\n"
+            )
+            index += 1
+    return "\n".join(formatted)
+
+
+def coverage(text: str, words: list[str]) -> int:
+    """Số lần từ khóa của query xuất hiện trong phần nguồn, đại diện cho nội dung hữu ích"""
+    lowered = text.lower().split()
+    return sum(lowered.count(word) for word in words)
+
+
+def main():
+    rng = random.Random(SEED)
+    old_tokens = new_tokens = old_hits = new_hits = 0
+
+    for run in range(RUNS):
+        query, words = TOPICS[run % len(TOPICS)]
+        messages = [ToolMessage(content=make_payload(rng, query, words), tool_call_id=str(run))]
+
+        old_text = baseline_format(messages)
+        _, new_text = extract_and_format_sources(messages, query=query, token_budget=TOKEN_BUDGET)
+
+        old_tokens += estimate_tokens(old_text)
+        new_tokens += estimate_tokens(new_text)
+        old_hits += coverage(old_text, words)
+        new_hits += coverage(new_text, words)
+
+    print(f"{RUNS} synthetic Tavily payloads, budget {TOKEN_BUDGET} tokens\n")
+    print(f"{'':<24}{'tokens/prompt':>14}{'query-term hits':>18}{'hits/100 tokens':>18}")
+    print(f"{'baseline (500 chars)':<24}{old_tokens / RUNS:>14.0f}{old_hits / RUNS:>18.1f}{100 * old_hits / old_tokens:>18.2f}")
+    print(f"{'packed':<24}{new_tokens / RUNS:>14.0f}{new_hits / RUNS:>18.1f}{100 * new_hits / new_tokens:>18.2f}")
+    print(f"\nSynthesis prompt tokens saved: {(old_tokens - new_tokens) / RUNS:.0f}/prompt ({1 - new_tokens / old_tokens:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field, SecretStr
 from functools import lru_cache
+from typing import Literal
 
 class Config(BaseSettings):
     #Telegram Bot Token
@@ -8,6 +9,79 @@ class Config(BaseSettings):
     webhook_url: str = Field(default="https://supercat.onrender.com/webhook", alias="WEBHOOK_URL", description="Webhook URL")
     allowed_chat_ids: list[int] = Field(default=[6779771948], alias="ALLOWED_CHAT_IDS", description="Allowed Chat IDs")
 
+    #Webhook ingestion
+    ingestion_mode: Literal["inline", "queue"] = Field(default="queue", alias="INGESTION_MODE", description="inline: xử lý update trong request, queue: ack ngay và xử lý nền")
+    update_queue_size: int = Field(default=256, alias="UPDATE_QUEUE_SIZE", description="Số update tối đa chờ trong queue")
+    update_workers: int = Field(default=4, alias="UPDATE_WORKERS", description="Số worker xử lý update")
+
+    #Per-chat dispatcher (chỉ dùng ở queue mode)
+    chat_dispatcher_enabled: bool = Field(default=True, alias="CHAT_DISPATCHER_ENABLED", description="Xử lý tuần tự trong mỗi chat, song song giữa các chat")
+    max_concurrent_updates: int = Field(default=8, alias="MAX_CONCURRENT_UPDATES", description="Số update được xử lý đồng thời tối đa")
+    chat_mailbox_size: int = Field(default=32, alias="CHAT_MAILBOX_SIZE", description="Số update tối đa chờ trong mailbox của một chat")
+    chat_mailbox_idle_seconds: float = Field(default=60.0, alias="CHAT_MAILBOX_IDLE_SECONDS", description="Thời gian rảnh trước khi mailbox bị dọn")
+
+    #Update deduplication
+    update_dedup_ttl_seconds: float = Field(default=3600.0, alias="UPDATE_DEDUP_TTL_SECONDS", description="Thời gian nhớ update_id đã nhận")
+    update_dedup_max_entries: int = Field(default=10_000, alias="UPDATE_DEDUP_MAX_ENTRIES", description="Số update_id tối đa giữ trong bộ nhớ")
+
+    #Conversation history
+    history_token_budget: int = Field(default=6000, alias="HISTORY_TOKEN_BUDGET", description="Ngân sách token (ước lượng) cho lịch sử hội thoại")
+    history_max_messages: int = Field(default=15, alias="HISTORY_MAX_MESSAGES", description="Số message tối đa giữ trong lịch sử")
+
+    #Rolling summary
+    summary_enabled: bool = Field(default=True, alias="SUMMARY_ENABLED", description="Gộp các lượt hội thoại cũ vào bản tóm tắt")
+    summary_trigger_messages: int = Field(default=10, alias="SUMMARY_TRIGGER_MESSAGES", description="Số message trong lịch sử để bắt đầu tóm tắt")
+    summary_keep_recent: int = Field(default=4, alias="SUMMARY_KEEP_RECENT", description="Số message gần nhất giữ nguyên sau khi tóm tắt")
+
+    # Router
+    router_local_enabled: bool = Field(default=True, alias="ROUTER_LOCAL_ENABLED", description="Cho phép rules/classifier local quyết định route trước khi gọi LLM")
+    router_classifier_threshold: float = Field(default=0.85, alias="ROUTER_CLASSIFIER_THRESHOLD", description="Độ tự tin tối thiểu để classifier local tự quyết, thấp hơn thì hỏi LLM")
+    speculative_chatbot: bool = Field(default=False, alias="SPECULATIVE_CHATBOT", description="Chạy trước lượt gọi đầu của chatbot trong lúc LLM đang route, hủy nếu route ra agent khác")
+
+    # Streaming
+    stream_answers: bool = Field(default=True, alias="STREAM_ANSWERS", description="Stream token câu trả lời vào tin nhắn Telegram bằng edit")
+    stream_edit_interval: float = Field(default=1.5, alias="STREAM_EDIT_INTERVAL", description="Khoảng cách tối thiểu (giây) giữa hai lần edit khi stream")
+
+    # Search cache
+    search_cache_ttl_seconds: int = Field(default=600, alias="SEARCH_CACHE_TTL_SECONDS", description="Thời gian giữ kết quả Tavily trong cache")
+    search_cache_max_entries: int = Field(default=512, alias="SEARCH_CACHE_MAX_ENTRIES", description="Số query tối đa giữ trong cache local")
+    source_token_budget: int = Field(default=600, alias="SOURCE_TOKEN_BUDGET", description="Số token tối đa cho phần nguồn trong prompt tổng hợp")
+
+    # Answer cache
+    answer_cache_enabled: bool = Field(default=True, alias="ANSWER_CACHE_ENABLED", description="Trả lại câu trả lời đã tổng hợp cho câu hỏi gần giống, bỏ qua Gemini/Tavily")
+    answer_cache_threshold: float = Field(default=0.9, alias="ANSWER_CACHE_THRESHOLD", description="Độ giống cosine tối thiểu (char trigram) để coi là cùng câu hỏi")
+    answer_cache_max_entries: int = Field(default=1000, alias="ANSWER_CACHE_MAX_ENTRIES", description="Số câu trả lời tối đa giữ trong cache")
+    answer_cache_ttl_realtime_seconds: int = Field(default=600, alias="ANSWER_CACHE_TTL_REALTIME_SECONDS", description="TTL cho câu hỏi về giá cả, thời tiết, tỷ số")
+    answer_cache_ttl_news_seconds: int = Field(default=3600, alias="ANSWER_CACHE_TTL_NEWS_SECONDS", description="TTL cho câu hỏi tin tức, sự kiện trong ngày")
+    answer_cache_ttl_seconds: int = Field(default=86400, alias="ANSWER_CACHE_TTL_SECONDS", description="TTL cho câu hỏi kiến thức chung")
+    answer_cache_opt_out_chat_ids: list[int] = Field(default=[], alias="ANSWER_CACHE_OPT_OUT_CHAT_IDS", description="Các chat không dùng và không đóng góp vào answer cache")
+
+    # Video tools
+    video_tool_default_timeout: float = Field(default=600.0, alias="VIDEO_TOOL_DEFAULT_TIMEOUT", description="Timeout (giây) cho video tool không có trong VIDEO_TOOL_TIMEOUTS")
+    video_tool_timeouts: dict[str, float] = Field(default={"get_video_info": 30.0, "download_video": 600.0}, alias="VIDEO_TOOL_TIMEOUTS", description="Timeout (giây) theo tên tool, dạng JSON")
+    media_job_workers: int = Field(default=2, alias="MEDIA_JOB_WORKERS", description="Số job tải/tách video chạy nền cùng lúc")
+    media_job_queue_size: int = Field(default=32, alias="MEDIA_JOB_QUEUE_SIZE", description="Số job media tối đa đang chờ, đầy thì từ chối job mới")
+    media_job_timeout: float = Field(default=900.0, alias="MEDIA_JOB_TIMEOUT", description="Thời gian tối đa (giây) cho một job media")
+    media_platform_default_limit: int = Field(default=2, alias="MEDIA_PLATFORM_DEFAULT_LIMIT", description="Số job song song tối đa trên mỗi nền tảng")
+    media_platform_limits: dict[str, int] = Field(default={}, alias="MEDIA_PLATFORM_LIMITS", description="Giới hạn song song theo nền tảng, dạng JSON (key: youtube, x, tiktok, facebook, instagram, reddit, vimeo, dailymotion; vd: {\"youtube\": 1})")
+    media_cache_enabled: bool = Field(default=True, alias="MEDIA_CACHE_ENABLED", description="Giữ lại file video/audio nguồn đã tải để dùng lại")
+    media_cache_dir: str = Field(default="data/media_cache", alias="MEDIA_CACHE_DIR", description="Thư mục media cache")
+    media_cache_max_mb: float = Field(default=2048.0, alias="MEDIA_CACHE_MAX_MB", description="Dung lượng tối đa của media cache (MB), vượt thì xóa file dùng lâu nhất")
+    media_range_fetch: bool = Field(default=True, alias="MEDIA_RANGE_FETCH", description="Tách đoạn thì chỉ tải đoạn cần (HTTP range / yt-dlp --download-sections), lỗi thì tải toàn bộ")
+    media_range_margin_seconds: float = Field(default=5.0, alias="MEDIA_RANGE_MARGIN_SECONDS", description="Số giây tải thêm mỗi bên đoạn cần để có keyframe")
+    media_audio_format: Literal["mp3", "m4a", "opus"] = Field(default="mp3", alias="MEDIA_AUDIO_FORMAT", description="Định dạng file audio trả cho user")
+    media_delivery_db: str = Field(default="data/media_delivery.db", alias="MEDIA_DELIVERY_DB", description="Index file_id Telegram của các file đã gửi, để gửi lại không phải upload")
+    incoming_media_db: str = Field(default="data/incoming_media.db", alias="INCOMING_MEDIA_DB", description="Index file_unique_id → file_id của file user gửi vào chat")
+    incoming_media_max_entries: int = Field(default=10_000, alias="INCOMING_MEDIA_MAX_ENTRIES", description="Số file user gửi tối đa giữ trong index, cũ nhất bị xóa trước")
+    blocking_executor_workers: int = Field(default=4, alias="BLOCKING_EXECUTOR_WORKERS", description="Số thread cho thư viện blocking (pytubefix, copy file)")
+    graph_topology: Literal["orchestrated", "single_pass"] = Field(default="orchestrated", alias="GRAPH_TOPOLOGY", description="orchestrated: router rồi mới tới agent, single_pass: một lượt LLM vừa route vừa trả lời")
+
+    #Conversation memory (checkpointer)
+    checkpoint_backend: Literal["memory", "sqlite"] = Field(default="sqlite", alias="CHECKPOINT_BACKEND", description="memory: chỉ trong RAM, sqlite: lưu xuống DATABASE_URL (mặc định data/supercat.db)")
+    checkpoint_keep_last: int = Field(default=4, alias="CHECKPOINT_KEEP_LAST", description="Số checkpoint mới nhất giữ lại cho mỗi chat")
+    checkpoint_max_threads: int = Field(default=500, alias="CHECKPOINT_MAX_THREADS", description="Số chat tối đa giữ trong bộ nhớ")
+    checkpoint_max_mb: float = Field(default=256.0, alias="CHECKPOINT_MAX_MB", description="Dung lượng checkpoint tối đa trong bộ nhớ (MB)")
+
     #Database
     database_url: str | None = Field(None, alias="DATABASE_URL", description="Database URL")
 
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from telegram.ext import Application
 from telegram import Update
 from config.config import get_settings
@@ -6,20 +7,36 @@ from contextlib import asynccontextmanager
 import logging
 import uvicorn
 from utils.export_api_key import export_api_key
+from utils.update_queue import UpdateQueue
+from utils.dispatcher import ChatDispatcher
+from utils.dedup import build_deduplicator
+from utils.prefilter import WebhookPrefilter
+from utils.async_exec import LoopLagMonitor
+from utils.constants import LogMessages
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 bot_application = None
+update_queue = None
+chat_dispatcher = None
 settings = get_settings()
 export_api_key()
+update_deduplicator = build_deduplicator(settings)
+webhook_prefilter = WebhookPrefilter(settings.allowed_chat_ids)
+# Độ trễ event loop: tăng vọt nghĩa là có code blocking chạy trên loop
+loop_lag_monitor = LoopLagMonitor()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Lifespan for the FastAPI application.
     """
-    global bot_application
+    global bot_application, update_queue, chat_dispatcher
+    loop_lag_monitor.start()
+    # Kiểm tra ffmpeg một lần thay vì mỗi lần tách đoạn
+    from utils.ffmpeg_engine import get_ffmpeg_engine
+    await get_ffmpeg_engine().probe()
     # Start the bot
     logger.info("Starting Supercat...")
 
@@ -32,6 +49,29 @@ async def lifespan(app: FastAPI):
     await bot_application.initialize()
     await bot_application.start()
 
+    # Job tải/tách video chạy nền, xong thì gửi kết quả thẳng vào chat
+    from utils.media_jobs import get_job_manager, telegram_notifier
+    get_job_manager().start(telegram_notifier(bot_application.bot))
+
+    # Fast-ack mode: webhook chỉ đẩy update vào queue, worker xử lý nền
+    if settings.ingestion_mode == "queue":
+        if settings.chat_dispatcher_enabled:
+            # Tuần tự trong từng chat để không race trên cùng thread_id checkpoint
+            chat_dispatcher = ChatDispatcher(
+                bot_application.process_update,
+                max_concurrency=settings.max_concurrent_updates,
+                mailbox_size=settings.chat_mailbox_size,
+                idle_timeout=settings.chat_mailbox_idle_seconds,
+            )
+
+        update_queue = UpdateQueue(
+            bot_application.process_update,
+            maxsize=settings.update_queue_size,
+            workers=settings.update_workers,
+            downstream=chat_dispatcher,
+        )
+        await update_queue.start()
+
     # Setup webhook
     if settings.webhook_url:
         webhook_url = settings.webhook_url
@@ -52,8 +92,22 @@ async def lifespan(app: FastAPI):
 
     # Stop the bot
     logger.info("Stopping Supercat...")
+    if update_queue:
+        await update_queue.stop()
+    if chat_dispatcher:
+        await chat_dispatcher.stop()
+    from utils.media_jobs import get_job_manager
+    await get_job_manager().stop()
     await bot_application.stop()
     await bot_application.shutdown()
+
+    # Flush checkpoint xuống đĩa
+    from agents.orchestrator import memory
+    memory.close()
+    from utils.incoming_media import get_incoming_media_store
+    if get_incoming_media_store.cache_info().currsize:
+        get_incoming_media_store().close()
+    await loop_lag_monitor.stop()
     logger.info("Supercat stopped")
 
 app = FastAPI(lifespan=lifespan)
@@ -67,27 +121,44 @@ async def webhook(request: Request):
     """Handle Telegram webhook updates"""
     if not bot_application:
         logger.error("Bot not initialized!")
-        return {'error': 'Bot not initialized'}, 500
+        return JSONResponse({'error': 'Bot not initialized'}, status_code=500)
     
     try:
-        data = await request.json()
-        if data['message']['chat']['id'] not in settings.allowed_chat_ids:
-            logger.info(f"📨 Received update from unauthorized chat: {data['message']['chat']['id']}")
+        # Loại payload không được phép trước khi decode/dựng Update
+        data = webhook_prefilter.check(await request.body())
+        if data is None:
             return {'ok': True}
         
-        update_id = data.get('update_id', 'unknown')
+        update_id = data['update_id']
         logger.info(f"📨 Received update: {update_id}")
-        logger.info(f"📨 Data: {data}")
+        logger.debug(f"📨 Data: {data}")
+
+        # Telegram gửi lại update khi phản hồi chậm, bỏ qua bản trùng
+        if await update_deduplicator.is_duplicate(update_id):
+            logger.info(f"🔁 Duplicate update ignored: {update_id}")
+            return {'ok': True}
         
-        await bot_application.process_update(
-            Update.de_json(data, bot_application.bot)
-        )
+        update = Update.de_json(data, bot_application.bot)
+
+        if update_queue:
+            # Ack ngay để Telegram không timeout và gửi lại update
+            if not update_queue.put_nowait(update):
+                logger.warning(f"⚠️ {LogMessages.UPDATE_DROPPED}: {update_id}")
+            return {'ok': True}
+
+        try:
+            await bot_application.process_update(update)
+        except Exception:
+            # Cho phép Telegram gửi lại update này
+            await update_deduplicator.forget(update_id)
+            raise
         
         return {'ok': True}
         
     except Exception as e:
         logger.error(f"❌ Error processing update: {e}")
-        return {'error': str(e)}, 500
+        # Status 500 thật (tuple không phải response của FastAPI) để Telegram gửi lại update
+        return JSONResponse({'error': str(e)}, status_code=500)
 
 @app.get('/webhook-info')
 async def webhook_info():
@@ -108,5 +179,41 @@ async def webhook_info():
     except Exception as e:
         return {'error': str(e)}
 
+@app.get('/metrics')
+async def metrics():
+    """Runtime metrics"""
+    from agents.orchestrator import memory, router
+    from agents.speculation import speculation
+    from utils.streaming import stream_stats
+    from agents.models import search_tool, answer_cache
+    from agents.video_agent import tool_timings
+    from utils.media_jobs import get_job_manager
+    from utils.media_cache import get_media_cache
+    from utils.ffmpeg_engine import get_ffmpeg_engine
+    from utils.media_delivery import get_media_delivery
+    from utils.incoming_media import get_incoming_media_store
+    media_cache = get_media_cache()
+
+    return {
+        'ingestion_mode': settings.ingestion_mode,
+        'update_queue': update_queue.stats() if update_queue else None,
+        'chat_dispatcher': chat_dispatcher.stats() if chat_dispatcher else None,
+        'update_dedup': update_deduplicator.stats(),
+        'prefilter': webhook_prefilter.stats(),
+        'checkpointer': memory.stats(),
+        'router': router.stats(),
+        'speculation': speculation.stats(),
+        'streaming': stream_stats.stats(),
+        'search_cache': search_tool.cache_stats(),
+        'answer_cache': answer_cache.stats() if answer_cache else None,
+        'video_tools': tool_timings.stats(),
+        'media_jobs': get_job_manager().stats(),
+        'media_cache': media_cache.stats() if media_cache else None,
+        'media_delivery': get_media_delivery().stats(),
+        'incoming_media': get_incoming_media_store().stats(),
+        'ffmpeg': get_ffmpeg_engine().stats(),
+        'event_loop': loop_lag_monitor.stats(),
+    }
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,13 +1,26 @@
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from typing import Optional
 import logging
 from utils.yt_downloader import MultiPlatformExtractor
+from utils.async_exec import run_blocking
+from utils.media_jobs import get_job_manager
 
 logger = logging.getLogger(__name__)
 
+def _chat_id(config: RunnableConfig) -> Optional[int]:
+    """thread_id của graph chính là chat id Telegram"""
+    thread_id = (config or {}).get("configurable", {}).get("thread_id")
+    try:
+        return int(thread_id)
+    except (TypeError, ValueError):
+        return None
+
+
 @tool
 async def download_video(
     url: str,
+    config: RunnableConfig,
     audio_only: bool = False,
     start_time: Optional[str] = None,
     end_time: Optional[str] = None,
@@ -15,16 +28,17 @@ async def download_video(
 ) -> str:
     """
     Tải video hoặc audio từ các nền tảng (YouTube, Facebook, TikTok, etc.)
+    Việc tải chạy nền: tool trả về job id ngay, file sẽ được gửi vào chat khi xong.
     
     Args:
         url: URL của video (YouTube, Facebook, TikTok, Instagram, Reddit, X, Vimeo, Dailymotion)
-        audio_only: True nếu chỉ tải audio (MP3), False nếu tải video (MP4)
+        audio_only: True nếu chỉ tải audio (MP3, M4A hoặc Opus tùy cấu hình bot), False nếu tải video (MP4)
         start_time: Thời gian bắt đầu để tách đoạn (format: MM:SS hoặc HH:MM:SS hoặc số giây)
         end_time: Thời gian kết thúc để tách đoạn (format: MM:SS hoặc HH:MM:SS hoặc số giây)
         output_filename: Tên file output tùy chỉnh (không cần extension)
     
     Returns:
-        Thông báo kết quả download và đường dẫn file
+        Job id và trạng thái ban đầu
     
     Examples:
         - Tải toàn bộ video: download_video("https://youtube.com/watch?v=xxx")
@@ -33,44 +47,81 @@ async def download_video(
         - Tách đoạn audio: download_video("https://youtube.com/watch?v=xxx", audio_only=True, start_time="90", end_time="165")
     """
     try:
-        # Khởi tạo extractor
-        extractor = MultiPlatformExtractor()
-        
         # Xác định nền tảng
-        platform = extractor.detect_platform(url)
+        platform = MultiPlatformExtractor().detect_platform(url)
         if not platform:
             return f"❌ URL không được hỗ trợ: {url}"
         
-        logger.info(f"📥 Đang tải từ {platform}: {url}")
-        
-        # Xử lý download
-        success = extractor.process(
+        job = get_job_manager().submit(
+            chat_id=_chat_id(config),
             url=url,
+            platform=platform,
             audio_only=audio_only,
             start_time=start_time,
             end_time=end_time,
-            output_filename=output_filename
+            output_filename=output_filename,
         )
+        if job is None:
+            return "⏳ Đang có quá nhiều yêu cầu tải, thử lại sau ít phút nhé"
         
-        if success:
-            content_type = "audio MP3" if audio_only else "video MP4"
-            mode = "Tách đoạn" if start_time and end_time else "Tải toàn bộ"
-            
-            result = f"✅ {mode} {content_type} thành công!\n"
-            result += f"📁 File đã lưu trong thư mục: {extractor.output_dir}\n"
-            
-            if start_time and end_time:
-                result += f"⏱️ Từ {start_time} đến {end_time}"
-            
-            return result
-        else:
-            return f"❌ Không thể tải {content_type} từ {url}"
+        logger.info(f"📥 Job {job.id}: tải từ {platform}: {url}")
+        content_type = f"audio {get_job_manager().audio_format.upper()}" if audio_only else "video MP4"
+        result = f"🚀 Đã nhận tải {content_type}, job id: {job.id}\n"
+        if start_time and end_time:
+            result += f"⏱️ Từ {start_time} đến {end_time}\n"
+        result += "📨 File sẽ được gửi vào chat khi xong"
+        return result
             
     except Exception as e:
         logger.error(f"❌ Lỗi download_video: {e}")
         return f"❌ Lỗi: {str(e)}"
 
 
+@tool
+async def get_job_status(config: RunnableConfig, job_id: Optional[str] = None) -> str:
+    """
+    Xem trạng thái job tải video/audio
+    
+    Args:
+        job_id: Id của job, bỏ trống để xem mọi job của chat hiện tại
+    
+    Returns:
+        Trạng thái (queued, downloading, cutting, uploading, done, failed, cancelled)
+    """
+    manager = get_job_manager()
+    chat_id = _chat_id(config)
+    if job_id:
+        job = manager.get(job_id)
+        if job is None or job.chat_id != chat_id:
+            return f"❌ Không tìm thấy job {job_id}"
+        return job.describe()
+    
+    jobs = manager.jobs_for_chat(chat_id)
+    if not jobs:
+        return "📭 Chat này chưa có job tải nào"
+    return "\n".join(job.describe() for job in jobs[-10:])
+
+
+@tool
+async def cancel_job(job_id: str, config: RunnableConfig) -> str:
+    """
+    Hủy job tải video/audio đang chờ hoặc đang chạy
+    
+    Args:
+        job_id: Id của job cần hủy
+    
+    Returns:
+        Kết quả hủy
+    """
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None or job.chat_id != _chat_id(config):
+        return f"❌ Không tìm thấy job {job_id}"
+    if not manager.cancel(job_id):
+        return f"ℹ️ Job {job_id} đã kết thúc ({job.state}), không hủy được"
+    return f"🛑 Đã hủy job {job_id}"
+
+
 @tool
 async def get_video_info(url: str) -> str:
     """
@@ -93,16 +144,20 @@ async def get_video_info(url: str) -> str:
         # Nếu là YouTube, lấy thông tin chi tiết
         if extractor.is_youtube_url(url):
             from pytubefix import YouTube
-            yt = YouTube(url, use_oauth=False, allow_oauth_cache=False)
             
-            info = f"📺 **Thông tin video**\n"
-            info += f"- Nền tảng: YouTube\n"
-            info += f"- Tiêu đề: {yt.title}\n"
-            info += f"- Thời lượng: {yt.length} giây ({yt.length // 60}:{yt.length % 60:02d})\n"
-            info += f"- Tác giả: {yt.author}\n"
-            info += f"- Lượt xem: {yt.views:,}\n"
+            def fetch_info() -> str:
+                # Các thuộc tính của pytubefix gọi mạng lúc được truy cập
+                yt = YouTube(url, use_oauth=False, allow_oauth_cache=False)
+                
+                info = f"📺 **Thông tin video**\n"
+                info += f"- Nền tảng: YouTube\n"
+                info += f"- Tiêu đề: {yt.title}\n"
+                info += f"- Thời lượng: {yt.length} giây ({yt.length // 60}:{yt.length % 60:02d})\n"
+                info += f"- Tác giả: {yt.author}\n"
+                info += f"- Lượt xem: {yt.views:,}\n"
+                return info
             
-            return info
+            return await run_blocking(fetch_info)
         else:
             return f"📺 Video từ nền tảng: {platform}\nURL: {url}"
             
@@ -112,4 +167,4 @@ async def get_video_info(url: str) -> str:
 
 
 # Danh sách tools để bind vào LLM
-video_tools = [download_video, get_video_info]
\ No newline at end of file
+video_tools = [download_video, get_video_info, get_job_status, cancel_job]
\ No newline at end of file
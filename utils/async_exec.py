@@ -0,0 +1,203 @@
+"""
+Async execution layer for the media pipeline: subprocesses, blocking calls and loop-lag metrics.
+"""
+import asyncio
+import functools
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Hashable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Thời gian chờ process tự thoát sau SIGTERM trước khi SIGKILL
+KILL_GRACE_SECONDS = 2.0
+
+
+# ==========================
+# SUBPROCESS
+# ==========================
+def _signal_group(process: asyncio.subprocess.Process, sig: int) -> None:
+    try:
+        # Process chạy trong session riêng nên kill cả group (yt-dlp gọi ffmpeg con)
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def terminate(process: asyncio.subprocess.Process) -> None:
+    """SIGTERM cả process group, hết grace thì SIGKILL, rồi chờ process thoát hẳn"""
+    if process.returncode is not None:
+        return
+    _signal_group(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), timeout=KILL_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        _signal_group(process, signal.SIGKILL)
+        await process.wait()
+
+
+async def run_process(
+    cmd: Sequence[str],
+    *,
+    timeout: Optional[float] = None,
+    input: Optional[bytes] = None,
+    check: bool = True,
+) -> subprocess.CompletedProcess:
+    """Chạy lệnh mà không block event loop.
+
+    Giống ``subprocess.run(capture_output=True, text=True)``: trả về
+    ``CompletedProcess`` với stdout/stderr đã decode, ``check`` thì raise
+    ``CalledProcessError``. Bị cancel hoặc quá ``timeout`` thì kill cả process
+    group trước khi raise.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(input), timeout=timeout)
+    except BaseException:
+        # CancelledError, TimeoutError, KeyboardInterrupt: không để lại process mồ côi
+        await asyncio.shield(terminate(process))
+        raise
+
+    result = subprocess.CompletedProcess(
+        list(cmd),
+        process.returncode,
+        stdout.decode("utf-8", errors="ignore"),
+        stderr.decode("utf-8", errors="ignore"),
+    )
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, list(cmd), result.stdout, result.stderr)
+    return result
+
+
+# ==========================
+# BLOCKING CALLS
+# ==========================
+class CancelToken:
+    """Cờ hủy cho code chạy trong thread, code đó tự kiểm tra ``raise_if_cancelled``"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise asyncio.CancelledError("blocking call cancelled")
+
+
+@functools.lru_cache()
+def blocking_executor() -> ThreadPoolExecutor:
+    """Thread pool có giới hạn cho thư viện blocking (pytubefix, copy file lớn)"""
+    from config.config import get_settings
+
+    workers = get_settings().blocking_executor_workers
+    logger.info(f"🧵 Blocking executor: {workers} worker(s)")
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blocking")
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any, token: Optional[CancelToken] = None, **kwargs: Any) -> Any:
+    """Chạy hàm blocking trong executor có giới hạn.
+
+    Thread không thể bị kill: khi bị cancel, ``token`` được bật để hàm tự dừng
+    ở điểm kiểm tra kế tiếp (vd: callback tiến độ của pytubefix).
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(blocking_executor(), functools.partial(fn, *args, **kwargs))
+    try:
+        return await future
+    except asyncio.CancelledError:
+        if token is not None:
+            token.cancel()
+        raise
+
+
+# ==========================
+# KEYED LOCKS
+# ==========================
+class KeyedLock:
+    """Một ``asyncio.Lock`` cho mỗi key, entry bị xóa khi không còn ai giữ hoặc đợi.
+
+    Dùng: ``async with locks(key): ...``
+    """
+
+    def __init__(self):
+        # key -> [lock, số coroutine đang giữ/đợi]
+        self._locks: dict[Hashable, list] = {}
+
+    @asynccontextmanager
+    async def __call__(self, key: Hashable) -> AsyncIterator[None]:
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+# ==========================
+# EVENT LOOP LAG
+# ==========================
+class LoopLagMonitor:
+    """Đo độ trễ event loop: sleep ``interval`` rồi xem bị đánh thức muộn bao lâu"""
+
+    def __init__(self, interval: float = 0.1, window: int = 600):
+        self.interval = interval
+        self._samples: deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+        self.max_ms = 0.0
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self._samples.append(lag_ms)
+            self.max_ms = max(self.max_ms, lag_ms)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        samples = sorted(self._samples)
+
+        def pct(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2) if samples else 0.0
+
+        return {
+            "interval_ms": self.interval * 1000,
+            "p50_ms": pct(0.5),
+            "p99_ms": pct(0.99),
+            "window_max_ms": round(samples[-1], 2) if samples else 0.0,
+            "max_ms": round(self.max_ms, 2),
+        }
@@ -8,6 +8,7 @@ class Endpoints:
     HEALTH_CHECK: Final[str] = "/"
     WEBHOOK: Final[str] = "/webhook"
     WEBHOOK_INFO: Final[str] = "/webhook-info"
+    METRICS: Final[str] = "/metrics"
 
 # Webhook Configuration
 class WebhookConfig:
@@ -34,6 +35,7 @@ class LogMessages:
     WEBHOOK_URL_MISSING: Final[str] = "No webhook URL provided"
     UPDATE_RECEIVED: Final[str] = "Received update"
     UPDATE_PROCESSED: Final[str] = "Update processed successfully"
+    UPDATE_DROPPED: Final[str] = "Update queue full, update dropped"
     HANDLERS_SETUP: Final[str] = "Bot handlers setup complete"
 
 # Error Messages
@@ -1,44 +1,182 @@
 import json
+import math
+import re
+from collections import Counter
+from urllib.parse import urlparse
 from langchain_core.messages import ToolMessage
+from utils.tokens import estimate_tokens
 import logging
 
 logger = logging.getLogger(__name__)
 
-def extract_and_format_sources(tool_messages: list[ToolMessage]) -> tuple[list[dict], str]:
-    """Parse Tavily results và format thành string"""
+_WORD_RE = re.compile(r"\w+")
+# Cắt passage theo câu/đoạn
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+PASSAGE_MAX_CHARS = 400
+# Hai nguồn có Jaccard shingle >= ngưỡng này coi là trùng nội dung (bài đăng lại)
+DUPLICATE_SIMILARITY = 0.8
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def normalize_url(url: str) -> str:
+    """Bỏ scheme, www, query tracking, fragment và dấu / cuối để so sánh URL"""
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = "&".join(p for p in parsed.query.split("&") if p and not p.startswith("utm_"))
+    return f"{host}{parsed.path.rstrip('/')}" + (f"?{query}" if query else "")
+
+
+def _shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    """Shingle ``size`` từ liên tiếp, rỗng nếu text ngắn hơn ``size`` từ (quá ít để so trùng)"""
+    words = _words(text)
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _split_passages(text: str) -> list[str]:
+    """Gom các câu liên tiếp thành passage <= PASSAGE_MAX_CHARS"""
+    passages, current = [], ""
+    for sentence in _SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if current and len(current) + len(sentence) + 1 > PASSAGE_MAX_CHARS:
+            passages.append(current)
+            current = ""
+        current = f"{current} {sentence}".strip()
+        while len(current) > PASSAGE_MAX_CHARS:
+            passages.append(current[:PASSAGE_MAX_CHARS])
+            current = current[PASSAGE_MAX_CHARS:]
+    if current:
+        passages.append(current)
+    return passages
+
+
+def parse_sources(tool_messages: list[ToolMessage]) -> list[dict]:
+    """Parse Tavily results, bỏ nguồn trùng URL hoặc trùng nội dung, đánh số [n] theo thứ tự còn lại"""
     sources = []
-    index = 1
-    
+    seen_urls = set()
+    seen_shingles = []
+
     for tool_msg in tool_messages:
         try:
             results = json.loads(tool_msg.content)
             items = results.get("results", [results])
-            
+
             for item in items:
-                if isinstance(item, dict) and item.get("url"):
-                    sources.append({
-                        "index": index,
-                        "title": item.get("title", "Nguồn không có tiêu đề"),
-                        "url": item["url"],
-                        "content": item.get("content", "")
-                    })
-                    index += 1
-                    
+                if not (isinstance(item, dict) and item.get("url")):
+                    continue
+                url_key = normalize_url(item["url"])
+                content = item.get("raw_content") or item.get("content", "")
+                shingles = _shingles(content)
+                # Nội dung rỗng/quá ngắn thì chỉ so trùng URL
+                if url_key in seen_urls or shingles and any(
+                    len(shingles & other) / len(shingles | other) >= DUPLICATE_SIMILARITY
+                    for other in seen_shingles
+                ):
+                    continue
+                seen_urls.add(url_key)
+                if shingles:
+                    seen_shingles.append(shingles)
+                sources.append({
+                    "index": len(sources) + 1,
+                    "title": item.get("title", "Nguồn không có tiêu đề"),
+                    "url": item["url"],
+                    "content": content
+                })
+
         except Exception as e:
             logger.error(f"❌ Lỗi parse tool result: {e}")
             continue
-    
+
+    return sources
+
+
+def pack_passages(sources: list[dict], query: str, token_budget: int) -> dict[int, list[str]]:
+    """Chọn passage liên quan nhất tới query cho vừa token budget.
+
+    Điểm = tổng IDF của các từ trong query xuất hiện trong passage. Lượt đầu
+    lấy passage tốt nhất của từng nguồn (theo thứ tự nguồn), lượt sau lấp phần
+    budget còn lại bằng các passage điểm cao nhất. Trả về {index: [passage]}
+    theo thứ tự xuất hiện trong nguồn.
+    """
+    candidates = []
+    for src in sources:
+        for position, passage in enumerate(_split_passages(src["content"])):
+            candidates.append((src["index"], position, passage, set(_words(passage))))
+
+    if not candidates:
+        return {}
+
+    document_freq = Counter(word for *_, words in candidates for word in words)
+    idf = {word: math.log(1 + len(candidates) / freq) for word, freq in document_freq.items()}
+    query_words = set(_words(query))
+
+    scored = []
+    for index, position, passage, words in candidates:
+        score = sum(idf[word] for word in query_words & words)
+        # Đoạn đầu bài thường là tóm tắt, ưu tiên nhẹ khi hòa điểm
+        scored.append((score + (0.1 if position == 0 else 0.0), index, position, passage))
+    scored.sort(key=lambda item: (-item[0], item[1], item[2]))
+
+    # Mỗi nguồn tốn thêm dòng tiêu đề + URL
+    header_tokens = {src["index"]: estimate_tokens(f"[{src['index']}] {src['title']}\nURL: {src['url']}\n") for src in sources}
+    selected: dict[int, dict[int, str]] = {}
+    used = 0
+
+    def take(index: int, position: int, passage: str) -> bool:
+        nonlocal used
+        cost = estimate_tokens(passage) + (0 if index in selected else header_tokens[index])
+        if used + cost > token_budget:
+            return False
+        selected.setdefault(index, {})[position] = passage
+        used += cost
+        return True
+
+    best_per_source = {}
+    for item in scored:
+        best_per_source.setdefault(item[1], item)
+    for index in sorted(best_per_source):
+        _, _, position, passage = best_per_source[index]
+        take(index, position, passage)
+
+    for _, index, position, passage in scored:
+        if position not in selected.get(index, {}):
+            take(index, position, passage)
+
+    return {index: [chosen[p] for p in sorted(chosen)] for index, chosen in selected.items()}
+
+
+def extract_and_format_sources(
+    tool_messages: list[ToolMessage],
+    query: str = "",
+    token_budget: int = 600,
+) -> tuple[list[dict], str]:
+    """Parse Tavily results, chọn passage theo query trong token budget và format thành string.
+
+    Số [n] của mỗi nguồn được đánh một lần sau khi bỏ trùng và không đổi khi
+    đóng gói; nguồn không còn passage nào vừa budget thì bị bỏ khỏi prompt.
+    """
+    sources = parse_sources(tool_messages)
+
     # Format sources
     if not sources:
         return sources, "Không có nguồn nào."
-    
+
+    packed = pack_passages(sources, query, token_budget)
+    sources = [src for src in sources if src["index"] in packed]
+
     formatted = []
     for src in sources:
         formatted.append(
             f"[{src['index']}] {src['title']}\n"
             f"URL: {src['url']}\n"
-            f"Nội dung: {src['content'][:500]}...\n"
+            f"Nội dung: {' … '.join(packed[src['index']])}\n"
         )
-   
+
     logger.info(f"📊 Extracted {len(sources)} sources")
-    return sources, "\n".join(formatted)
\ No newline at end of file
+    return sources, "\n".join(formatted)
@@ -0,0 +1,133 @@
+"""
+Update-id deduplication for Telegram webhook redeliveries.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class DedupBackend(Protocol):
+    async def add_if_absent(self, key: str) -> bool:
+        """Ghi key, trả về True nếu key chưa tồn tại"""
+        ...
+
+    async def discard(self, key: str) -> None:
+        ...
+
+
+class LocalDedupBackend:
+    """Index trong process: TTL + giới hạn số entry (bỏ entry cũ nhất khi đầy)"""
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._expires: OrderedDict[str, float] = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        # Entry được chèn theo thứ tự thời gian nên entry hết hạn luôn nằm ở đầu
+        while self._expires:
+            key, expires_at = next(iter(self._expires.items()))
+            if expires_at > now and len(self._expires) <= self.max_entries:
+                break
+            self._expires.popitem(last=False)
+
+    async def add_if_absent(self, key: str) -> bool:
+        now = time.monotonic()
+        self._evict(now)
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at > now:
+            return False
+        self._expires[key] = now + self.ttl
+        self._expires.move_to_end(key)
+        self._evict(now)
+        return True
+
+    async def discard(self, key: str) -> None:
+        self._expires.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+
+class RedisDedupBackend:
+    """Index dùng chung giữa các process qua ``SET NX EX``"""
+
+    def __init__(self, client, ttl: float = 3600.0, prefix: str = "supercat:update:"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    async def add_if_absent(self, key: str) -> bool:
+        return bool(await self.client.set(self.prefix + key, 1, nx=True, ex=self.ttl))
+
+    async def discard(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+
+class UpdateDeduplicator:
+    """Loại bỏ update bị Telegram gửi lại.
+
+    Luôn kiểm tra index local trước, rồi mới tới backend dùng chung (nếu có).
+    Lỗi của backend dùng chung được bỏ qua (fail open) để không chặn update thật.
+    """
+
+    def __init__(self, local: LocalDedupBackend, shared: Optional[DedupBackend] = None):
+        self.local = local
+        self.shared = shared
+        self.seen = 0
+        self.duplicates = 0
+        self.shared_errors = 0
+
+    async def is_duplicate(self, update_id) -> bool:
+        key = str(update_id)
+        self.seen += 1
+
+        if not await self.local.add_if_absent(key):
+            self.duplicates += 1
+            return True
+
+        if self.shared is not None:
+            try:
+                if not await self.shared.add_if_absent(key):
+                    self.duplicates += 1
+                    return True
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning(f"⚠️ Shared dedup backend error: {e}")
+
+        return False
+
+    async def forget(self, update_id) -> None:
+        """Bỏ đánh dấu update (khi xử lý lỗi và muốn Telegram gửi lại)"""
+        key = str(update_id)
+        await self.local.discard(key)
+        if self.shared is not None:
+            try:
+                await self.shared.discard(key)
+            except Exception as e:
+                logger.warning(f"⚠️ Shared dedup backend error: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis" if self.shared is not None else "local",
+            "entries": len(self.local),
+            "seen": self.seen,
+            "duplicates": self.duplicates,
+            "shared_errors": self.shared_errors,
+        }
+
+
+def build_deduplicator(settings) -> UpdateDeduplicator:
+    """Tạo deduplicator theo config, dùng Redis nếu có ``redis_url``"""
+    from utils.redis_client import get_redis
+
+    local = LocalDedupBackend(
+        ttl=settings.update_dedup_ttl_seconds,
+        max_entries=settings.update_dedup_max_entries,
+    )
+    client = get_redis()
+    shared = RedisDedupBackend(client, ttl=settings.update_dedup_ttl_seconds) if client else None
+    return UpdateDeduplicator(local, shared)
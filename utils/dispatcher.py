@@ -0,0 +1,135 @@
+"""
+Per-chat ordered, cross-chat concurrent update dispatcher.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update: Any) -> Optional[int]:
+    """Lấy chat id của update, None nếu update không gắn với chat nào"""
+    chat = getattr(update, "effective_chat", None)
+    return chat.id if chat else None
+
+
+class _Mailbox:
+    __slots__ = ("queue", "task")
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.task: Optional[asyncio.Task] = None
+
+
+class ChatDispatcher:
+    """Mỗi chat có một mailbox riêng: update trong cùng chat chạy tuần tự,
+    các chat khác nhau chạy song song, tổng số update đang chạy bị giới hạn
+    bởi ``max_concurrency``.
+
+    Mailbox rảnh quá ``idle_timeout`` giây sẽ tự bị dọn.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        max_concurrency: int = 8,
+        mailbox_size: int = 32,
+        idle_timeout: float = 60.0,
+        key: Callable[[Any], Hashable] = chat_key,
+    ):
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.mailbox_size = mailbox_size
+        self.idle_timeout = idle_timeout
+        self.key = key
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._mailboxes: dict[Hashable, _Mailbox] = {}
+
+        # Metrics
+        self.dispatched = 0
+        self.dropped = 0
+        self.failed = 0
+        self.reaped = 0
+        self._running = 0
+        # Thời gian từ lúc update vào hệ thống tới lúc handler bắt đầu chạy
+        self.wait_times: deque[float] = deque(maxlen=1024)
+
+    async def dispatch(self, update: Any, enqueued_at: Optional[float] = None) -> None:
+        """Đưa update vào mailbox của chat tương ứng (không chờ xử lý xong).
+
+        ``enqueued_at`` (``time.monotonic()``) là lúc update vào hệ thống, để
+        thời gian chờ đo được tính cả chặng trước mailbox.
+        """
+        key = self.key(update)
+        mailbox = self._mailboxes.get(key)
+        if mailbox is None:
+            mailbox = _Mailbox(self.mailbox_size)
+            self._mailboxes[key] = mailbox
+            mailbox.task = asyncio.create_task(self._run_mailbox(key, mailbox), name=f"mailbox-{key}")
+
+        try:
+            mailbox.queue.put_nowait((enqueued_at or time.monotonic(), update))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"⚠️ Mailbox của chat {key} đầy, bỏ update")
+            return
+
+        self.dispatched += 1
+
+    async def _run_mailbox(self, key: Hashable, mailbox: _Mailbox) -> None:
+        while True:
+            try:
+                enqueued_at, update = await asyncio.wait_for(mailbox.queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                # Không có await giữa check và xóa nên không thể lọt update mới
+                if mailbox.queue.empty():
+                    del self._mailboxes[key]
+                    self.reaped += 1
+                    return
+                continue
+
+            try:
+                async with self._semaphore:
+                    self.wait_times.append(time.monotonic() - enqueued_at)
+                    self._running += 1
+                    try:
+                        await self.handler(update)
+                    finally:
+                        self._running -= 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Lỗi xử lý update của chat {key}: {e}", exc_info=True)
+            finally:
+                mailbox.queue.task_done()
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Chờ các mailbox xử lý hết rồi hủy task"""
+        mailboxes = list(self._mailboxes.values())
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(m.queue.join() for m in mailboxes)),
+                timeout=drain_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Dispatcher drain timed out")
+
+        for mailbox in mailboxes:
+            mailbox.task.cancel()
+        await asyncio.gather(*(m.task for m in mailboxes), return_exceptions=True)
+        self._mailboxes.clear()
+
+    def stats(self) -> dict:
+        """Snapshot các chỉ số của dispatcher"""
+        return {
+            "active_mailboxes": len(self._mailboxes),
+            "pending": sum(m.queue.qsize() for m in self._mailboxes.values()),
+            "running": self._running,
+            "max_concurrency": self.max_concurrency,
+            "dispatched": self.dispatched,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "reaped": self.reaped,
+        }
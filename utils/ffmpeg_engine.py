@@ -0,0 +1,370 @@
+"""
+ffmpeg engine: probe một lần, seek phía input theo keyframe index, nhiều output trong một lần chạy.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import re
+import shutil
+import subprocess
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Literal, Optional
+
+from utils.async_exec import CancelToken, run_blocking, run_process, terminate
+
+logger = logging.getLogger(__name__)
+
+# Encoder cần cho các loại output, thiếu thì báo lỗi sớm thay vì để ffmpeg fail giữa chừng
+_WANTED_ENCODERS = ("libmp3lame", "aac", "libopus", "libx264", "mjpeg")
+
+# Định dạng audio output: (extension, tham số encode)
+AUDIO_FORMATS = {
+    "mp3": (".mp3", ("-c:a", "libmp3lame", "-q:a", "2")),
+    "m4a": (".m4a", ("-c:a", "aac", "-b:a", "128k")),
+    "opus": (".opus", ("-c:a", "libopus", "-b:a", "96k")),
+}
+
+# Kích thước chunk khi đọc stream tải về để pipe vào ffmpeg
+STREAM_CHUNK_BYTES = 1024 * 1024
+
+
+@dataclass
+class FFmpegCapabilities:
+    available: bool = False
+    version: str = ""
+    ffprobe: bool = False
+    encoders: frozenset = field(default_factory=frozenset)
+
+
+@dataclass
+class OutputSpec:
+    """Một output của lần chạy ffmpeg.
+
+    - ``copy``: đoạn [start, end) giữ nguyên codec (không decode)
+    - ``audio``: đoạn [start, end) chỉ lấy audio, encode theo ``audio_format`` ("copy" = giữ codec)
+    - ``thumbnail``: một frame JPEG tại ``start``
+    """
+
+    path: Path
+    kind: Literal["copy", "audio", "thumbnail"] = "copy"
+    start: float = 0.0
+    end: Optional[float] = None
+    audio_format: str = "mp3"
+
+
+class FFmpegEngine:
+    """Bọc lời gọi ffmpeg cho pipeline media.
+
+    - ``probe`` kiểm tra ffmpeg/ffprobe/encoder một lần (lúc khởi động), không chạy ``ffmpeg -version`` mỗi lần cắt
+    - ``keyframes`` lấy vị trí keyframe từ packet flags (không decode) và cache theo (file, size, mtime)
+    - ``run`` seek phía input tới keyframe ngay trước output sớm nhất, mọi output dùng chung một lần đọc
+    """
+
+    def __init__(self, binary: str = "ffmpeg", probe_binary: str = "ffprobe", index_cache_size: int = 64):
+        self.binary = binary
+        self.probe_binary = probe_binary
+        self.index_cache_size = index_cache_size
+        self.capabilities: Optional[FFmpegCapabilities] = None
+        self._probe_lock = asyncio.Lock()
+        self._index: OrderedDict[tuple, list[float]] = OrderedDict()
+
+        # Metrics
+        self.runs = 0
+        self.failures = 0
+        self.outputs = 0
+        self.total_ms = 0.0
+        self.index_hits = 0
+        self.index_misses = 0
+
+    # ==========================
+    # PROBE
+    # ==========================
+    async def probe(self) -> FFmpegCapabilities:
+        """Kiểm tra ffmpeg một lần, các lần sau trả về kết quả đã cache"""
+        if self.capabilities is not None:
+            return self.capabilities
+        async with self._probe_lock:
+            if self.capabilities is not None:
+                return self.capabilities
+            capabilities = FFmpegCapabilities()
+            if shutil.which(self.binary):
+                try:
+                    version = await run_process([self.binary, "-hide_banner", "-version"], timeout=10)
+                    encoders = await run_process([self.binary, "-hide_banner", "-encoders"], timeout=10)
+                    capabilities.available = True
+                    capabilities.version = version.stdout.split("\n", 1)[0]
+                    capabilities.encoders = frozenset(
+                        name for name in _WANTED_ENCODERS if re.search(rf"\s{name}\s", encoders.stdout)
+                    )
+                except (subprocess.CalledProcessError, asyncio.TimeoutError, OSError) as e:
+                    logger.warning(f"⚠️ ffmpeg probe failed: {e}")
+            capabilities.ffprobe = shutil.which(self.probe_binary) is not None
+            self.capabilities = capabilities
+
+        if capabilities.available:
+            logger.info(
+                f"🎬 {capabilities.version} | ffprobe={capabilities.ffprobe} | "
+                f"encoders={','.join(sorted(capabilities.encoders))}"
+            )
+        else:
+            logger.warning("⚠️ ffmpeg không được cài đặt, không tách đoạn/convert được")
+        return capabilities
+
+    async def require(self) -> FFmpegCapabilities:
+        capabilities = await self.probe()
+        if not capabilities.available:
+            raise FileNotFoundError("ffmpeg không được cài đặt: https://ffmpeg.org/download.html")
+        return capabilities
+
+    # ==========================
+    # KEYFRAME INDEX
+    # ==========================
+    async def start_time(self, path: str) -> float:
+        """``start_time`` của file (giây): khác 0 với file giữ timestamp gốc (``-copyts``, MPEG-TS)"""
+        capabilities = await self.require()
+        if capabilities.ffprobe:
+            result = await run_process([
+                self.probe_binary, "-v", "error", "-show_entries", "format=start_time", "-of", "csv=p=0", path,
+            ])
+            value = result.stdout.strip()
+        else:
+            # Không có ffprobe: ``ffmpeg -i`` in "Duration: ..., start: 29.976009, ..." ra stderr rồi thoát mã 1
+            result = await run_process([self.binary, "-hide_banner", "-i", path], check=False)
+            match = re.search(r"start: (-?[\d.]+)", result.stderr)
+            value = match.group(1) if match else ""
+        try:
+            return float(value)
+        except ValueError:
+            return 0.0
+
+    async def keyframes(self, path: str) -> list[float]:
+        """Thời điểm (giây) các keyframe của video stream đầu tiên, rỗng nếu không có video"""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        cached = self._index.get(key)
+        if cached is not None:
+            self._index.move_to_end(key)
+            self.index_hits += 1
+            return cached
+
+        self.index_misses += 1
+        capabilities = await self.require()
+        try:
+            if capabilities.ffprobe:
+                # ffprobe trả pts tuyệt đối, còn -ss phía input tính từ start_time của file
+                start = await self.start_time(path)
+                times = [t - start for t in await self._keyframes_ffprobe(path)]
+            else:
+                times = await self._keyframes_framecrc(path)
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"⚠️ Không lấy được keyframe index của {path}: {e.stderr[-200:] if e.stderr else e}")
+            times = []
+
+        self._index[key] = times
+        while len(self._index) > self.index_cache_size:
+            self._index.popitem(last=False)
+        return times
+
+    async def _keyframes_ffprobe(self, path: str) -> list[float]:
+        # Chỉ đọc packet flags, không decode
+        result = await run_process([
+            self.probe_binary, "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path,
+        ])
+        times = []
+        for line in result.stdout.splitlines():
+            pts, _, flags = line.partition(",")
+            if flags.startswith("K") and pts not in ("", "N/A"):
+                times.append(float(pts))
+        return sorted(times)
+
+    async def _keyframes_framecrc(self, path: str) -> list[float]:
+        """Không có ffprobe: stream copy ra framecrc, dòng không có ``F=`` là keyframe"""
+        result = await run_process([
+            self.binary, "-v", "error", "-i", path, "-map", "0:v:0?", "-c", "copy", "-f", "framecrc", "-",
+        ])
+        timebase = None
+        times = []
+        for line in result.stdout.splitlines():
+            if line.startswith("#media_type 0:") and line.split(":", 1)[1].strip() != "video":
+                # Không có video stream (file audio): không cần index
+                return []
+            if line.startswith("#tb 0:"):
+                num, den = line.split(":", 1)[1].strip().split("/")
+                timebase = int(num) / int(den)
+            elif timebase and not line.startswith("#") and "F=" not in line:
+                parts = line.split(",")
+                if len(parts) >= 3:
+                    times.append(int(parts[2]) * timebase)
+        return sorted(times)
+
+    @staticmethod
+    def snap(keyframes: list[float], t: float) -> float:
+        """Keyframe gần nhất không sau ``t`` (0 nếu không có index)"""
+        i = bisect.bisect_right(keyframes, t + 1e-3)
+        return keyframes[i - 1] if i else 0.0
+
+    # ==========================
+    # RUN
+    # ==========================
+    def _output_args(self, spec: OutputSpec, offset: float) -> list[str]:
+        """Tham số cho một output, thời gian tính từ vị trí input đã seek tới"""
+        args: list[str] = []
+        start = max(0.0, spec.start - offset)
+        if start > 0:
+            # Sau khi đã seek phía input, phần bỏ qua chỉ còn vài giây tới start
+            args += ["-ss", f"{start:.3f}"]
+        if spec.kind == "thumbnail":
+            return args + ["-map", "0:v:0", "-frames:v", "1", "-q:v", "2", "-y", str(spec.path)]
+        if spec.end is not None:
+            args += ["-t", f"{spec.end - spec.start:.3f}"]
+        if spec.kind == "audio":
+            codec_args = ("-c:a", "copy") if spec.audio_format == "copy" else AUDIO_FORMATS[spec.audio_format][1]
+            return args + ["-map", "0:a:0", "-vn", *codec_args, "-y", str(spec.path)]
+        return args + ["-map", "0", "-c", "copy", "-avoid_negative_ts", "make_zero", "-y", str(spec.path)]
+
+    async def run(self, input_file: str, outputs: list[OutputSpec], timeout: Optional[float] = None) -> list[Path]:
+        """Một lần chạy ffmpeg cho mọi output; đoạn copy được kéo về keyframe để không mất frame đầu"""
+        await self.require()
+        keyframes = await self.keyframes(input_file)
+
+        specs = []
+        for spec in outputs:
+            if spec.kind == "copy" and keyframes:
+                # Stream copy chỉ cắt được tại keyframe: bắt đầu đúng keyframe thay vì frame hỏng
+                spec = OutputSpec(spec.path, spec.kind, self.snap(keyframes, spec.start), spec.end)
+            specs.append(spec)
+
+        # Seek phía input tới keyframe trước output sớm nhất: ffmpeg nhảy thẳng tới đó
+        earliest = min(spec.start for spec in specs)
+        offset = self.snap(keyframes, earliest) if keyframes else earliest
+
+        cmd = [self.binary, "-hide_banner", "-v", "error"]
+        if offset > 0:
+            cmd += ["-ss", f"{offset:.3f}"]
+        cmd += ["-i", input_file]
+        for spec in specs:
+            cmd += self._output_args(spec, offset)
+
+        start = time.perf_counter()
+        try:
+            await run_process(cmd, timeout=timeout)
+        except BaseException:
+            self.failures += 1
+            raise
+        finally:
+            self.runs += 1
+            self.total_ms += (time.perf_counter() - start) * 1000
+
+        produced = [spec.path for spec in specs if spec.path.exists() and spec.path.stat().st_size > 0]
+        self.outputs += len(produced)
+        return produced
+
+    async def cut(self, input_file: str, start: float, end: float, output: Path,
+                  audio: bool = False, audio_format: str = "mp3") -> Optional[Path]:
+        """Tách một đoạn: video thì stream copy, audio thì encode ``audio_format`` (copy nếu nguồn đã đúng định dạng)"""
+        if audio:
+            same_format = input_file.lower().endswith(AUDIO_FORMATS[audio_format][0])
+            spec = OutputSpec(Path(output), "audio", start, end, "copy" if same_format else audio_format)
+        else:
+            spec = OutputSpec(Path(output), "copy", start, end)
+        produced = await self.run(input_file, [spec])
+        return produced[0] if produced else None
+
+    async def encode_audio_stream(self, chunks: Iterable[bytes], output: Path, audio_format: str = "mp3",
+                                  token: Optional[CancelToken] = None) -> Path:
+        """Pipe từng chunk đang tải thẳng vào stdin của ffmpeg, chỉ ghi ra file audio đã encode.
+
+        ``chunks`` là iterator blocking (đọc mạng) nên được duyệt trong blocking executor;
+        ghi vào pipe bị chặn khi ffmpeg chưa kịp đọc, nên bộ nhớ và đĩa dùng không tăng theo
+        độ dài video. Lỗi hoặc bị hủy giữa chừng thì kill ffmpeg và xóa file dở.
+        """
+        await self.require()
+        # Token riêng để dừng thread feed khi ffmpeg lỗi: không bật token của caller
+        # (caller còn dùng nó cho đường fallback), chỉ hủy thật mới lan ra ngoài
+        feed_token = CancelToken()
+        output = Path(output)
+        read_fd, write_fd = os.pipe()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.binary, "-hide_banner", "-v", "error",
+                "-i", "pipe:0",
+                "-vn", *AUDIO_FORMATS[audio_format][1],
+                "-y", str(output),
+                stdin=read_fd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+            )
+        except BaseException:
+            os.close(write_fd)
+            raise
+        finally:
+            os.close(read_fd)
+        pipe = open(write_fd, "wb", buffering=0)
+        stderr_task = asyncio.create_task(process.stderr.read())
+
+        def feed() -> None:
+            # Đóng pipe là tín hiệu EOF cho ffmpeg. Lỗi đọc ``chunks`` (mạng, HTTP)
+            # lan ra ngoài để không encode một file bị cụt
+            with pipe:
+                for chunk in chunks:
+                    feed_token.raise_if_cancelled()
+                    if token is not None:
+                        token.raise_if_cancelled()
+                    try:
+                        pipe.write(chunk)
+                    except BrokenPipeError:
+                        # ffmpeg thoát sớm (input hỏng): lỗi thật nằm ở stderr bên dưới
+                        return
+
+        start = time.perf_counter()
+        try:
+            await run_blocking(feed, token=feed_token)
+            returncode = await process.wait()
+            stderr = (await stderr_task).decode("utf-8", errors="ignore")
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, self.binary, "", stderr)
+        except BaseException as e:
+            self.failures += 1
+            feed_token.cancel()
+            if isinstance(e, asyncio.CancelledError) and token is not None:
+                token.cancel()
+            await asyncio.shield(terminate(process))
+            # Bị hủy trước khi feed kịp chạy thì pipe vẫn còn mở
+            pipe.close()
+            stderr_task.cancel()
+            output.unlink(missing_ok=True)
+            raise
+        finally:
+            self.runs += 1
+            self.total_ms += (time.perf_counter() - start) * 1000
+
+        self.outputs += 1
+        return output
+
+    def stats(self) -> dict:
+        capabilities = self.capabilities
+        lookups = self.index_hits + self.index_misses
+        return {
+            "available": capabilities.available if capabilities else None,
+            "version": capabilities.version if capabilities else None,
+            "ffprobe": capabilities.ffprobe if capabilities else None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "outputs": self.outputs,
+            "avg_ms": round(self.total_ms / self.runs, 1) if self.runs else 0.0,
+            "keyframe_index_entries": len(self._index),
+            "keyframe_index_hit_rate": round(self.index_hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+@lru_cache()
+def get_ffmpeg_engine() -> FFmpegEngine:
+    """Engine dùng chung để capability probe và keyframe index được tái sử dụng"""
+    return FFmpegEngine()
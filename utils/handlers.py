@@ -9,12 +9,16 @@ from telegram.ext import (
     ContextTypes
 )
 import logging
+import time
 from utils.constants import BotMessages, LogMessages
 from utils.exceptions import HandlerError
+from utils.streaming import TelegramStreamEditor
+from utils.incoming_media import IncomingMedia, get_incoming_media_store
+from config.config import get_settings
 from agents.orchestrator import OrchestratorAgent
-import os
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 
 class BotHandlers:
@@ -34,6 +38,7 @@ class BotHandlers:
     async def text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle text messages with status updates."""
         try:
+            started_at = time.perf_counter()
             message = update.message.text
             chat_id = update.message.chat_id
             user_name = update.effective_user.last_name
@@ -44,16 +49,24 @@ class BotHandlers:
             # Gửi tin nhắn placeholder ban đầu
             status_message = await update.message.reply_text("⏳ Đang xử lý...")
             
-            # Generate answer với callback
-            response = await orchestration_agent.generate_answer(message)
+            editor = TelegramStreamEditor(
+                status_message,
+                reply=update.message.reply_text,
+                min_interval=settings.stream_edit_interval,
+                started_at=started_at,
+            )
             
-            # Edit tin nhắn cuối cùng thành câu trả lời
-            try:
-                await status_message.edit_text(response)
-            except Exception as e:
-                # Nếu edit thất bại (tin nhắn quá cũ), gửi tin nhắn mới
-                logger.warning(f"Failed to edit message, sending new one: {e}")
-                await update.message.reply_text(response)
+            # Generate answer, token được edit dần vào placeholder
+            response = await orchestration_agent.generate_answer(
+                message,
+                on_token=editor.update if settings.stream_answers else None,
+            )
+            
+            # Edit tin nhắn cuối cùng thành câu trả lời (luôn chạy, kể cả khi đã stream)
+            await editor.finish(response)
+
+            # Tóm tắt lịch sử sau khi đã trả lời, không nằm trên critical path
+            context.application.create_task(orchestration_agent.refresh_summary())
                 
         except Exception as e:
             logger.error(f"Error in text message: {e}")
@@ -85,17 +98,14 @@ class BotHandlers:
             if not caption or not caption.startswith("/sc"):
                 return
             chat_id = update.message.chat_id
-            video_file_id = update.message.video.file_id
-            video_file = await context.bot.get_file(video_file_id)
-            
-            # Tạo thư mục videos nếu không tồn tại
-            os.makedirs("videos", exist_ok=True)
-            # Tải video về
-            video_path = f"videos/{video_file_id}.mp4"
-            await video_file.download_to_drive(video_path)
-
-            # Gửi lại video
-            await context.bot.send_video(chat_id=chat_id, video=video_file_id, caption=caption)
+            # Chỉ ghi nhận file theo file_unique_id, không tải byte nào về
+            media = IncomingMedia.from_message(update.message)
+            if media is None:
+                return
+            await get_incoming_media_store().remember(media)
+
+            # Gửi lại video bằng file_id, không cần tải về
+            await context.bot.send_video(chat_id=chat_id, video=media.file_id, caption=caption)
         except Exception as e:
             logger.error(f"Error in video message: {e}")
             raise HandlerError(f"Failed to handle video message: {e}")
@@ -0,0 +1,120 @@
+"""
+Incoming media: ghi nhận file user gửi vào chat theo file_unique_id, không tải về.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from utils.async_exec import run_blocking
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS incoming (
+    file_unique_id TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    seen_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS incoming_seen_at ON incoming (seen_at);
+"""
+
+# Số lần ghi giữa hai lần dọn entry cũ
+_PRUNE_EVERY = 100
+
+
+@dataclass
+class IncomingMedia:
+    """Handle của một file trong tin nhắn, chưa có byte nào trên đĩa"""
+    file_id: str
+    file_unique_id: str
+    kind: str
+    file_size: int = 0
+
+    @classmethod
+    def from_message(cls, message) -> Optional["IncomingMedia"]:
+        for kind in ("video", "video_note", "audio", "voice", "document"):
+            attachment = getattr(message, kind, None)
+            if attachment is not None:
+                return cls(attachment.file_id, attachment.file_unique_id, kind, attachment.file_size or 0)
+        return None
+
+
+class IncomingMediaStore:
+    """Index ``file_unique_id`` → ``file_id`` của file user gửi vào chat.
+
+    Bot chỉ cần ``file_id`` để gửi lại nên không tải byte nào về; cùng một clip
+    forward nhiều lần (``file_id`` khác, ``file_unique_id`` giống) chỉ có một entry.
+    Chỉ giữ ``max_entries`` file gặp gần nhất.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+
+        # Metrics
+        self.seen = 0
+        self.repeats = 0
+        self.pruned = 0
+
+    async def remember(self, media: Optional[IncomingMedia]) -> bool:
+        """Ghi nhận file vừa nhận, True nếu clip này đã từng được gửi tới bot"""
+        if media is None:
+            return False
+        return await run_blocking(self._remember, media)
+
+    def _remember(self, media: IncomingMedia) -> bool:
+        with self._db_lock:
+            known = self._conn.execute(
+                "SELECT 1 FROM incoming WHERE file_unique_id=?", (media.file_unique_id,)
+            ).fetchone() is not None
+            self._conn.execute(
+                """
+                INSERT INTO incoming VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(file_unique_id) DO UPDATE SET file_id=excluded.file_id, seen_at=excluded.seen_at
+                """,
+                (media.file_unique_id, media.file_id, media.kind, media.file_size, time.time()),
+            )
+            if self.seen % _PRUNE_EVERY == 0:
+                # Bỏ các file gặp lâu nhất, chỉ giữ max_entries entry
+                self.pruned += self._conn.execute(
+                    """
+                    DELETE FROM incoming WHERE file_unique_id IN (
+                        SELECT file_unique_id FROM incoming ORDER BY seen_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,),
+                ).rowcount
+            self._conn.commit()
+        self.seen += 1
+        self.repeats += known
+        return known
+
+    def stats(self) -> dict:
+        with self._db_lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM incoming").fetchone()[0]
+        return {"entries": entries, "seen": self.seen, "repeats": self.repeats, "pruned": self.pruned}
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._conn.close()
+
+
+@lru_cache()
+def get_incoming_media_store() -> IncomingMediaStore:
+    """Index dùng chung, lưu ở INCOMING_MEDIA_DB"""
+    from config.config import get_settings
+
+    settings = get_settings()
+    return IncomingMediaStore(settings.incoming_media_db, settings.incoming_media_max_entries)
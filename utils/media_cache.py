@@ -0,0 +1,290 @@
+"""
+Content-addressed media cache: file nguồn đã tải được giữ lại theo (nền tảng, video id, định dạng).
+"""
+import hashlib
+import logging
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from utils.async_exec import KeyedLock
+
+logger = logging.getLogger(__name__)
+
+# Định dạng file nguồn được cache
+FORMAT_VIDEO = "video"
+FORMAT_AUDIO = "audio"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    platform TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    format TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (platform, video_id, format)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS media_last_used ON media (last_used);
+"""
+
+# (nền tảng, regex lấy id từ path) — id ổn định dù URL khác nhau (share link, tracking param, m.)
+_PATH_ID_PATTERNS = [
+    ("youtube", re.compile(r"^/(?:shorts|embed|live|v)/([\w-]{11})")),
+    ("tiktok", re.compile(r"/video/(\d+)")),
+    ("instagram", re.compile(r"^/(?:p|reel|reels|tv)/([\w-]+)")),
+    ("x", re.compile(r"/status/(\d+)")),
+    ("reddit", re.compile(r"/comments/(\w+)")),
+    ("vimeo", re.compile(r"^/(?:video/)?(\d+)")),
+    ("dailymotion", re.compile(r"^/video/(\w+)")),
+]
+
+_PLATFORM_DOMAINS = {
+    "youtube.com": "youtube",
+    "youtu.be": "youtube",
+    "facebook.com": "facebook",
+    "fb.watch": "facebook",
+    "reddit.com": "reddit",
+    "twitter.com": "x",
+    "x.com": "x",
+    "tiktok.com": "tiktok",
+    "instagram.com": "instagram",
+    "vimeo.com": "vimeo",
+    "dailymotion.com": "dailymotion",
+}
+
+
+def canonical_media_id(url: str) -> Optional[Tuple[str, str]]:
+    """(nền tảng, video id) chuẩn hóa từ URL, None nếu không nhận ra nền tảng.
+
+    Nền tảng không có id rõ ràng trong path (vd: Facebook) dùng hash của domain + path (+ tham số v).
+    """
+    try:
+        parsed = urlparse(url.strip())
+    except ValueError:
+        return None
+    domain = parsed.netloc.lower().split(":")[0]
+    for prefix in ("www.", "m.", "mobile.", "vm.", "old."):
+        if domain.startswith(prefix):
+            domain = domain[len(prefix):]
+
+    platform = next((name for host, name in _PLATFORM_DOMAINS.items() if domain == host or domain.endswith("." + host)), None)
+    if platform is None:
+        return None
+
+    path = parsed.path.rstrip("/")
+    if platform == "youtube":
+        if domain == "youtu.be":
+            video_id = path.lstrip("/")[:11]
+            return (platform, video_id) if video_id else None
+        video_id = parse_qs(parsed.query).get("v", [None])[0]
+        if video_id:
+            return platform, video_id[:11]
+
+    for name, pattern in _PATH_ID_PATTERNS:
+        if name == platform:
+            match = pattern.search(path)
+            if match:
+                return platform, match.group(1)
+
+    # Facebook watch/?v=<id>: id nằm trong query
+    query_id = parse_qs(parsed.query).get("v", [""])[0]
+    if not path and not query_id:
+        return None
+    digest = hashlib.sha1(f"{domain}{path}?{query_id}".lower().encode()).hexdigest()[:16]
+    return platform, f"u{digest}"
+
+
+@dataclass
+class CachedMedia:
+    platform: str
+    video_id: str
+    format: str
+    path: Path
+    size: int
+
+
+class MediaCache:
+    """Cache file nguồn trên đĩa, index bằng SQLite, evict LRU theo tổng dung lượng.
+
+    - Mỗi entry nằm trong thư mục riêng ``<root>/<platform>/<id>/<format>/`` và giữ
+      nguyên tên file gốc, nên tên file output (lấy từ tiêu đề) không đổi
+    - ``lock`` gom các job cùng tải một video: job sau đợi job trước rồi dùng cache
+    - Entry lấy bằng ``get``/``put`` với ``pin=True`` không bị evict cho tới khi
+      ``unpin``, nên job đang tách đoạn từ file cache không mất file giữa chừng
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(self.root / "index.db", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+        self._key_locks = KeyedLock()
+        # (platform, video_id, format) -> số job đang dùng file, đọc/ghi dưới _db_lock
+        self._pins: dict[Tuple[str, str, str], int] = {}
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def lock(self, platform: str, video_id: str):
+        """Async context manager giữ lock của một video"""
+        return self._key_locks((platform, video_id))
+
+    def _pin(self, key: Tuple[str, str, str]) -> None:
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, platform: str, video_id: str, fmt: str) -> None:
+        """Trả lại entry đã pin, entry lại có thể bị evict"""
+        key = (platform, video_id, fmt)
+        with self._db_lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+
+    def get(self, platform: str, video_id: str, fmt: str, pin: bool = False) -> Optional[CachedMedia]:
+        """Entry còn file trên đĩa thì cập nhật last_used và trả về, không thì None.
+
+        ``pin=True``: giữ entry khỏi bị evict tới khi gọi ``unpin``.
+        """
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT path, size FROM media WHERE platform=? AND video_id=? AND format=?",
+                (platform, video_id, fmt),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            path = Path(row[0])
+            if not path.exists():
+                # File bị xóa ngoài cache: bỏ entry
+                self._conn.execute(
+                    "DELETE FROM media WHERE platform=? AND video_id=? AND format=?", (platform, video_id, fmt)
+                )
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE media SET last_used=? WHERE platform=? AND video_id=? AND format=?",
+                (time.time(), platform, video_id, fmt),
+            )
+            self._conn.commit()
+            if pin:
+                self._pin((platform, video_id, fmt))
+        self.hits += 1
+        return CachedMedia(platform, video_id, fmt, path, row[1])
+
+    def peek(self, platform: str, video_id: str, fmt: str) -> bool:
+        """Có entry hay không, không tính vào metrics và không đổi thứ tự LRU"""
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT path FROM media WHERE platform=? AND video_id=? AND format=?", (platform, video_id, fmt)
+            ).fetchone()
+        return row is not None and Path(row[0]).exists()
+
+    def put(self, platform: str, video_id: str, fmt: str, source: str, pin: bool = False) -> Optional[CachedMedia]:
+        """Chuyển file đã tải vào cache (move, không copy) rồi evict nếu vượt ngân sách.
+
+        IO blocking: gọi qua ``run_blocking``. File lớn hơn cả ngân sách thì không cache.
+        ``pin=True`` như ``get``.
+        """
+        source_path = Path(source)
+        size = source_path.stat().st_size
+        if size > self.max_bytes:
+            return None
+
+        entry_dir = self.root / platform / video_id / fmt
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        target = entry_dir / source_path.name
+        shutil.move(str(source_path), target)
+
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media (platform, video_id, format, path, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (platform, video_id, fmt, str(target), size, now, now),
+            )
+            self._conn.commit()
+            if pin:
+                self._pin((platform, video_id, fmt))
+        self.stores += 1
+        logger.info(f"💽 Cached {platform}/{video_id}/{fmt}: {size / (1024 * 1024):.1f} MB")
+        self.evict(keep=(platform, video_id, fmt))
+        return CachedMedia(platform, video_id, fmt, target, size)
+
+    def evict(self, keep: Optional[Tuple[str, str, str]] = None) -> None:
+        """Xóa entry dùng lâu nhất cho tới khi tổng dung lượng nằm trong ngân sách.
+
+        Entry đang được pin bị bỏ qua, cache có thể tạm vượt ngân sách.
+        """
+        with self._db_lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM media").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self._conn.execute(
+                "SELECT platform, video_id, format, path, size FROM media ORDER BY last_used"
+            ).fetchall()
+            for platform, video_id, fmt, path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if (platform, video_id, fmt) == keep or (platform, video_id, fmt) in self._pins:
+                    continue
+                shutil.rmtree(Path(path).parent, ignore_errors=True)
+                self._conn.execute(
+                    "DELETE FROM media WHERE platform=? AND video_id=? AND format=?", (platform, video_id, fmt)
+                )
+                total -= size
+                self.evictions += 1
+                self.evicted_bytes += size
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._db_lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM media").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "pinned": len(self._pins),
+            "size_mb": round(total / (1024 * 1024), 1),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "evicted_mb": round(self.evicted_bytes / (1024 * 1024), 1),
+        }
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._conn.close()
+
+
+@lru_cache()
+def get_media_cache() -> Optional[MediaCache]:
+    """Media cache dùng chung, None nếu tắt bằng MEDIA_CACHE_ENABLED"""
+    from config.config import get_settings
+
+    settings = get_settings()
+    if not settings.media_cache_enabled:
+        return None
+    logger.info(f"💽 Media cache: {settings.media_cache_dir} ({settings.media_cache_max_mb:.0f} MB)")
+    return MediaCache(settings.media_cache_dir, int(settings.media_cache_max_mb * 1024 * 1024))
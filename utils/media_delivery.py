@@ -0,0 +1,211 @@
+"""
+Media delivery: upload mỗi artifact lên Telegram một lần, các lần sau gửi lại bằng file_id.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from telegram.error import BadRequest
+
+from utils.async_exec import KeyedLock
+from utils.media_cache import canonical_media_id
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn upload của Bot API
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    artifact_key TEXT PRIMARY KEY,
+    media_type TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    file_unique_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _seconds(value: Optional[str]) -> str:
+    """"1:30", "01:30" và "90" cùng ra "90" để cùng một đoạn có cùng key"""
+    if value is None:
+        return ""
+    try:
+        return str(sum(int(part) * 60 ** i for i, part in enumerate(reversed(value.strip().split(":")))))
+    except ValueError:
+        return value.strip()
+
+
+def artifact_key(url: str, audio_only: bool, start_time: Optional[str] = None,
+                 end_time: Optional[str] = None, audio_format: str = "mp3") -> Optional[str]:
+    """Key của file kết quả: video gốc (nền tảng + id) + loại + đoạn, None nếu không nhận ra video"""
+    media_id = canonical_media_id(url)
+    if media_id is None:
+        return None
+    kind = f"audio.{audio_format}" if audio_only else "video"
+    segment = f"{_seconds(start_time)}-{_seconds(end_time)}" if start_time and end_time else "full"
+    return f"{media_id[0]}/{media_id[1]}/{kind}/{segment}"
+
+
+class StaleFileIdError(Exception):
+    """file_id đã lưu không còn dùng được và không có file local để upload lại"""
+
+
+class MediaDelivery:
+    """Gửi file kết quả vào chat, nhớ file_id Telegram trả về theo artifact key.
+
+    - Lần đầu: upload file, lưu ``file_id``/``file_unique_id`` vào index SQLite
+    - Các lần sau (chat nào cũng được): gửi bằng ``file_id``, không upload lại byte nào
+    - ``file_id`` không còn hợp lệ thì bỏ entry và upload lại nếu còn file,
+      không còn file thì raise ``StaleFileIdError`` để caller tạo lại file
+    """
+
+    def __init__(self, path: str, upload_limit: int = TELEGRAM_UPLOAD_LIMIT):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.upload_limit = upload_limit
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+        # Lock theo artifact, tự xóa khi không còn job nào đợi
+        self._key_locks = KeyedLock()
+
+        # Metrics
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.upload_ms = 0.0
+        self.file_id_sends = 0
+        self.file_id_ms = 0.0
+        self.stale = 0
+        self.too_large = 0
+
+    # ==========================
+    # INDEX
+    # ==========================
+    def lookup(self, key: Optional[str]) -> Optional[tuple[str, str]]:
+        """(media_type, file_id) đã lưu cho artifact"""
+        if not key:
+            return None
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT media_type, file_id FROM deliveries WHERE artifact_key=?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def known(self, key: Optional[str]) -> bool:
+        return self.lookup(key) is not None
+
+    def _record(self, key: str, media_type: str, media) -> None:
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, media_type, media.file_id, media.file_unique_id, media.file_size or 0, time.time()),
+            )
+            self._conn.commit()
+
+    def forget(self, key: str) -> None:
+        with self._db_lock:
+            self._conn.execute("DELETE FROM deliveries WHERE artifact_key=?", (key,))
+            self._conn.commit()
+
+    # ==========================
+    # SEND
+    # ==========================
+    @staticmethod
+    async def _send(bot, chat_id: int, media_type: str, media, caption: str):
+        if media_type == "audio":
+            return await bot.send_audio(chat_id=chat_id, audio=media, caption=caption)
+        if media_type == "video":
+            return await bot.send_video(chat_id=chat_id, video=media, caption=caption, supports_streaming=True)
+        return await bot.send_document(chat_id=chat_id, document=media, caption=caption)
+
+    async def deliver(self, bot, chat_id: int, key: Optional[str], path: Optional[Path],
+                      audio: bool = False, caption: str = "") -> str:
+        """Gửi artifact vào chat. Trả về "file_id", "upload" hoặc "too_large"."""
+        if not key:
+            return await self._upload(bot, chat_id, None, path, audio, caption)
+
+        # Hai job cùng artifact xong cùng lúc: job sau đợi để dùng file_id của job trước
+        async with self._key_locks(key):
+            cached = self.lookup(key)
+            if cached:
+                media_type, file_id = cached
+                start = time.perf_counter()
+                try:
+                    await self._send(bot, chat_id, media_type, file_id, caption)
+                    self.file_id_sends += 1
+                    self.file_id_ms += (time.perf_counter() - start) * 1000
+                    logger.info(f"♻️ Sent {key} by file_id")
+                    return "file_id"
+                except BadRequest as e:
+                    logger.warning(f"⚠️ file_id của {key} không dùng được ({e}), upload lại")
+                    self.stale += 1
+                    self.forget(key)
+                    if path is None or not path.exists():
+                        raise StaleFileIdError(key) from e
+            return await self._upload(bot, chat_id, key, path, audio, caption)
+
+    async def _upload(self, bot, chat_id: int, key: Optional[str], path: Optional[Path],
+                      audio: bool, caption: str) -> str:
+        if path is None or not path.exists():
+            raise FileNotFoundError(f"Không còn file để upload cho {key}")
+        size = path.stat().st_size
+        if size > self.upload_limit:
+            self.too_large += 1
+            await bot.send_message(
+                chat_id=chat_id,
+                text=f"{caption}\n⚠️ File quá {self.upload_limit // (1024 * 1024)}MB, không gửi qua Telegram được.",
+            )
+            return "too_large"
+
+        start = time.perf_counter()
+        with path.open("rb") as media:
+            message = await self._send(bot, chat_id, "audio" if audio else "video", media, caption)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.uploads += 1
+        self.upload_bytes += size
+        self.upload_ms += elapsed_ms
+        logger.info(f"📤 Uploaded {path.name}: {size / (1024 * 1024):.1f} MB in {elapsed_ms:.0f}ms")
+
+        # Telegram có thể đổi loại (vd: video không phải MP4 thành document)
+        for media_type in ("audio", "video", "document"):
+            media = getattr(message, media_type, None)
+            if media is not None:
+                if key:
+                    self._record(key, media_type, media)
+                break
+        return "upload"
+
+    def stats(self) -> dict:
+        with self._db_lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+        sends = self.uploads + self.file_id_sends
+        return {
+            "entries": entries,
+            "uploads": self.uploads,
+            "upload_mb": round(self.upload_bytes / (1024 * 1024), 1),
+            "avg_upload_ms": round(self.upload_ms / self.uploads, 1) if self.uploads else 0.0,
+            "file_id_sends": self.file_id_sends,
+            "avg_file_id_ms": round(self.file_id_ms / self.file_id_sends, 1) if self.file_id_sends else 0.0,
+            "file_id_rate": round(self.file_id_sends / sends, 3) if sends else 0.0,
+            "stale": self.stale,
+            "too_large": self.too_large,
+        }
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._conn.close()
+
+
+@lru_cache()
+def get_media_delivery() -> MediaDelivery:
+    """Delivery dùng chung, index file_id lưu ở MEDIA_DELIVERY_DB"""
+    from config.config import get_settings
+
+    return MediaDelivery(get_settings().media_delivery_db)
@@ -0,0 +1,407 @@
+"""
+Background media jobs: download/cut chạy nền, lượt chat chỉ nhận job id.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Awaitable, Callable, Final, Optional
+
+from utils.media_cache import canonical_media_id, get_media_cache
+from utils.media_delivery import StaleFileIdError, artifact_key, get_media_delivery
+from utils.yt_downloader import MultiPlatformExtractor
+
+logger = logging.getLogger(__name__)
+
+
+class JobState:
+    QUEUED: Final[str] = "queued"
+    DOWNLOADING: Final[str] = "downloading"
+    CUTTING: Final[str] = "cutting"
+    UPLOADING: Final[str] = "uploading"
+    DONE: Final[str] = "done"
+    FAILED: Final[str] = "failed"
+    CANCELLED: Final[str] = "cancelled"
+
+    FINISHED: Final[frozenset] = frozenset({DONE, FAILED, CANCELLED})
+
+
+@dataclass
+class MediaJob:
+    id: str
+    chat_id: Optional[int]
+    url: str
+    platform: str
+    audio_only: bool = False
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    output_filename: Optional[str] = None
+    # Key của file kết quả để gửi lại bằng file_id Telegram
+    artifact_key: Optional[str] = None
+    state: str = JobState.QUEUED
+    error: Optional[str] = None
+    output_path: Optional[Path] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in JobState.FINISHED
+
+    def describe(self) -> str:
+        """Mô tả ngắn cho tool trả về LLM"""
+        kind = "audio" if self.audio_only else "video"
+        segment = f" đoạn {self.start_time}-{self.end_time}" if self.start_time and self.end_time else ""
+        line = f"🆔 {self.id}: {kind}{segment} từ {self.platform} — trạng thái: {self.state}"
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            line += f" ({elapsed:.0f}s)"
+        if self.error:
+            line += f"\n❌ {self.error}"
+        return line
+
+
+Notifier = Callable[[MediaJob], Awaitable[None]]
+
+
+class MediaJobManager:
+    """Hàng đợi job media với số slot worker có giới hạn và giới hạn song song theo nền tảng.
+
+    - ``submit`` trả về job ngay, job chạy ``MultiPlatformExtractor.aprocess`` ở nền
+    - Job đợi slot của nền tảng trước rồi mới lấy slot worker, nên job của nền tảng
+      đang đầy không chiếm worker của các nền tảng khác
+    - ``notifier`` (đặt lúc khởi động bot) gửi kết quả vào chat khi job xong
+    - ``cancel`` hủy job đang đợi hoặc đang chạy (process con bị kill)
+    """
+
+    def __init__(
+        self,
+        workers: int = 3,
+        queue_size: int = 32,
+        platform_limits: Optional[dict[str, int]] = None,
+        default_platform_limit: int = 2,
+        job_timeout: float = 900.0,
+        keep_finished: int = 200,
+        range_margin: Optional[float] = None,
+        audio_format: str = "mp3",
+    ):
+        self.num_workers = workers
+        self.queue_size = queue_size
+        # Key chuẩn như canonical_media_id: youtube, x, tiktok, ...
+        self.platform_limits = {name.lower(): limit for name, limit in (platform_limits or {}).items()}
+        self.default_platform_limit = default_platform_limit
+        self.job_timeout = job_timeout
+        self.keep_finished = keep_finished
+        self.range_margin = range_margin
+        self.audio_format = audio_format
+        self.notifier: Optional[Notifier] = None
+        self._jobs: OrderedDict[str, MediaJob] = OrderedDict()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._platform_semaphores: dict[str, asyncio.Semaphore] = {}
+
+        # Metrics
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    # ==========================
+    # LIFECYCLE
+    # ==========================
+    def start(self, notifier: Optional[Notifier] = None) -> None:
+        if notifier is not None:
+            self.notifier = notifier
+        if self._slots is not None:
+            return
+        self._slots = asyncio.Semaphore(self.num_workers)
+        logger.info(f"🎞️ Media job manager started: workers={self.num_workers}")
+
+    async def stop(self) -> None:
+        """Hủy mọi job đang chạy/đang đợi rồi dừng worker"""
+        for job in self._jobs.values():
+            if not job.finished:
+                self._finish(job, JobState.CANCELLED, "Bot đang tắt")
+                if job.task is not None:
+                    job.task.cancel()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._slots = None
+
+    # ==========================
+    # API
+    # ==========================
+    def submit(
+        self,
+        chat_id: Optional[int],
+        url: str,
+        platform: str,
+        audio_only: bool = False,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        output_filename: Optional[str] = None,
+    ) -> Optional[MediaJob]:
+        """Đưa job vào hàng đợi, None nếu hàng đợi đầy"""
+        self.start()
+        if self._waiting() >= self.queue_size:
+            self.rejected += 1
+            logger.warning(f"⚠️ Media job queue full, rejected {url}")
+            return None
+
+        job = MediaJob(
+            id=uuid.uuid4().hex[:8],
+            chat_id=chat_id,
+            url=url,
+            platform=platform,
+            audio_only=audio_only,
+            start_time=start_time,
+            end_time=end_time,
+            output_filename=output_filename,
+            artifact_key=artifact_key(url, audio_only, start_time, end_time, self.audio_format),
+        )
+        self._jobs[job.id] = job
+        task = asyncio.create_task(self._process(job), name=f"media-job-{job.id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.submitted += 1
+        self._trim()
+        logger.info(f"🆕 Media job {job.id} queued: {url}")
+        return job
+
+    def get(self, job_id: str) -> Optional[MediaJob]:
+        return self._jobs.get(job_id)
+
+    def jobs_for_chat(self, chat_id: Optional[int]) -> list[MediaJob]:
+        return [job for job in self._jobs.values() if job.chat_id == chat_id]
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        self._finish(job, JobState.CANCELLED)
+        if job.task is not None:
+            # Job đang chạy: cancel kéo theo kill yt-dlp/ffmpeg hoặc dừng upload
+            job.task.cancel()
+        logger.info(f"🛑 Media job {job_id} cancelled")
+        return True
+
+    # ==========================
+    # WORKER
+    # ==========================
+    @staticmethod
+    def _platform_key(job: MediaJob) -> str:
+        """Tên nền tảng chuẩn (youtube, x, ...) thay cho tên hiển thị ("YouTube", "X (Twitter)")"""
+        media_id = canonical_media_id(job.url)
+        return media_id[0] if media_id else job.platform.lower()
+
+    def _platform_semaphore(self, platform: str) -> asyncio.Semaphore:
+        semaphore = self._platform_semaphores.get(platform)
+        if semaphore is None:
+            limit = self.platform_limits.get(platform, self.default_platform_limit)
+            semaphore = self._platform_semaphores[platform] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def _finish(self, job: MediaJob, state: str, error: Optional[str] = None) -> None:
+        if job.finished:
+            return
+        job.state = state
+        job.error = error
+        job.finished_at = time.time()
+        if state == JobState.DONE:
+            self.completed += 1
+        elif state == JobState.FAILED:
+            self.failed += 1
+        else:
+            self.cancelled += 1
+
+    def _waiting(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.state == JobState.QUEUED)
+
+    def _trim(self) -> None:
+        """Chỉ giữ ``keep_finished`` job đã xong gần nhất để tra trạng thái"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    async def _process(self, job: MediaJob) -> None:
+        """Chờ slot nền tảng rồi slot worker, chạy job và gửi kết quả"""
+        platform = self._platform_semaphore(self._platform_key(job))
+        slots = self._slots
+        try:
+            await platform.acquire()
+            try:
+                await slots.acquire()
+            except BaseException:
+                platform.release()
+                raise
+            try:
+                try:
+                    if job.finished:
+                        # Bị hủy khi còn đang đợi
+                        return
+                    await self._execute(job)
+                finally:
+                    # Upload không tính vào giới hạn của nền tảng
+                    platform.release()
+                await self._notify(job)
+            finally:
+                slots.release()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Media job {job.id} error: {e}", exc_info=True)
+        finally:
+            self._trim()
+
+    async def _execute(self, job: MediaJob) -> None:
+        """Chạy job trong task riêng để ``cancel`` hủy được mà không hủy ``_process``"""
+        job.task = asyncio.create_task(self._run(job), name=f"media-run-{job.id}")
+        await asyncio.gather(job.task, return_exceptions=True)
+        job.task = None
+
+    async def _run(self, job: MediaJob) -> None:
+        job.started_at = time.time()
+        if get_media_delivery().known(job.artifact_key):
+            # Đã từng upload đúng file này: notifier gửi bằng file_id, không cần tải/cắt lại
+            logger.info(f"♻️ Media job {job.id}: {job.artifact_key} đã có file_id")
+            return
+
+        def on_stage(stage: str) -> None:
+            if not job.finished:
+                job.state = stage
+
+        extractor = MultiPlatformExtractor(
+            cache=get_media_cache(), range_margin=self.range_margin, audio_format=self.audio_format
+        )
+        try:
+            success = await asyncio.wait_for(
+                extractor.aprocess(
+                    url=job.url,
+                    audio_only=job.audio_only,
+                    start_time=job.start_time,
+                    end_time=job.end_time,
+                    output_filename=job.output_filename,
+                    on_stage=on_stage,
+                ),
+                timeout=self.job_timeout,
+            )
+        except asyncio.TimeoutError:
+            self._finish(job, JobState.FAILED, f"Quá thời gian {self.job_timeout:.0f}s")
+            return
+        except asyncio.CancelledError:
+            self._finish(job, JobState.CANCELLED)
+            raise
+        except Exception as e:
+            self._finish(job, JobState.FAILED, str(e))
+            return
+
+        if not success or extractor.last_output is None:
+            self._finish(job, JobState.FAILED, "Không tải/tách được file")
+            return
+        job.output_path = extractor.last_output
+
+    async def _notify(self, job: MediaJob) -> None:
+        """Gửi kết quả vào chat; job thành công chỉ DONE sau khi upload xong"""
+        if job.state == JobState.CANCELLED:
+            return
+        if not job.finished:
+            job.state = JobState.UPLOADING
+        if self.notifier is not None:
+            try:
+                # Task riêng như ``_execute``: hủy job khi đang upload thì dừng gửi
+                job.task = asyncio.create_task(self.notifier(job), name=f"media-upload-{job.id}")
+                (result,) = await asyncio.gather(job.task, return_exceptions=True)
+                job.task = None
+                if job.state == JobState.CANCELLED:
+                    logger.info(f"🛑 Media job {job.id} cancelled khi đang upload")
+                    return
+                if isinstance(result, BaseException):
+                    raise result
+            except StaleFileIdError:
+                # Job đã bỏ qua bước tải vì có file_id, nhưng file_id hết hiệu lực
+                # (entry đã bị xóa): tải/cắt lại rồi gửi như job bình thường.
+                # Vẫn giữ slot worker, chỉ đợi lại slot nền tảng
+                logger.warning(f"⚠️ Media job {job.id}: file_id của {job.artifact_key} hết hiệu lực, tải lại")
+                job.state = JobState.QUEUED
+                async with self._platform_semaphore(self._platform_key(job)):
+                    if job.finished:
+                        return
+                    await self._execute(job)
+                await self._notify(job)
+                return
+            except Exception as e:
+                logger.error(f"❌ Không gửi được kết quả job {job.id}: {e}")
+                if not job.finished:
+                    self._finish(job, JobState.FAILED, f"Upload lỗi: {e}")
+                    return
+        if not job.finished:
+            self._finish(job, JobState.DONE)
+        logger.info(f"🏁 Media job {job.id} {job.state}")
+
+    def stats(self) -> dict:
+        states: dict[str, int] = {}
+        for job in self._jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "queued": self._waiting(),
+            "workers": self.num_workers,
+            "states": states,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+
+# ==========================
+# TELEGRAM NOTIFIER
+# ==========================
+def telegram_notifier(bot) -> Notifier:
+    """Notifier gửi file kết quả (hoặc lỗi) vào chat của job, qua file_id nếu đã upload trước đó"""
+
+    async def notify(job: MediaJob) -> None:
+        if job.chat_id is None:
+            return
+        if job.state == JobState.FAILED:
+            await bot.send_message(chat_id=job.chat_id, text=f"❌ Job {job.id} thất bại: {job.error}\n{job.url}")
+            return
+
+        name = job.output_path.name if job.output_path else job.url
+        await get_media_delivery().deliver(
+            bot,
+            job.chat_id,
+            job.artifact_key,
+            job.output_path,
+            audio=job.audio_only,
+            caption=f"✅ Job {job.id}: {name}",
+        )
+
+    return notify
+
+
+@lru_cache()
+def get_job_manager() -> MediaJobManager:
+    """Job manager dùng chung, tạo theo config"""
+    from config.config import get_settings
+
+    settings = get_settings()
+    return MediaJobManager(
+        workers=settings.media_job_workers,
+        queue_size=settings.media_job_queue_size,
+        platform_limits=settings.media_platform_limits,
+        default_platform_limit=settings.media_platform_default_limit,
+        job_timeout=settings.media_job_timeout,
+        range_margin=settings.media_range_margin_seconds if settings.media_range_fetch else None,
+        audio_format=settings.media_audio_format,
+    )
@@ -0,0 +1,105 @@
+"""
+Cheap pre-filter for webhook payloads, runs before any Update object is built.
+"""
+import logging
+import re
+from typing import Iterable, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Các loại update có object con chứa "chat"
+CHAT_UPDATE_FIELDS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "business_message",
+    "edited_business_message",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+    "message_reaction",
+    "message_reaction_count",
+    "chat_boost",
+    "removed_chat_boost",
+)
+
+# Tìm mọi "chat":{"id":N trên raw bytes, không cần decode JSON.
+# Key "sender_chat"/"forward_from_chat" không khớp vì cần dấu " ngay trước chat.
+_CHAT_ID_RE = re.compile(rb'"chat"\s*:\s*\{\s*"id"\s*:\s*(-?\d+)')
+
+
+def extract_chat_id(data: dict) -> Optional[int]:
+    """Lấy chat id từ mọi loại update, None nếu update không gắn với chat"""
+    for field in CHAT_UPDATE_FIELDS:
+        obj = data.get(field)
+        if obj:
+            chat = obj.get("chat")
+            return chat.get("id") if chat else None
+
+    callback_query = data.get("callback_query")
+    if callback_query:
+        message = callback_query.get("message")
+        if message and message.get("chat"):
+            return message["chat"].get("id")
+
+    return None
+
+
+class WebhookPrefilter:
+    """Lọc payload không được phép trước khi gọi ``Update.de_json``.
+
+    Đường reject rẻ nhất: nếu mọi chat id tìm thấy trong raw body đều không có
+    trong allow-list thì bỏ luôn mà không decode JSON. Chỉ khi có chat id hợp
+    lệ (hoặc không tìm thấy) mới decode đầy đủ để kiểm tra chính xác.
+    """
+
+    def __init__(self, allowed_chat_ids: Iterable[int]):
+        self.allowed_chat_ids = frozenset(allowed_chat_ids)
+        self.accepted = 0
+        self.rejected_fast = 0
+        self.rejected_unauthorized = 0
+        self.rejected_no_chat = 0
+        self.invalid = 0
+
+    def check(self, body: bytes) -> Optional[dict]:
+        """Trả về payload đã decode nếu được phép, None nếu bị loại"""
+        allowed = self.allowed_chat_ids
+        ids = _CHAT_ID_RE.findall(body)
+        if ids and not any(int(chat_id) in allowed for chat_id in ids):
+            self.rejected_fast += 1
+            return None
+
+        try:
+            # orjson.JSONDecodeError là subclass của ValueError
+            data = orjson.loads(body)
+        except ValueError:
+            self.invalid += 1
+            return None
+
+        if not isinstance(data, dict) or "update_id" not in data:
+            self.invalid += 1
+            return None
+
+        chat_id = extract_chat_id(data)
+        if chat_id is None:
+            self.rejected_no_chat += 1
+            return None
+        if chat_id not in allowed:
+            self.rejected_unauthorized += 1
+            logger.info(f"📨 Received update from unauthorized chat: {chat_id}")
+            return None
+
+        self.accepted += 1
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "rejected_fast": self.rejected_fast,
+            "rejected_unauthorized": self.rejected_unauthorized,
+            "rejected_no_chat": self.rejected_no_chat,
+            "invalid": self.invalid,
+        }
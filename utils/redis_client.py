@@ -0,0 +1,26 @@
+"""
+Optional shared Redis client built from ``Config.redis_url``.
+"""
+import logging
+from functools import lru_cache
+
+from config.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache()
+def get_redis():
+    """Trả về client ``redis.asyncio`` dùng chung, None nếu không cấu hình hoặc thiếu thư viện"""
+    settings = get_settings()
+    if not settings.redis_url:
+        return None
+
+    try:
+        import redis.asyncio as redis
+    except ImportError:
+        logger.warning("⚠️ REDIS_URL được cấu hình nhưng chưa cài package 'redis', dùng backend local")
+        return None
+
+    logger.info("🔌 Using shared Redis backend")
+    return redis.from_url(settings.redis_url)
@@ -0,0 +1,173 @@
+"""
+Stream câu trả lời vào một tin nhắn Telegram bằng các lần edit có giới hạn tần suất.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn độ dài text của một tin nhắn Telegram
+TELEGRAM_MAX_LENGTH = 4096
+STREAMING_SUFFIX = " ▌"
+
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_LENGTH) -> list[str]:
+    """Cắt text thành các phần <= limit, ưu tiên cắt ở xuống dòng"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= limit // 2:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+
+def _retry_seconds(error: RetryAfter) -> float:
+    delay = error.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+
+class StreamStats:
+    """Thống kê streaming dùng chung cho mọi chat"""
+
+    def __init__(self):
+        self.streams = 0
+        self.edits = 0
+        self.coalesced = 0
+        self.retry_after = 0
+        self.failed_edits = 0
+        self._ttft_ms: deque[float] = deque(maxlen=1024)
+
+    def record_ttft(self, ms: float) -> None:
+        self._ttft_ms.append(ms)
+
+    def stats(self) -> dict:
+        ttft = sorted(self._ttft_ms)
+
+        def pct(p: float) -> float:
+            return round(ttft[min(len(ttft) - 1, int(len(ttft) * p))], 1) if ttft else 0.0
+
+        return {
+            "streams": self.streams,
+            "edits": self.edits,
+            "coalesced_updates": self.coalesced,
+            "retry_after": self.retry_after,
+            "failed_edits": self.failed_edits,
+            "ttft_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": round(ttft[-1], 1) if ttft else 0.0},
+        }
+
+
+stream_stats = StreamStats()
+
+
+class TelegramStreamEditor:
+    """Edit dần một tin nhắn theo text đang được sinh ra.
+
+    - ``update`` chỉ ghi nhận text mới nhất; tối đa một lần edit mỗi
+      ``min_interval`` giây, các update ở giữa được gộp lại
+    - ``finish`` luôn edit ra câu trả lời cuối cùng (chờ hết RetryAfter),
+      phần vượt 4096 ký tự được gửi thành tin nhắn mới
+    - TTFT tính từ lúc tạo editor tới lần edit đầu tiên có nội dung
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        reply: Callable[[str], Awaitable[Message]],
+        min_interval: float = 1.5,
+        started_at: Optional[float] = None,
+    ):
+        self.message = message
+        self.reply = reply
+        self.min_interval = min_interval
+        self.started_at = started_at or time.perf_counter()
+        self._pending: Optional[str] = None
+        self._shown = ""
+        self._last_edit = 0.0
+        self._flusher: Optional[asyncio.Task] = None
+        self._first_visible = False
+        stream_stats.streams += 1
+
+    def update(self, text: str) -> None:
+        """Ghi nhận text hiện tại, lên lịch edit nếu chưa có"""
+        if not text.strip():
+            return
+        if self._pending is not None:
+            stream_stats.coalesced += 1
+        self._pending = text
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        delay = self._last_edit + self.min_interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        text, self._pending = self._pending, None
+        if text is None:
+            return
+
+        if len(text) + len(STREAMING_SUFFIX) > TELEGRAM_MAX_LENGTH:
+            text = text[:TELEGRAM_MAX_LENGTH - len(STREAMING_SUFFIX) - 1] + "…"
+        try:
+            await self._edit(text + STREAMING_SUFFIX)
+        except RetryAfter as e:
+            stream_stats.retry_after += 1
+            # Lùi lần edit kế tiếp, finish vẫn sẽ edit bản cuối
+            self._last_edit = time.perf_counter() + _retry_seconds(e)
+        except Exception as e:
+            stream_stats.failed_edits += 1
+            logger.warning(f"⚠️ Stream edit failed: {e}")
+
+        # Text mới tới trong lúc đang edit
+        if self._pending is not None:
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _edit(self, text: str) -> None:
+        if text == self._shown:
+            return
+        try:
+            await self.message.edit_text(text)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        self._shown = text
+        self._last_edit = time.perf_counter()
+        stream_stats.edits += 1
+        if not self._first_visible:
+            self._first_visible = True
+            stream_stats.record_ttft((self._last_edit - self.started_at) * 1000)
+
+    async def finish(self, text: str) -> None:
+        """Edit ra câu trả lời cuối, đảm bảo luôn được gửi"""
+        self._pending = None
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+
+        first, *rest = split_message(text or "❌ Không có response từ agent")
+        for attempt in range(3):
+            try:
+                await self._edit(first)
+                break
+            except RetryAfter as e:
+                stream_stats.retry_after += 1
+                await asyncio.sleep(_retry_seconds(e))
+            except Exception as e:
+                # Nếu edit thất bại (tin nhắn quá cũ), gửi tin nhắn mới
+                stream_stats.failed_edits += 1
+                logger.warning(f"Failed to edit message, sending new one: {e}")
+                await self.reply(first)
+                break
+        else:
+            await self.reply(first)
+
+        for part in rest:
+            await self.reply(part)
@@ -0,0 +1,38 @@
+"""
+Cheap token estimation used for prompt budgeting.
+"""
+import json
+from typing import Any
+
+# Gemini trung bình ~4 ký tự/token với tiếng Anh, tiếng Việt có dấu tốn hơn
+CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token của một đoạn text"""
+    if not text:
+        return 0
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def content_text(content: Any) -> str:
+    """Ghép content của message (str hoặc list các part) thành text"""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+
+def estimate_message_tokens(message) -> int:
+    """Ước lượng số token của một message, tính cả tool calls"""
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(content_text(message.content))
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        tokens += estimate_tokens(json.dumps([call.get("args", {}) for call in tool_calls], ensure_ascii=False))
+    return tokens
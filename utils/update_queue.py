@@ -0,0 +1,132 @@
+"""
+Bounded update queue for fast-ack webhook ingestion.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+if TYPE_CHECKING:
+    from utils.dispatcher import ChatDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueue:
+    """Hàng đợi update có giới hạn, webhook chỉ việc đẩy vào rồi trả 200 ngay.
+
+    Một pool worker chạy nền sẽ rút update ra và gọi ``handler``. Nếu có
+    ``downstream`` (dispatcher theo chat), worker chỉ chuyển update sang mailbox
+    nên depth, dropped và wait trong ``stats()`` được gộp với số liệu của
+    dispatcher: update chờ trong mailbox vẫn tính là đang chờ.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        maxsize: int = 256,
+        workers: int = 4,
+        downstream: Optional["ChatDispatcher"] = None,
+    ):
+        self.handler = handler
+        self.downstream = downstream
+        self.maxsize = maxsize
+        self.num_workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+
+        # Metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._wait_times: deque[float] = deque(maxlen=1024)
+
+    async def start(self) -> None:
+        """Khởi động worker pool"""
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"update-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        logger.info(f"🚚 Update queue started: size={self.maxsize}, workers={self.num_workers}")
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Chờ xử lý nốt các update đang đợi rồi dừng worker"""
+        if self._queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Update queue drain timed out, {self._queue.qsize()} update(s) bị bỏ")
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("🛑 Update queue stopped")
+
+    def put_nowait(self, update: Any) -> bool:
+        """Đẩy update vào queue, trả về False nếu queue đầy (update bị drop)"""
+        if self._queue is None:
+            raise RuntimeError("Update queue chưa được khởi động")
+
+        try:
+            self._queue.put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            enqueued_at, update = await self._queue.get()
+            try:
+                if self.downstream is not None:
+                    # Dispatcher tự đo wait tới lúc handler chạy thật
+                    await self.downstream.dispatch(update, enqueued_at=enqueued_at)
+                else:
+                    self._wait_times.append(time.monotonic() - enqueued_at)
+                    await self.handler(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Worker {worker_id} failed to process update: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        """Snapshot các chỉ số của queue (gộp cả mailbox nếu có downstream)"""
+        depth = self._queue.qsize() if self._queue else 0
+        dropped = self.dropped
+        failed = self.failed
+        wait_times = self._wait_times
+        if self.downstream is not None:
+            downstream = self.downstream.stats()
+            depth += downstream["pending"]
+            dropped += downstream["dropped"]
+            failed += downstream["failed"]
+            wait_times = self.downstream.wait_times
+        waits = sorted(wait_times)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+        return {
+            "depth": depth,
+            "maxsize": self.maxsize,
+            "workers": self.num_workers,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": dropped,
+            "failed": failed,
+            "wait_ms_p50": round(percentile(0.50) * 1000, 2),
+            "wait_ms_p95": round(percentile(0.95) * 1000, 2),
+            "wait_ms_max": round((waits[-1] if waits else 0.0) * 1000, 2),
+        }
@@ -3,17 +3,37 @@ import sys
 import subprocess
 import tempfile
 import shutil
+import errno
+import uuid
 from pathlib import Path
 import argparse
 import re
-from typing import Optional, Tuple, Dict, List
+from typing import Callable, Optional, Tuple, Dict, List
 from urllib.parse import urlparse
-from pytubefix import YouTube
+from pytubefix import Stream, YouTube
+import asyncio
+from utils.async_exec import CancelToken, run_blocking, run_process
+from utils.ffmpeg_engine import AUDIO_FORMATS, STREAM_CHUNK_BYTES, OutputSpec, get_ffmpeg_engine
+from utils.media_cache import FORMAT_AUDIO, FORMAT_VIDEO, MediaCache, canonical_media_id
+
+# Thư mục làm việc ẩn trong output_dir, cùng filesystem nên finalize chỉ là rename
+WORK_DIR_NAME = ".work"
 
 class MultiPlatformExtractor:
-    def __init__(self):
+    def __init__(self, cache: Optional[MediaCache] = None, range_margin: Optional[float] = None,
+                 audio_format: str = "mp3"):
         self.temp_dir = None
+        # Định dạng file audio output: mp3, m4a hoặc opus
+        self.audio_format = audio_format
+        # File nguồn đã tải được giữ lại để lần sau tách đoạn/audio không phải tải lại
+        self.cache = cache
+        # Entry cache mà lượt process hiện tại đang dùng, trả lại khi xong
+        self._cache_pins: list[tuple[str, str, str]] = []
+        # Khi tách đoạn: chỉ tải [start - margin, end + margin] thay vì cả video (None = tắt)
+        self.range_margin = range_margin
         self.output_dir = Path("videos")
+        # File kết quả của lượt process gần nhất
+        self.last_output: Optional[Path] = None
         self.output_dir.mkdir(exist_ok=True)
         
         # Danh sách các nền tảng được hỗ trợ
@@ -82,60 +102,102 @@ class MultiPlatformExtractor:
         else:
             raise ValueError(f"Format thời gian không hợp lệ: {time_str}")
     
-    def download_youtube_with_pytubefix(self, url: str, audio_only: bool = False) -> Optional[str]:
+    def _ensure_temp_dir(self) -> str:
+        """Thư mục làm việc của lượt process, nằm trong ``output_dir/.work`` (cùng filesystem
+        với output) để đưa file ra output chỉ là rename"""
+        if not self.temp_dir:
+            work_root = self.output_dir / WORK_DIR_NAME
+            work_root.mkdir(parents=True, exist_ok=True)
+            self.temp_dir = tempfile.mkdtemp(dir=work_root)
+        return self.temp_dir
+    
+    def finalize(self, source: Path, output_path: Path, keep_source: bool = False) -> None:
+        """Đưa file vào output một cách nguyên tử, file dở không bao giờ xuất hiện trong output_dir.
+        
+        - Cùng filesystem: ``os.replace`` (không keep_source) hoặc hard link (keep_source), không copy byte nào
+        - Khác filesystem: copy ra file tạm trong ``.work`` rồi mới ``os.replace`` sang tên thật
+        """
+        if not keep_source:
+            try:
+                os.replace(source, output_path)
+                return
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+        
+        work_root = self.output_dir / WORK_DIR_NAME
+        work_root.mkdir(parents=True, exist_ok=True)
+        staging = work_root / f"{uuid.uuid4().hex}.part"
+        try:
+            try:
+                # File trong media cache: link thay vì copy (cache xóa file của nó không ảnh hưởng output)
+                os.link(source, staging)
+            except OSError:
+                shutil.copy2(source, staging)
+            os.replace(staging, output_path)
+        finally:
+            staging.unlink(missing_ok=True)
+        if not keep_source:
+            os.remove(source)
+    
+    def _pytubefix_stream(self, url: str, audio_only: bool, token: CancelToken) -> Tuple[str, Optional[Stream]]:
+        """Phần blocking của pytubefix, chạy trong executor. Trả về (tiêu đề, stream cần tải)"""
+        # Callback tiến độ là điểm dừng duy nhất khi bị hủy giữa chừng
+        yt = YouTube(
+            url,
+            use_oauth=False,
+            allow_oauth_cache=False,
+            on_progress_callback=lambda *_: token.raise_if_cancelled(),
+        )
+        
+        print(f"📺 Tiêu đề: {yt.title}")
+        print(f"⏱️ Thời lượng: {yt.length} giây")
+        
+        if audio_only:
+            stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
+            if not stream:
+                print("❌ Không tìm thấy stream audio")
+                return yt.title, None
+        else:
+            stream = yt.streams.get_highest_resolution()
+        
+        token.raise_if_cancelled()
+        return yt.title, stream
+    
+    async def download_youtube_with_pytubefix(self, url: str, audio_only: bool = False) -> Optional[str]:
         """Tải YouTube video/audio bằng pytubefix"""
         try:
             print(f"📥 Đang tải từ YouTube bằng pytubefix: {url}")
             
             # Tạo thư mục tạm
-            self.temp_dir = tempfile.mkdtemp()
-            
-            # Tạo YouTube object
-            yt = YouTube(url, use_oauth=False, allow_oauth_cache=False)
+            self._ensure_temp_dir()
             
-            print(f"📺 Tiêu đề: {yt.title}")
-            print(f"⏱️ Thời lượng: {yt.length} giây")
+            # pytubefix là thư viện blocking → chạy trong executor có giới hạn
+            token = CancelToken()
+            title, stream = await run_blocking(self._pytubefix_stream, url, audio_only, token, token=token)
+            if not stream:
+                return None
             
+            downloaded_file = None
             if audio_only:
-                # Tải audio
-                print("🎵 Đang tải audio...")
-                audio_stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
-                if not audio_stream:
-                    print("❌ Không tìm thấy stream audio")
-                    return None
-                    
-                downloaded_file = audio_stream.download(output_path=self.temp_dir)
-                
-                # Chuyển đổi sang MP3 nếu cần
-                if not downloaded_file.endswith('.mp3'):
-                    try:
-                        print("fhasdofj")
-                        # Sử dụng ffmpeg để convert sang mp3
-                        output_file = os.path.join(f"{yt.title}.wav")
-                        output_file = re.sub(r'[<>:"/\\|?*]', '_', output_file)
-                        
-                        cmd = [
-                            'ffmpeg', '-i', downloaded_file,
-                            '-acodec', 'pcm_s16le',  # codec chuẩn của wav
-                            '-ar', '24000',          # (tùy chọn) đặt sample rate
-                            '-ac', '1',              # (tùy chọn) mono
-                            '-y', output_file
-                        ]
-                        subprocess.run(cmd, capture_output=True, check=True)
-                        
-                        # Xóa file gốc và sử dụng file mp3
-                        os.remove(downloaded_file)
-                        downloaded_file = output_file
-                        
-                    except (subprocess.CalledProcessError, FileNotFoundError):
-                        print("⚠️ Không thể convert sang MP3, giữ nguyên định dạng gốc")
-                
-            else:
-                # Tải video
-                print("🎬 Đang tải video...")
-                
-                video_stream = yt.streams.get_highest_resolution()
-                downloaded_file = video_stream.download(output_path=self.temp_dir)
+                # Pipe từng chunk vào ffmpeg: chỉ ghi file audio đã nén, không có file gốc/WAV trung gian
+                extension = AUDIO_FORMATS[self.audio_format][0]
+                safe_title = re.sub(r'[<>:"/\\|?*]', '_', title)
+                output_file = Path(self.temp_dir) / f"{safe_title}{extension}"
+                print(f"🎵 Đang tải và encode audio sang {self.audio_format}...")
+                try:
+                    await get_ffmpeg_engine().encode_audio_stream(
+                        stream.iter_chunks(STREAM_CHUNK_BYTES), output_file, self.audio_format, token
+                    )
+                    downloaded_file = str(output_file)
+                except Exception as e:
+                    # Lỗi ffmpeg hoặc lỗi đọc stream (HTTP, mạng): engine đã kill ffmpeg và
+                    # xóa file dở, tải lại bằng stream.download() bên dưới
+                    print(f"⚠️ Không encode được audio ({e}), giữ nguyên định dạng gốc")
+            
+            if not downloaded_file:
+                print("🎵 Đang tải audio..." if audio_only else "🎬 Đang tải video...")
+                downloaded_file = await run_blocking(stream.download, output_path=self.temp_dir, token=token)
             
             if downloaded_file and os.path.exists(downloaded_file):
                 file_size = Path(downloaded_file).stat().st_size / (1024 * 1024)
@@ -150,7 +212,7 @@ class MultiPlatformExtractor:
             print(f"❌ Lỗi khi tải từ YouTube: {e}")
             return None
     
-    def download_with_ytdlp(self, url: str, audio_only: bool = False) -> Optional[str]:
+    async def download_with_ytdlp(self, url: str, audio_only: bool = False) -> Optional[str]:
         """Tải video/audio từ các nền tảng khác bằng yt-dlp"""
         try:
             # Xác định nền tảng
@@ -163,7 +225,7 @@ class MultiPlatformExtractor:
             print(f"📥 Đang tải {mode} từ {platform} bằng yt-dlp: {url}")
             
             # Tạo thư mục tạm
-            self.temp_dir = tempfile.mkdtemp()
+            self._ensure_temp_dir()
             
             # Lệnh yt-dlp cơ bản
             cmd = [
@@ -176,7 +238,7 @@ class MultiPlatformExtractor:
             if audio_only:
                 cmd.extend([
                     '--extract-audio',
-                    '--audio-format', 'mp3',
+                    '--audio-format', self.audio_format,
                     '--audio-quality', '0'  # Chất lượng cao nhất
                 ])
             else:
@@ -196,8 +258,8 @@ class MultiPlatformExtractor:
             if audio_only:
                 cmd.append(url)
                 print("⏳ Đang tải...")
-                subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-                downloaded_files = list(Path(self.temp_dir).glob('*.mp3'))
+                await run_process(cmd)
+                downloaded_files = list(Path(self.temp_dir).glob(f'*{AUDIO_FORMATS[self.audio_format][0]}'))
                 if not downloaded_files:
                     downloaded_files = [f for f in Path(self.temp_dir).iterdir()
                                         if f.is_file() and not f.name.endswith('.part')]
@@ -214,14 +276,7 @@ class MultiPlatformExtractor:
                 attempt_cmd = cmd + fmt_args + [url]
                 print(f"⏳ Đang tải (chiến lược: {label})...")
                 try:
-                    subprocess.run(
-                        attempt_cmd,
-                        capture_output=True,
-                        text=True,
-                        check=True,
-                        encoding='utf-8',
-                        errors='ignore'
-                    )
+                    await run_process(attempt_cmd)
                     # Tìm file đã tải theo pattern
                     downloaded_files = list(Path(self.temp_dir).glob(pattern)) if pattern != '*' else \
                         [f for f in Path(self.temp_dir).iterdir() if f.is_file() and not f.name.endswith('.part')]
@@ -248,23 +303,209 @@ class MultiPlatformExtractor:
             print(f"❌ Lỗi không xác định: {e}")
             return None
     
-    def download_video(self, url: str, audio_only: bool = False) -> Optional[str]:
+    async def download_video(self, url: str, audio_only: bool = False) -> Optional[str]:
         """Tải video MP4 hoặc audio MP3 từ nhiều nền tảng"""
         # Kiểm tra nếu là YouTube thì dùng pytubefix, còn lại dùng yt-dlp
         if self.is_youtube_url(url):
-            return self.download_youtube_with_pytubefix(url, audio_only)
+            return await self.download_youtube_with_pytubefix(url, audio_only)
+        else:
+            return await self.download_with_ytdlp(url, audio_only)
+    
+    async def derive_audio(self, video_file: str) -> Optional[str]:
+        """Tách audio từ file video đã có, không cần tải lại"""
+        self._ensure_temp_dir()
+        output_file = os.path.join(self.temp_dir, f"{Path(video_file).stem}{AUDIO_FORMATS[self.audio_format][0]}")
+        try:
+            print("🎵 Đang tách audio từ video trong cache...")
+            produced = await get_ffmpeg_engine().run(
+                video_file, [OutputSpec(Path(output_file), "audio", audio_format=self.audio_format)]
+            )
+            return output_file if produced else None
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            print(f"⚠️ Không tách được audio từ video cache: {e}")
+            return None
+    
+    async def _store_in_cache(self, platform: str, video_id: str, fmt: str, downloaded_file: str) -> str:
+        """Đưa file vào cache, trả về đường dẫn mới (hoặc file cũ nếu không cache được)"""
+        try:
+            cached = await run_blocking(self.cache.put, platform, video_id, fmt, downloaded_file, pin=True)
+        except OSError as e:
+            print(f"⚠️ Không lưu được vào media cache: {e}")
+            return downloaded_file
+        if not cached:
+            return downloaded_file
+        self._cache_pins.append((platform, video_id, fmt))
+        return str(cached.path)
+    
+    def _get_cached(self, platform: str, video_id: str, fmt: str):
+        """``cache.get`` có pin: job khác không evict được file này tới khi lượt process xong"""
+        cached = self.cache.get(platform, video_id, fmt, pin=True)
+        if cached:
+            self._cache_pins.append((platform, video_id, fmt))
+        return cached
+    
+    def release_cache_pins(self):
+        """Trả lại các entry cache đã pin trong lượt process"""
+        while self._cache_pins:
+            self.cache.unpin(*self._cache_pins.pop())
+    
+    async def fetch_source(self, url: str, audio_only: bool = False) -> Optional[str]:
+        """Lấy file nguồn: ưu tiên media cache, thiếu thì tải rồi đưa vào cache.
+        
+        Video nguồn có sẵn trong cache phục vụ luôn yêu cầu audio (tách tại chỗ).
+        """
+        media_id = canonical_media_id(url) if self.cache else None
+        if media_id is None:
+            return await self.download_video(url, audio_only)
+        
+        platform, video_id = media_id
+        fmt = FORMAT_AUDIO if audio_only else FORMAT_VIDEO
+        # Hai job cùng một video: job sau đợi rồi dùng file job trước vừa cache
+        async with self.cache.lock(platform, video_id):
+            cached = self._get_cached(platform, video_id, fmt)
+            if cached:
+                print(f"💽 Dùng file trong cache: {cached.path.name}")
+                return str(cached.path)
+            
+            if audio_only:
+                cached_video = self._get_cached(platform, video_id, FORMAT_VIDEO)
+                if cached_video:
+                    audio_file = await self.derive_audio(str(cached_video.path))
+                    if audio_file:
+                        return await self._store_in_cache(platform, video_id, FORMAT_AUDIO, audio_file)
+            
+            downloaded_file = await self.download_video(url, audio_only)
+            if not downloaded_file:
+                return None
+            return await self._store_in_cache(platform, video_id, fmt, downloaded_file)
+    
+    def has_cached_source(self, url: str, audio_only: bool = False) -> bool:
+        """File nguồn (hoặc video để tách audio) đã có trong media cache"""
+        media_id = canonical_media_id(url) if self.cache else None
+        if media_id is None:
+            return False
+        formats = [FORMAT_AUDIO, FORMAT_VIDEO] if audio_only else [FORMAT_VIDEO]
+        return any(self.cache.peek(*media_id, fmt) for fmt in formats)
+    
+    def _resolve_stream_url(self, url: str, audio_only: bool) -> Tuple[str, str]:
+        """(tiêu đề, URL stream trực tiếp) của video YouTube, blocking"""
+        yt = YouTube(url, use_oauth=False, allow_oauth_cache=False)
+        if audio_only:
+            stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
+        else:
+            stream = yt.streams.get_highest_resolution()
+        if not stream:
+            raise ValueError("Không tìm thấy stream phù hợp")
+        return yt.title, stream.url
+    
+    async def fetch_range_from_stream_url(self, stream_url: str, title: str, fetch_start: float,
+                                          fetch_end: float, audio_only: bool = False) -> Optional[Tuple[str, float]]:
+        """ffmpeg seek phía input trên URL stream: chỉ đọc các byte quanh đoạn cần qua HTTP range.
+        
+        Trả về (file, giây của video gốc ứng với đầu file), None nếu không ra file.
+        """
+        self._ensure_temp_dir()
+        safe_title = re.sub(r'[<>:"/\\|?*]', '_', title)
+        extension = AUDIO_FORMATS[self.audio_format][0] if audio_only else '.mp4'
+        output_file = os.path.join(self.temp_dir, f"{safe_title}{extension}")
+        
+        if audio_only:
+            # Có decode nên seek chính xác: file bắt đầu đúng tại fetch_start.
+            # Chỉ encode vài phút audio nên rẻ, và cho ra cùng định dạng với đường tải toàn bộ
+            cmd = [
+                'ffmpeg',
+                '-ss', f"{fetch_start:g}",  # Seek trước -i: nhảy thẳng tới vị trí, không đọc phần đầu
+                '-i', stream_url,
+                '-t', f"{fetch_end - fetch_start:g}",
+                '-vn', *AUDIO_FORMATS[self.audio_format][1],
+            ]
+        else:
+            # Stream copy bắt đầu từ keyframe trước fetch_start (sớm hơn tối đa một GOP):
+            # giữ timestamp gốc (-copyts, nên dùng -to) để đọc lại vị trí thật của đầu file
+            cmd = [
+                'ffmpeg',
+                '-ss', f"{fetch_start:g}",
+                '-copyts',
+                '-i', stream_url,
+                '-to', f"{fetch_end:g}",
+                '-c', 'copy',
+            ]
+        cmd.extend(['-y', output_file])
+        
+        await run_process(cmd)
+        if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+            return None
+        if audio_only:
+            return output_file, fetch_start
+        return output_file, await get_ffmpeg_engine().start_time(output_file)
+    
+    async def fetch_range_with_ytdlp(self, url: str, fetch_start: float, fetch_end: float,
+                                     audio_only: bool = False) -> Optional[str]:
+        """yt-dlp --download-sections: chỉ tải đoạn [fetch_start, fetch_end].
+        
+        Video dùng ``--force-keyframes-at-cuts`` (chỉ encode lại quanh điểm cắt) để file
+        bắt đầu đúng tại fetch_start thay vì ở keyframe trước đó.
+        """
+        self._ensure_temp_dir()
+        cmd = [
+            'yt-dlp',
+            '--output', os.path.join(self.temp_dir, '%(title)s.%(ext)s'),
+            '--no-playlist',
+            '--download-sections', f"*{fetch_start:g}-{fetch_end:g}",
+        ]
+        if audio_only:
+            cmd.extend(['--extract-audio', '--audio-format', self.audio_format, '--audio-quality', '0'])
         else:
-            return self.download_with_ytdlp(url, audio_only)
+            cmd.extend(['--format', 'bestvideo[height<=720][ext=mp4][vcodec^=avc]+bestaudio/best[ext=mp4]/best',
+                        '--force-keyframes-at-cuts'])
+        cmd.append(url)
+        
+        await run_process(cmd)
+        downloaded_files = [f for f in Path(self.temp_dir).iterdir()
+                            if f.is_file() and not f.name.endswith('.part')]
+        return str(downloaded_files[0]) if downloaded_files else None
     
-    def extract_segment(self, input_file: str, start_time: int, 
+    async def fetch_range(self, url: str, audio_only: bool, start: int, end: int) -> Optional[Tuple[str, float]]:
+        """Chỉ tải phần quanh [start, end], thêm ``range_margin`` giây mỗi bên để có keyframe.
+        
+        Trả về (file, giây của video gốc ứng với đầu file), None nếu thất bại để tải toàn bộ.
+        Margin chỉ là khoảng dư: vị trí thật của đầu file được đọc lại chứ không giả định bằng fetch_start.
+        """
+        fetch_start = max(0.0, start - self.range_margin)
+        fetch_end = end + self.range_margin
+        print(f"📥 Chỉ tải đoạn {fetch_start:g}s-{fetch_end:g}s: {url}")
+        try:
+            if self.is_youtube_url(url):
+                title, stream_url = await run_blocking(self._resolve_stream_url, url, audio_only)
+                fetched = await self.fetch_range_from_stream_url(stream_url, title, fetch_start, fetch_end, audio_only)
+            else:
+                output_file = await self.fetch_range_with_ytdlp(url, fetch_start, fetch_end, audio_only)
+                fetched = (output_file, fetch_start) if output_file else None
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️ Tải theo đoạn thất bại: {e.stderr[-300:] if e.stderr else e}")
+            return None
+        except Exception as e:
+            print(f"⚠️ Tải theo đoạn thất bại: {e}")
+            return None
+        
+        if not fetched:
+            return None
+        output_file, offset = fetched
+        if offset > start:
+            print(f"⚠️ Đoạn tải về bắt đầu ở {offset:.2f}s, sau điểm cần cắt {start}s")
+            return None
+        file_size = Path(output_file).stat().st_size / (1024 * 1024)
+        print(f"✅ Tải đoạn thành công: {os.path.basename(output_file)} ({file_size:.2f} MB, bắt đầu ở {offset:.2f}s)")
+        return output_file, offset
+    
+    async def extract_segment(self, input_file: str, start_time: int, 
                        end_time: int, output_filename: str, is_audio: bool = False) -> bool:
         """Tách đoạn video hoặc audio từ file gốc"""
+        content_type = "audio" if is_audio else "video"
         try:
-            # Kiểm tra ffmpeg
-            try:
-                subprocess.run(['ffmpeg', '-version'], 
-                             capture_output=True, check=True)
-            except (subprocess.CalledProcessError, FileNotFoundError):
+            engine = get_ffmpeg_engine()
+            # Kết quả probe được cache, không chạy ffmpeg -version mỗi lần
+            if not (await engine.probe()).available:
                 print("❌ ffmpeg không được cài đặt. Không thể tách đoạn.")
                 print("Vui lòng cài đặt ffmpeg: https://ffmpeg.org/download.html")
                 return False
@@ -272,26 +513,20 @@ class MultiPlatformExtractor:
             duration = end_time - start_time
             
             # Đường dẫn file output
-            extension = '.mp3' if is_audio else '.mp4'
+            extension = AUDIO_FORMATS[self.audio_format][0] if is_audio else '.mp4'
             output_path = self.output_dir / f"{output_filename}{extension}"
             
-            content_type = "audio" if is_audio else "video"
             print(f"✂️ Đang tách {content_type} từ {start_time}s đến {end_time}s...")
             
-            # Lệnh ffmpeg để tách
-            cmd = [
-                'ffmpeg',
-                '-i', input_file,
-                '-ss', str(start_time),
-                '-t', str(duration),
-                '-c', 'copy',  # Copy không re-encode để giữ chất lượng
-                '-y',  # Overwrite file nếu tồn tại
-                str(output_path)
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
+            # Seek phía input theo keyframe index: không phải đọc từ đầu file
+            # ffmpeg ghi vào thư mục làm việc, xong mới rename sang output
+            work_output = Path(self._ensure_temp_dir()) / f"cut_{output_path.name}"
+            result = await engine.cut(input_file, start_time, end_time, work_output,
+                                      audio=is_audio, audio_format=self.audio_format)
             
-            if output_path.exists():
+            if result:
+                await run_blocking(self.finalize, work_output, output_path)
+                self.last_output = output_path
                 file_size = output_path.stat().st_size / (1024 * 1024)  # MB
                 print(f"✅ Tách thành công: {output_path}")
                 print(f"📁 Kích thước file: {file_size:.2f} MB")
@@ -311,7 +546,7 @@ class MultiPlatformExtractor:
             return False
     
     def move_to_output(self, source_file: str, output_filename: Optional[str] = None) -> bool:
-        """Di chuyển file từ temp sang thư mục output"""
+        """Di chuyển file từ temp sang thư mục output (file ngoài thư mục tạm, vd: media cache, được giữ lại)"""
         try:
             source_path = Path(source_file)
             
@@ -322,10 +557,12 @@ class MultiPlatformExtractor:
             else:
                 output_path = self.output_dir / source_path.name
             
-            # Copy file sang thư mục output
-            shutil.copy2(source_file, output_path)
+            # File tải về trong thư mục tạm thì rename, file của media cache thì link
+            owned = bool(self.temp_dir) and source_path.resolve().is_relative_to(Path(self.temp_dir).resolve())
+            self.finalize(source_path, output_path, keep_source=not owned)
             
             if output_path.exists():
+                self.last_output = output_path
                 file_size = output_path.stat().st_size / (1024 * 1024)  # MB
                 print(f"📁 File đã lưu: {output_path}")
                 print(f"📏 Kích thước: {file_size:.2f} MB")
@@ -340,12 +577,21 @@ class MultiPlatformExtractor:
     def cleanup(self):
         """Dọn dẹp file tạm"""
         if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+            # Khi bị hủy, thread pytubefix có thể vẫn đang ghi dở file
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
             print("🧹 Đã dọn dẹp file tạm")
     
     def process(self, url: str, audio_only: bool = False, start_time: Optional[str] = None, 
                end_time: Optional[str] = None, output_filename: Optional[str] = None) -> bool:
-        """Xử lý toàn bộ quy trình"""
+        """Bản sync của ``aprocess`` cho CLI, không gọi từ trong event loop"""
+        return asyncio.run(self.aprocess(url, audio_only, start_time, end_time, output_filename))
+    
+    async def aprocess(self, url: str, audio_only: bool = False, start_time: Optional[str] = None, 
+                       end_time: Optional[str] = None, output_filename: Optional[str] = None,
+                       on_stage: Optional[Callable[[str], None]] = None) -> bool:
+        """Xử lý toàn bộ quy trình. ``on_stage`` nhận "downloading"/"cutting" khi chuyển bước"""
+        notify = on_stage or (lambda stage: None)
+        self.last_output = None
         try:
             # Kiểm tra logic thời gian
             has_time_params = start_time is not None and end_time is not None
@@ -367,7 +613,20 @@ class MultiPlatformExtractor:
                 print(f"✂️ Chế độ tách đoạn {content_type} được kích hoạt")
             
             # Tải video/audio
-            downloaded_file = self.download_video(url, audio_only)
+            notify("downloading")
+            downloaded_file, offset = None, 0
+            # Tách đoạn mà chưa có nguồn trong cache → chỉ tải đoạn cần
+            if has_time_params and self.range_margin is not None and not self.has_cached_source(url, audio_only):
+                ranged = await self.fetch_range(url, audio_only, start_seconds, end_seconds)
+                if ranged:
+                    downloaded_file, offset = ranged
+                else:
+                    # Bỏ file dở của lần tải theo đoạn, lần tải toàn bộ tạo thư mục tạm mới
+                    self.cleanup()
+                    self.temp_dir = None
+                    print("↩️ Chuyển sang tải toàn bộ video")
+            if not downloaded_file:
+                downloaded_file = await self.fetch_source(url, audio_only)
             if not downloaded_file:
                 return False
             
@@ -381,16 +640,20 @@ class MultiPlatformExtractor:
                     # Loại bỏ ký tự không hợp lệ trong tên file
                     output_filename = re.sub(r'[<>:"/\\|?*]', '_', output_filename)
                 
-                success = self.extract_segment(
-                    downloaded_file, start_seconds, end_seconds, output_filename, audio_only
+                notify("cutting")
+                # File tải theo đoạn bắt đầu tại ``offset`` của video gốc (keyframe, không phải fetch_start)
+                success = await self.extract_segment(
+                    downloaded_file, round(start_seconds - offset, 3), round(end_seconds - offset, 3), output_filename, audio_only
                 )
             else:
                 # Lưu toàn bộ file
-                success = self.move_to_output(downloaded_file, output_filename)
+                # Thường chỉ là rename/link, nhưng khác filesystem thì phải copy (IO blocking)
+                success = await run_blocking(self.move_to_output, downloaded_file, output_filename)
             
             return success
             
         finally:
+            self.release_cache_pins()
             self.cleanup()
 
 def main():
@@ -433,6 +696,10 @@ Các nền tảng được hỗ trợ:
     parser.add_argument('-s', '--start', help='Thời gian bắt đầu để tách audio (MM:SS, HH:MM:SS, hoặc số giây)')
     parser.add_argument('-e', '--end', help='Thời gian kết thúc để tách audio (MM:SS, HH:MM:SS, hoặc số giây)')
     parser.add_argument('-o', '--output', help='Tên file output (không cần extension)')
+    parser.add_argument('--audio-format', choices=sorted(AUDIO_FORMATS), default='mp3',
+                       help='Định dạng audio output (mặc định mp3)')
+    parser.add_argument('--range-margin', type=float,
+                       help='Khi tách đoạn: chỉ tải đoạn cần thêm số giây này mỗi bên (mặc định tải toàn bộ)')
     
     args = parser.parse_args()
     
@@ -442,7 +709,7 @@ Các nền tảng được hỗ trợ:
         sys.exit(1)
     
     # Tạo extractor và xử lý
-    extractor = MultiPlatformExtractor()
+    extractor = MultiPlatformExtractor(range_margin=args.range_margin, audio_format=args.audio_format)
     success = extractor.process(
         args.url, 
         args.audio_only, 